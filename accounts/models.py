@@ -52,7 +52,7 @@ class AuditLog(models.Model):
         indexes = [
             models.Index(fields=['user']),
             models.Index(fields=['action']),
-            models.Index(fields=['timestamp']),
+            models.Index(fields=['timestamp', 'id']),
             models.Index(fields=['model_name']),
         ]
     
@@ -3,6 +3,8 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, permissions, viewsets
 from rest_framework_simplejwt.views import TokenObtainPairView
 
+from amrs.pagination import KeysetPagination
+
 from .models import AuditLog, UserRole
 from .permissions import IsAdmin, IsAdminOrSelf
 from .serializers import (
@@ -50,6 +52,8 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = AuditLog.objects.all().order_by('-timestamp')
     serializer_class = AuditLogSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['user', 'action', 'model_name']
+    ordering = ['-timestamp', '-id']
     search_fields = ['object_repr', 'details']
\ No newline at end of file
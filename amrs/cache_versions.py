@@ -0,0 +1,34 @@
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'version:{}'
+
+
+def _seed():
+    # Seeding from the clock keeps versions increasing even if the cache is flushed
+    return time.time_ns() // 1000
+
+
+def get_version(name):
+    """
+    Returns the current value of a named version counter in the shared cache
+    """
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """
+    Increments a named version counter, invalidating every cache entry keyed by it
+    """
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), timeout=None)
+        return cache.incr(key)
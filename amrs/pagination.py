@@ -0,0 +1,256 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import and_, or_
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+COUNT_MODES = ('exact', 'estimate')
+
+
+def estimate_count(queryset):
+    """
+    Returns the planner's row estimate for a queryset on PostgreSQL, which
+    costs no table scan; other databases fall back to an exact count
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates on a stable ordering such as (date, id) by filtering on the
+    last row seen instead of counting and skipping rows, so every page costs
+    the same however deep it is. Cursors are opaque and carry the ordering
+    they were issued for; filters in the query string are kept in the links.
+
+    The ordering comes from the view's OrderingFilter when the request sets
+    one, otherwise from the view's ordering attribute; the primary key is
+    always added as a tie-breaker. Totals are only computed on request with
+    ?count=exact or ?count=estimate.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    max_page_size = 1000
+    ordering = ('-id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 20
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        self.annotations = queryset.query.annotations
+        self.keys = self.get_ordering(request, queryset, view)
+
+        self.count = None
+        self.count_estimated = False
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode in COUNT_MODES:
+            self.count_estimated = count_mode == 'estimate'
+            self.count = estimate_count(queryset) if self.count_estimated else queryset.count()
+
+        position, reverse = self.decode_cursor(request)
+        ordering = [(name, not descending if reverse else descending) for name, descending in self.keys]
+
+        queryset = queryset.order_by(*[
+            F(name).desc(nulls_first=True) if descending else F(name).asc(nulls_last=True)
+            for name, descending in ordering
+        ])
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.first = self.position_of(results[0]) if results else None
+        self.last = self.position_of(results[-1]) if results else None
+        # Paging back past the first row leaves nothing to anchor on: the next page is the first
+        self.restart = reverse and not results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Returns [(field path, descending)] ending with the primary key
+        """
+        ordering = None
+        if view is not None and any(
+            issubclass(backend, OrderingFilter) for backend in getattr(view, 'filter_backends', [])
+        ):
+            ordering = OrderingFilter().get_ordering(request, queryset, view)
+        if not ordering:
+            ordering = getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            ordering = [ordering]
+
+        fields = []
+        for name in ordering:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name == 'pk':
+                name = queryset.model._meta.pk.name
+            if name not in [field for field, _ in fields]:
+                fields.append((name, descending))
+        pk = queryset.model._meta.pk.name
+        if pk not in [field for field, _ in fields]:
+            fields.append((pk, fields[-1][1] if fields else True))
+        return fields
+
+    def after(self, ordering, position):
+        """
+        Rows that sort after position: NULLs sort last ascending and first
+        descending, matching the order_by above
+        """
+        conditions = []
+        for index, (name, descending) in enumerate(ordering):
+            value = position[index]
+            if value is None:
+                beyond = Q(**{f'{name}__isnull': False}) if descending else Q(pk__in=[])
+            elif descending:
+                beyond = Q(**{f'{name}__lt': value})
+            else:
+                beyond = Q(**{f'{name}__gt': value}) | Q(**{f'{name}__isnull': True})
+            equal = [
+                Q(**{f'{field}__isnull': True}) if position[i] is None else Q(**{field: position[i]})
+                for i, (field, _) in enumerate(ordering[:index])
+            ]
+            conditions.append(reduce(and_, equal + [beyond]))
+        return reduce(or_, conditions)
+
+    def position_of(self, instance):
+        """
+        Values of the ordering fields for a row, which may be a values() dict
+        """
+        if isinstance(instance, dict):
+            return [instance[name] for name, _ in self.keys]
+        values = []
+        for name, _ in self.keys:
+            value = instance
+            for part in name.split('__'):
+                value = getattr(value, part, None)
+                if value is None:
+                    break
+            values.append(getattr(value, 'pk', value))
+        return values
+
+    def resolve_field(self, model, name):
+        if name in self.annotations:
+            return self.annotations[name].output_field
+        field = None
+        for part in name.split('__'):
+            field = model._meta.get_field(part)
+            if field.is_relation:
+                model = field.related_model
+        if field.is_relation:
+            field = field.target_field
+        return field
+
+    def encode_cursor(self, position, reverse=False):
+        values = [
+            value if value is None or isinstance(value, (int, str)) else
+            value.isoformat() if hasattr(value, 'isoformat') else str(value)
+            for value in position
+        ]
+        data = {'o': [f"{'-' if descending else ''}{name}" for name, descending in self.keys], 'p': values}
+        if reverse:
+            data['r'] = 1
+        token = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        """
+        Returns (position, reverse) of the request's cursor, or (None, False) on the first page
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            ordering = [f"{'-' if descending else ''}{name}" for name, descending in self.keys]
+            if data['o'] != ordering or len(data['p']) != len(ordering):
+                raise ValueError("Cursor ordering does not match the request")
+            position = [
+                None if value is None else self.resolve_field(self.model, name).to_python(value)
+                for (name, _), value in zip(self.keys, data['p'])
+            ]
+        except (TypeError, ValueError, KeyError, binascii.Error, FieldDoesNotExist, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(data.get('r'))
+
+    def get_next_link(self):
+        if self.restart:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first is None:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.first, reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+        if self.count is not None:
+            response['count'] = self.count
+            response['count_estimated'] = self.count_estimated
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer', 'description': 'Only with ?count=exact or ?count=estimate'},
+                'count_estimated': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'description': 'The pagination cursor value.', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': 'Number of results to return per page.', 'schema': {'type': 'integer'}},
+            {'name': self.count_query_param, 'required': False, 'in': 'query',
+             'description': 'Include a total: exact, or estimate from the query planner.',
+             'schema': {'type': 'string', 'enum': list(COUNT_MODES)}},
+        ]
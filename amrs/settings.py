@@ -57,6 +57,7 @@ INSTALLED_APPS = [
     'journal',
     'invoices',
     'reports',
+    'integrations',
 ]
 
 MIDDLEWARE = [
@@ -148,6 +149,39 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache settings
+# Redis is shared by all web and worker processes; the local-memory fallback
+# is per process and only suitable for single-process development
+if os.environ.get('REDIS_HOST'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': f"redis://{os.environ['REDIS_HOST']}:{os.environ.get('REDIS_PORT', '6379')}/1",
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a synchronously generated report stays cached for a given ledger version
+REPORT_CACHE_TIMEOUT = int(os.environ.get('REPORT_CACHE_TIMEOUT', 3600))
+
+# Seconds an identical report request may wait on a generation already in flight. Workers
+# renew the in-flight marker after each step, so it only expires when a generation is lost.
+REPORT_COALESCE_TIMEOUT = int(os.environ.get('REPORT_COALESCE_TIMEOUT', 900))
+
+# Seconds a cached chart of accounts structure lives for a given chart version
+COA_CACHE_TIMEOUT = int(os.environ.get('COA_CACHE_TIMEOUT', 3600))
+
+# Seconds between checks of the shared chart version by each process's account registry
+COA_REGISTRY_CHECK_INTERVAL = float(os.environ.get('COA_REGISTRY_CHECK_INTERVAL', 2))
+
+# Rows per page when large report sections are stored and served in chunks
+REPORT_CHUNK_ROWS = int(os.environ.get('REPORT_CHUNK_ROWS', 500))
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -195,3 +229,55 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-outbox-events': {
+        'task': 'integrations.tasks.dispatch_outbox_events',
+        'schedule': float(os.environ.get('OUTBOX_DISPATCH_INTERVAL', 10)),
+    },
+    'fail-stale-reports': {
+        'task': 'reports.tasks.fail_stale_reports',
+        'schedule': float(os.environ.get('REPORT_STALE_CHECK_INTERVAL', 60)),
+    },
+}
+
+# Accounts per subtask when trial balances and general ledgers are generated in parallel
+REPORT_PARTITION_SIZE = int(os.environ.get('REPORT_PARTITION_SIZE', 500))
+
+# Directory holding the columnar copy of the posted ledger used by backend='columnar' reports
+COLUMNAR_LEDGER_PATH = os.environ.get('COLUMNAR_LEDGER_PATH', os.path.join(BASE_DIR, 'var', 'columnar'))
+
+# Cash flow statement: inclusive (first, last) account code ranges of the cash accounts,
+# and of the counter-accounts classified as investing or financing (everything else is operating).
+# Range ends are code prefixes: a code is in range when its leading characters are, so
+# subaccounts such as 1019-01 or 19995 fall in the ranges ending at 1019 and 1999.
+CASH_FLOW_CASH_ACCOUNTS = [('1010', '1019')]
+CASH_FLOW_ACTIVITIES = {
+    'investing': [('1500', '1999')],
+    'financing': [('2500', '2999'), ('3000', '3999')],
+}
+
+# Document number series created on first use; gapless series lock their row for every number
+NUMBER_SEQUENCES = {
+    'journal': {'prefix': 'JE', 'gapless': False},
+    'invoice': {'prefix': 'INV', 'gapless': False},
+}
+
+# The covering journal indexes fall back to plain indexes on databases without INCLUDE support
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+# Account that receives the year's net income when a fiscal year is closed
+RETAINED_EARNINGS_ACCOUNT_CODE = os.environ.get('RETAINED_EARNINGS_ACCOUNT_CODE', '3200')
+
+# Outbox dispatch: events per batch, delivery attempts before an event is marked failed,
+# backoff in seconds (doubling up to the maximum), webhook timeout and dispatcher lock lifetime.
+# The lock is renewed before each event and a batch stops after half its lifetime, so only the
+# deliveries of a single event (webhook timeout per endpoint) need to fit within it.
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 500))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 10))
+OUTBOX_RETRY_DELAY = int(os.environ.get('OUTBOX_RETRY_DELAY', 30))
+OUTBOX_MAX_RETRY_DELAY = int(os.environ.get('OUTBOX_MAX_RETRY_DELAY', 3600))
+OUTBOX_WEBHOOK_TIMEOUT = int(os.environ.get('OUTBOX_WEBHOOK_TIMEOUT', 10))
+OUTBOX_LOCK_TIMEOUT = int(os.environ.get('OUTBOX_LOCK_TIMEOUT', 300))
+
+# Largest page of the change feed
+OUTBOX_FEED_MAX_LIMIT = 1000
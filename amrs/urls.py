@@ -40,6 +40,7 @@ urlpatterns = [
     path('api/journal/', include('journal.urls')),
     path('api/invoices/', include('invoices.urls')),
     path('api/reports/', include('reports.urls')),
+    path('api/integrations/', include('integrations.urls')),
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
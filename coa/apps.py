@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class CoaConfig(AppConfig):
+    name = 'coa'
+
+    def ready(self):
+        # Connect the receivers that invalidate cached chart structures
+        from . import signals  # noqa: F401
@@ -0,0 +1,15 @@
+import django_filters
+
+from .models import Account
+from .tree import subtree_filter
+
+
+class AccountFilter(django_filters.FilterSet):
+    under = django_filters.NumberFilter(method='filter_under', label="Account id whose subtree to include")
+
+    class Meta:
+        model = Account
+        fields = ['account_type', 'is_active', 'parent_account', 'depth']
+
+    def filter_under(self, queryset, name, value):
+        return queryset.filter(subtree_filter(int(value)))
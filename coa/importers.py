@@ -0,0 +1,339 @@
+import csv
+import json
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Account, AccountType
+from .registry import registry
+from .tree import bump_coa_version, rebuild_paths
+
+IMPORT_FORMATS = ('ndjson', 'json', 'csv')
+
+# Columns of a chart import and export; parents and types are referred to by code
+ACCOUNT_FIELDS = ['code', 'name', 'account_type', 'parent_code', 'is_active', 'description']
+
+# Row errors returned in full; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+# Fields an import may change on an existing account
+UPDATE_FIELDS = ['name', 'account_type', 'parent_account', 'is_active', 'description', 'updated_at']
+
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'f', 'no', 'n')
+
+
+class AccountImportResult:
+    """
+    Counts and per-row errors of a chart of accounts import
+    """
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, rows, code, messages):
+        self.error_count += len(messages)
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'rows': rows, 'code': code, 'errors': messages})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def read_rows(stream, import_format):
+    """
+    Yields (row number, row) from NDJSON, a JSON array or CSV with a header line
+    """
+    if import_format == 'csv':
+        yield from enumerate(csv.DictReader(stream), start=2)
+        return
+    if import_format == 'json':
+        try:
+            rows = json.loads(''.join(stream))
+        except ValueError as e:
+            yield 1, {'_error': f"Invalid JSON: {e}"}
+            return
+        if isinstance(rows, dict):
+            rows = rows.get('accounts')
+        if not isinstance(rows, list):
+            yield 1, {'_error': "Expected a list of accounts"}
+            return
+        numbered = enumerate(rows, start=1)
+    else:
+        numbered = (
+            (number, text) for number, text in enumerate(stream, start=1) if text.strip()
+        )
+    for number, row in numbered:
+        if isinstance(row, str):
+            try:
+                row = json.loads(row)
+            except ValueError as e:
+                row = {'_error': f"Invalid JSON: {e}"}
+        if not isinstance(row, dict):
+            row = {'_error': "Each account must be a JSON object"}
+        yield number, row
+
+
+def clean_text(value):
+    return '' if value is None else str(value).strip()
+
+
+def parse_bool(value, errors):
+    """
+    Parses an is_active value, returning None when it is left empty
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    errors.append(f"is_active '{value}' must be true or false")
+    return None
+
+
+def find_cycles(parents, codes):
+    """
+    Returns each parent cycle reachable from codes once, as a list of codes
+    starting and ending with the same account
+    """
+    cycles = []
+    done = set()
+    for code in codes:
+        trail = []
+        position = {}
+        while code is not None and code not in done and code not in position:
+            position[code] = len(trail)
+            trail.append(code)
+            code = parents.get(code)
+        if code in position:
+            cycle = trail[position[code]:]
+            cycles.append(cycle + [cycle[0]])
+        done.update(trail)
+    return cycles
+
+
+def topological_order(parents):
+    """
+    Orders codes so that every parent comes before its children. Returns
+    the order and the codes left out, which are in or below a parent cycle.
+    """
+    children = defaultdict(list)
+    for code, parent in parents.items():
+        children[parent].append(code)
+    order = []
+    queue = list(children[None])
+    while queue:
+        code = queue.pop()
+        order.append(code)
+        queue.extend(children[code])
+    return order, set(parents) - set(order)
+
+
+class AccountImporter:
+    """
+    Creates and updates accounts in bulk, matched by code. Parents are given
+    by code and may be defined anywhere in the file: the resulting hierarchy
+    is checked for unknown parents and cycles in memory, and the import is
+    written in one transaction only when every row is valid.
+    """
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.result = AccountImportResult()
+
+    def run(self, stream, import_format='ndjson'):
+        """
+        Import every account read from a text stream and return the AccountImportResult
+        """
+        rows = {}
+        for number, row in read_rows(stream, import_format):
+            self.result.rows += 1
+            code = clean_text(row.get('code'))
+            if '_error' in row:
+                self.result.add_error([number], code or None, [row['_error']])
+            elif not code:
+                self.result.add_error([number], None, ["code is required"])
+            elif code in rows:
+                rows[code]['rows'].append(number)
+            else:
+                rows[code] = {'rows': [number], 'data': row}
+
+        for code, item in rows.items():
+            if len(item['rows']) > 1:
+                self.result.add_error(item['rows'], code, ["Account code appears more than once"])
+        if self.result.error_count:
+            return self.result
+
+        existing = {
+            account.code: account
+            for account in Account.objects.only(
+                'id', 'code', 'name', 'account_type_id', 'parent_account_id', 'is_active', 'description'
+            )
+        }
+        types = dict(AccountType.objects.values_list('code', 'id'))
+        codes_by_id = {account.id: code for code, account in existing.items()}
+
+        current = {code: codes_by_id.get(account.parent_account_id) for code, account in existing.items()}
+        # The parent of every account once the import is applied
+        parents = dict(current)
+        changes = {}
+        for code, item in rows.items():
+            errors = []
+            change = self.clean_row(code, item['data'], existing.get(code), types, errors)
+            if errors:
+                self.result.add_error(item['rows'], code, errors)
+                continue
+            changes[code] = change
+            parents[code] = change['parent_code'] if 'parent_code' in change else current.get(code)
+
+        for code in changes:
+            parent = parents[code]
+            if parent is not None and parent not in parents and parent not in rows:
+                self.result.add_error(rows[code]['rows'], code, [f"Unknown parent account code '{parent}'"])
+        if self.result.error_count:
+            return self.result
+
+        order, unreachable = topological_order(parents)
+        if unreachable:
+            for cycle in find_cycles(parents, sorted(unreachable)):
+                # The stored chart has no cycles, so one of the imported rows closes it
+                code = next(code for code in cycle if code in rows)
+                self.result.add_error(rows[code]['rows'], code, [f"Parent cycle: {' > '.join(cycle)}"])
+            return self.result
+
+        self.write(order, changes, existing, current, parents)
+        return self.result
+
+    def clean_row(self, code, row, account, types, errors):
+        """
+        Returns the validated values of a row. Columns left out of a row, or
+        empty in CSV, keep the account's current value; parent_code is only
+        cleared by an explicit empty value.
+        """
+        change = {}
+        if len(code) > 20:
+            errors.append("code must be at most 20 characters")
+
+        name = clean_text(row.get('name'))
+        if name:
+            if len(name) > 100:
+                errors.append("name must be at most 100 characters")
+            change['name'] = name
+        elif account is None:
+            errors.append("name is required")
+
+        type_code = clean_text(row.get('account_type'))
+        if type_code:
+            if type_code not in types:
+                errors.append(f"Unknown account type '{type_code}'")
+            change['account_type_id'] = types.get(type_code)
+        elif account is None:
+            errors.append("account_type is required")
+
+        if 'parent_code' in row:
+            parent = clean_text(row['parent_code']) or None
+            if parent == code:
+                errors.append("An account cannot be its own parent")
+            change['parent_code'] = parent
+
+        is_active = parse_bool(row.get('is_active'), errors)
+        if is_active is not None:
+            change['is_active'] = is_active
+
+        if row.get('description') not in (None, ''):
+            change['description'] = str(row['description'])
+        return change
+
+    def write(self, order, changes, existing, current, parents):
+        """
+        Insert new accounts level by level, so that parents get their ids
+        before their children, then update changed accounts and rebuild paths
+        """
+        now = timezone.now()
+        ids = {code: account.id for code, account in existing.items()}
+        levels = defaultdict(list)
+        depth = {}
+        for code in order:
+            depth[code] = depth[parents[code]] + 1 if parents[code] is not None else 1
+            if code in changes and code not in existing:
+                levels[depth[code]].append(code)
+
+        updates = []
+        for code, change in changes.items():
+            account = existing.get(code)
+            if account is None:
+                continue
+            values = {field: value for field, value in change.items() if field != 'parent_code'}
+            if parents[code] == current[code] and all(
+                getattr(account, field) == value for field, value in values.items()
+            ):
+                self.result.unchanged += 1
+                continue
+            for field, value in values.items():
+                setattr(account, field, value)
+            account.updated_at = now
+            updates.append(account)
+
+        self.result.created = sum(len(codes) for codes in levels.values())
+        self.result.updated = len(updates)
+        if self.dry_run or not (self.result.created or updates):
+            return
+
+        with transaction.atomic():
+            for level in sorted(levels):
+                accounts = []
+                for code in levels[level]:
+                    change = changes[code]
+                    accounts.append(Account(
+                        code=code,
+                        name=change['name'],
+                        account_type_id=change['account_type_id'],
+                        parent_account_id=ids[parents[code]] if parents[code] is not None else None,
+                        is_active=change.get('is_active', True),
+                        description=change.get('description', ''),
+                    ))
+                for account in Account.objects.bulk_create(accounts, batch_size=1000):
+                    ids[account.code] = account.id
+
+            # Parents created above only have ids now
+            for account in updates:
+                parent = parents[account.code]
+                account.parent_account_id = ids[parent] if parent is not None else None
+            Account.objects.bulk_update(updates, UPDATE_FIELDS, batch_size=1000)
+
+            # Bulk writes bypass Account.save and the coa signals
+            rebuild_paths()
+            bump_coa_version()
+            transaction.on_commit(registry.invalidate)
+
+
+def export_rows(accounts):
+    """
+    Yields accounts as import rows, parents and types by code
+    """
+    for row in accounts.values(
+        'code', 'name', 'account_type__code', 'parent_account__code', 'is_active', 'description'
+    ).iterator(chunk_size=2000):
+        yield {
+            'code': row['code'],
+            'name': row['name'],
+            'account_type': row['account_type__code'],
+            'parent_code': row['parent_account__code'] or '',
+            'is_active': row['is_active'],
+            'description': row['description'],
+        }
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from coa.importers import IMPORT_FORMATS, AccountImporter
+
+
+class Command(BaseCommand):
+    help = "Create or update accounts by code from an NDJSON, JSON or CSV file with parent codes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import")
+        parser.add_argument('--format', dest='import_format', choices=IMPORT_FORMATS)
+        parser.add_argument('--dry-run', action='store_true', help="Validate and count changes without writing")
+
+    def handle(self, *args, **options):
+        import_format = options['import_format']
+        if import_format is None:
+            extension = options['path'].rsplit('.', 1)[-1].lower()
+            import_format = extension if extension in IMPORT_FORMATS else 'ndjson'
+        with open(options['path'], newline='', encoding='utf-8') as stream:
+            result = AccountImporter(options['dry_run']).run(stream, import_format)
+
+        for error in result.errors:
+            self.stderr.write(f"Rows {', '.join(map(str, error['rows']))} ({error['code']}): {'; '.join(error['errors'])}")
+        if result.error_count:
+            raise CommandError(f"{result.error_count} errors in {result.rows} rows; nothing was imported")
+
+        if options['dry_run']:
+            message = f"Dry run: {result.created} accounts to create, {result.updated} to update"
+        else:
+            message = f"Created {result.created} accounts, updated {result.updated}"
+        self.stdout.write(self.style.SUCCESS(f"{message}; {result.unchanged} unchanged"))
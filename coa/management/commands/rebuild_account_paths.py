@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from coa.tree import rebuild_paths
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized path and depth of every account from the parent links"
+
+    def handle(self, *args, **options):
+        try:
+            count = rebuild_paths()
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Updated the paths of {count} accounts"))
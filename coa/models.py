@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 
 
 class AccountType(models.Model):
@@ -23,6 +25,9 @@ class Account(models.Model):
     is_active = models.BooleanField(default=True)
     parent_account = models.ForeignKey('self', null=True, blank=True, on_delete=models.PROTECT, related_name='child_accounts')
     description = models.TextField(blank=True)
+    # Materialized path of ids from the root, e.g. "/1/5/12/"; descendants share it as a prefix
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=1, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -32,21 +37,68 @@ class Account(models.Model):
             models.Index(fields=['code']),
             models.Index(fields=['account_type']),
             models.Index(fields=['parent_account']),
+            # Prefix (LIKE 'x%') lookups; the opclass only applies on PostgreSQL
+            models.Index(fields=['path'], name='coa_account_path', opclasses=['varchar_pattern_ops']),
         ]
     
     def __str__(self):
         return f"{self.code} - {self.name}"
     
+    def save(self, *args, **kwargs):
+        """
+        Saves the account and, when it is new or moves to another parent,
+        rewrites its path and depth and those of all its descendants
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'parent_account' not in update_fields:
+            return super().save(*args, **kwargs)
+        
+        with transaction.atomic():
+            # Paths are read from the database, where moves of ancestors are already applied
+            old_path, old_depth = '', 1
+            if self.pk is not None:
+                old_path, old_depth = Account.objects.filter(pk=self.pk).values_list(
+                    'path', 'depth'
+                ).first() or ('', 1)
+            self.path, self.depth = old_path, old_depth
+            super().save(*args, **kwargs)
+            
+            parent_path, parent_depth = '/', 0
+            if self.parent_account_id is not None:
+                parent_path, parent_depth = Account.objects.filter(pk=self.parent_account_id).values_list(
+                    'path', 'depth'
+                ).get()
+                if old_path and parent_path.startswith(old_path):
+                    raise ValueError("An account cannot be moved under itself or one of its descendants")
+            path = f"{parent_path}{self.pk}/"
+            depth = parent_depth + 1
+            if path != old_path:
+                Account.objects.filter(pk=self.pk).update(path=path, depth=depth)
+                if old_path:
+                    Account.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                        path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                        depth=F('depth') + (depth - old_depth),
+                    )
+            self.path, self.depth = path, depth
+    
+    def ancestor_ids(self):
+        """Returns the ids of the account's ancestors, root first"""
+        return [int(part) for part in self.path.strip('/').split('/')[:-1]]
+    
+    def descendants(self):
+        """Returns all accounts below this one"""
+        return Account.objects.filter(path__startswith=self.path).exclude(pk=self.pk)
+    
+    def is_descendant_of(self, other):
+        return self.pk != other.pk and self.path.startswith(other.path)
+    
     @property
     def full_name(self):
         """Returns the full hierarchical name of the account"""
-        if self.parent_account:
-            return f"{self.parent_account.full_name} > {self.name}"
-        return self.name
+        names = dict(Account.objects.filter(id__in=self.ancestor_ids()).values_list('id', 'name'))
+        return ' > '.join([names[ancestor_id] for ancestor_id in self.ancestor_ids() if ancestor_id in names] + [self.name])
     
     @property
     def level(self):
         """Returns the level of the account in the hierarchy"""
-        if self.parent_account is None:
-            return 1
-        return self.parent_account.level + 1
\ No newline at end of file
+        return self.depth
\ No newline at end of file
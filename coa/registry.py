@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Account
+from .tree import coa_version
+
+AccountInfo = namedtuple(
+    'AccountInfo',
+    ['id', 'code', 'name', 'type_id', 'type_code', 'type_name', 'is_active', 'parent_id', 'path', 'depth'],
+)
+
+
+class AccountRegistry:
+    """
+    Process-local, read-only snapshot of the chart of accounts for hot paths
+    that resolve account codes, types and active flags. It is loaded in one
+    query and reloaded when the coa version in the shared cache moves on, so
+    every web and worker process follows changes made by any other. The
+    version is checked at most every COA_REGISTRY_CHECK_INTERVAL seconds;
+    changes saved in this process are seen at once.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked_at = 0.0
+        self.by_id = {}
+        self.by_code = {}
+
+    def invalidate(self):
+        """
+        Check the shared version on the next lookup
+        """
+        self.checked_at = 0.0
+
+    def refresh(self):
+        if self.version is not None and time.monotonic() - self.checked_at < settings.COA_REGISTRY_CHECK_INTERVAL:
+            return
+        with self.lock:
+            version = coa_version()
+            if version != self.version:
+                self.load(version)
+            self.checked_at = time.monotonic()
+
+    def load(self, version):
+        rows = Account.objects.values_list(
+            'id', 'code', 'name', 'account_type_id', 'account_type__code', 'account_type__name',
+            'is_active', 'parent_account_id', 'path', 'depth',
+        )
+        by_id = {row[0]: AccountInfo(*row) for row in rows}
+        # Swap whole dicts so readers in other threads never see a partial load
+        self.by_id = by_id
+        self.by_code = {info.code: info for info in by_id.values()}
+        self.version = version
+
+    def get(self, account_id):
+        """
+        Returns the AccountInfo of an account id, or None
+        """
+        self.refresh()
+        return self.by_id.get(account_id)
+
+    def get_by_code(self, code):
+        """
+        Returns the AccountInfo of an account code, or None
+        """
+        self.refresh()
+        return self.by_code.get(code)
+
+    def get_many(self, account_ids):
+        """
+        Returns {account id: AccountInfo} for the ids that exist
+        """
+        self.refresh()
+        by_id = self.by_id
+        return {account_id: by_id[account_id] for account_id in account_ids if account_id in by_id}
+
+    def instance(self, account_id):
+        """
+        Returns an unqueried Account instance built from the snapshot, or
+        None; enough to assign to foreign keys and read its own columns
+        """
+        info = self.get(account_id)
+        if info is None:
+            return None
+        account = Account(
+            id=info.id, code=info.code, name=info.name, account_type_id=info.type_id,
+            is_active=info.is_active, parent_account_id=info.parent_id, path=info.path, depth=info.depth,
+        )
+        account._state.adding = False
+        account._state.db = DEFAULT_DB_ALIAS
+        return account
+
+
+# Shared by every thread of this process
+registry = AccountRegistry()
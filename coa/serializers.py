@@ -18,9 +18,9 @@ class AccountSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'code', 'name', 'account_type', 'account_type_display',
             'is_active', 'parent_account', 'parent_account_display', 
-            'description', 'created_at', 'updated_at'
+            'description', 'path', 'depth', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['path', 'depth', 'created_at', 'updated_at']
 
     def validate(self, data):
         # Prevent circular references in parent-child relationship
@@ -30,26 +30,8 @@ class AccountSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("An account cannot be its own parent.")
             
             # Check if the parent is one of the descendants
-            if self.instance:
-                current_parent = parent
-                while current_parent:
-                    if current_parent.id == self.instance.id:
-                        raise serializers.ValidationError("Cannot create circular hierarchy.")
-                    current_parent = current_parent.parent_account
-                    
+            if self.instance and parent.is_descendant_of(self.instance):
+                raise serializers.ValidationError("Cannot create circular hierarchy.")
+            
         return data
 
-
-class AccountTreeSerializer(serializers.ModelSerializer):
-    """Serializer for displaying account hierarchy"""
-    children = serializers.SerializerMethodField()
-    account_type_display = serializers.StringRelatedField(source='account_type')
-
-    class Meta:
-        model = Account
-        fields = ['id', 'code', 'name', 'account_type', 'account_type_display', 'is_active', 'children']
-
-    def get_children(self, obj):
-        # Only get direct children accounts
-        children = Account.objects.filter(parent_account=obj)
-        return AccountTreeSerializer(children, many=True).data
\ No newline at end of file
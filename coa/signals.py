@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Account, AccountType
+from .registry import registry
+from .tree import bump_coa_version
+
+
+@receiver([post_save, post_delete], sender=Account)
+@receiver([post_save, post_delete], sender=AccountType)
+def invalidate_chart(sender, **kwargs):
+    bump_coa_version()
+    # Skip this process's throttle so its own change is visible at once
+    transaction.on_commit(registry.invalidate)
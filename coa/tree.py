@@ -0,0 +1,105 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, Subquery
+
+from amrs.cache_versions import bump_version, get_version
+
+from .models import Account
+
+COA_VERSION = 'coa'
+
+TREE_CACHE_KEY = 'coa:tree:{}'
+
+
+def coa_version():
+    """
+    Returns the chart of accounts version, which increases every time an account changes
+    """
+    return get_version(COA_VERSION)
+
+
+def bump_coa_version():
+    """
+    Marks every cached chart of accounts structure as stale once the current transaction commits
+    """
+    transaction.on_commit(lambda: bump_version(COA_VERSION))
+
+
+def build_tree():
+    """
+    Loads the whole chart in one query and assembles it into nested nodes,
+    roots and children ordered by code
+    """
+    rows = Account.objects.order_by('code').values(
+        'id', 'code', 'name', 'account_type_id', 'account_type__code', 'account_type__name',
+        'is_active', 'parent_account_id',
+    )
+    nodes = {}
+    children = defaultdict(list)
+    for row in rows:
+        nodes[row['id']] = {
+            'id': row['id'],
+            'code': row['code'],
+            'name': row['name'],
+            'account_type': row['account_type_id'],
+            'account_type_display': f"{row['account_type__code']} - {row['account_type__name']}",
+            'is_active': row['is_active'],
+            'children': children[row['id']],
+        }
+        children[row['parent_account_id']].append(nodes[row['id']])
+    return children[None]
+
+
+def get_account_tree(version=None):
+    """
+    Returns the nested chart of accounts, cached per chart version
+    """
+    key = TREE_CACHE_KEY.format(version or coa_version())
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_tree()
+        cache.set(key, tree, settings.COA_CACHE_TIMEOUT)
+    return tree
+
+
+def subtree_filter(account_id, field='path'):
+    """
+    Q matching an account and all its descendants by path prefix; field
+    names the path column, e.g. 'account__path' for journal lines
+    """
+    return Q(**{f'{field}__startswith': Subquery(Account.objects.filter(id=account_id).values('path')[:1])})
+
+
+def rebuild_paths():
+    """
+    Recomputes every account's path and depth from the parent links, for
+    charts loaded or changed without Account.save. Returns the number of
+    accounts updated; raises ValueError if the parent links contain a cycle.
+    """
+    accounts = {account.id: account for account in Account.objects.only('id', 'parent_account_id', 'path', 'depth')}
+    children = defaultdict(list)
+    for account in accounts.values():
+        children[account.parent_account_id].append(account)
+
+    changed = []
+    stack = [(account, '/', 1) for account in children[None]]
+    visited = 0
+    while stack:
+        account, parent_path, depth = stack.pop()
+        visited += 1
+        path = f"{parent_path}{account.id}/"
+        if (account.path, account.depth) != (path, depth):
+            account.path, account.depth = path, depth
+            changed.append(account)
+        stack.extend((child, path, depth + 1) for child in children[account.id])
+
+    if visited != len(accounts):
+        raise ValueError(f"{len(accounts) - visited} accounts are in a parent cycle and cannot be reached from a root")
+    with transaction.atomic():
+        Account.objects.bulk_update(changed, ['path', 'depth'], batch_size=1000)
+        if changed:
+            bump_coa_version()
+    return len(changed)
@@ -1,10 +1,20 @@
+import codecs
+
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, permissions, viewsets
+from rest_framework import filters, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from accounts.permissions import IsAccountant
+from reports.exports import EXPORT_CONTENT_TYPES, iter_export
+
+from .filters import AccountFilter
+from .importers import ACCOUNT_FIELDS, IMPORT_FORMATS, AccountImporter, export_rows
 from .models import Account, AccountType
-from .serializers import AccountSerializer, AccountTreeSerializer, AccountTypeSerializer
+from .serializers import AccountSerializer, AccountTypeSerializer
+from .tree import coa_version, get_account_tree
 
 
 class AccountTypeViewSet(viewsets.ModelViewSet):
@@ -24,21 +34,87 @@ class AccountViewSet(viewsets.ModelViewSet):
     """
     API endpoint for chart of accounts
     """
-    queryset = Account.objects.all()
+    queryset = Account.objects.select_related('account_type', 'parent_account')
     serializer_class = AccountSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['account_type', 'is_active', 'parent_account']
+    filterset_class = AccountFilter
     search_fields = ['code', 'name', 'description']
     ordering_fields = ['code', 'name', 'account_type__name']
     ordering = ['code']
 
     @action(detail=False, methods=['get'])
-    def hierarchy(self):
+    def hierarchy(self, request):
+        """
+        Returns accounts in hierarchical structure. The tree is built in one
+        query and cached until an account changes; clients revalidate with
+        If-None-Match and get 304 while the chart is unchanged.
+        """
+        version = coa_version()
+        etag = f'"coa-{version}"'
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(get_account_tree(version))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    @action(
+        detail=False, methods=['post'], url_path='bulk-import',
+        permission_classes=[permissions.IsAuthenticated, IsAccountant]
+    )
+    def bulk_import(self, request):
+        """
+        Create or update accounts by code from NDJSON, a JSON array or CSV,
+        sent as the request body or as a multipart upload named file.
+        Accepts input (ndjson, json or csv) and dry_run. Nothing is written
+        unless every row is valid.
+        """
+        import_format = request.query_params.get('input')
+        if import_format is None:
+            content_type = request.content_type or ''
+            import_format = 'csv' if 'csv' in content_type else 'json' if content_type.endswith('/json') else 'ndjson'
+        if import_format not in IMPORT_FORMATS:
+            return Response(
+                {'error': f"Unsupported input format '{import_format}'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if (request.content_type or '').startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+            source = upload.file
+        else:
+            source = request.stream
+            if source is None:
+                return Response({'error': 'Request body is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        result = AccountImporter(dry_run).run(codecs.iterdecode(source, 'utf-8'), import_format)
+        return Response(
+            {**result.as_dict(), 'dry_run': dry_run},
+            status=status.HTTP_400_BAD_REQUEST if result.error_count else status.HTTP_200_OK
+        )
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
         """
-        Returns accounts in hierarchical structure
+        Stream the filtered accounts as NDJSON or CSV (output) in the bulk-import format
         """
-        # Get only root accounts (those without parent)
-        root_accounts = Account.objects.filter(parent_account=None).order_by('code')
-        serializer = AccountTreeSerializer(root_accounts, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_CONTENT_TYPES:
+            return Response(
+                {'error': f"Unsupported output format '{export_format}'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rows = export_rows(self.filter_queryset(self.get_queryset()))
+        response = StreamingHttpResponse(
+            iter_export(rows, export_format, ACCOUNT_FIELDS),
+            content_type=EXPORT_CONTENT_TYPES[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="accounts.{export_format}"'
+        return response
@@ -0,0 +1 @@
+# Integrations module: outbox, webhooks and the ledger change feed
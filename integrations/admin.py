@@ -0,0 +1,24 @@
+from django.contrib import admin
+
+from .dispatch import retry_failed
+from .models import OutboxEvent, WebhookEndpoint
+
+
+@admin.register(WebhookEndpoint)
+class WebhookEndpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'url', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+    search_fields = ('name', 'url')
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'position', 'event_type', 'aggregate_id', 'status', 'attempts', 'created_at')
+    list_filter = ('status', 'aggregate_type', 'event_type')
+    search_fields = ('aggregate_id',)
+    readonly_fields = [field.name for field in OutboxEvent._meta.fields]
+    actions = ['retry_selected']
+    
+    @admin.action(description="Retry selected failed events")
+    def retry_selected(self, request, queryset):
+        self.message_user(request, f"{retry_failed(queryset)} events queued for retry")
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class IntegrationsConfig(AppConfig):
+    name = 'integrations'
+
+    def ready(self):
+        # Connect the receivers that write outbox events
+        from . import receivers  # noqa: F401
@@ -0,0 +1,197 @@
+import hashlib
+import hmac
+import json
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Q
+from django.utils import timezone
+
+from .models import OutboxEvent, WebhookEndpoint
+
+DISPATCH_LOCK_KEY = 'integrations:outbox-dispatch'
+
+
+class DispatchLock:
+    """
+    Cache lock held by one dispatcher at a time. Each holder stores its own
+    token, so a dispatcher whose lock expired and was taken over stops
+    delivering and does not release the new holder's lock.
+    """
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+
+    def acquire(self):
+        return cache.add(DISPATCH_LOCK_KEY, self.token, timeout=settings.OUTBOX_LOCK_TIMEOUT)
+
+    def extend(self):
+        """
+        Renew the lock's timeout; returns False if it is no longer ours
+        """
+        if cache.get(DISPATCH_LOCK_KEY) != self.token:
+            return False
+        return cache.touch(DISPATCH_LOCK_KEY, settings.OUTBOX_LOCK_TIMEOUT)
+
+    def release(self):
+        # Not atomic with the check, but the lock is renewed before every
+        # delivery, so it cannot expire between the two
+        if cache.get(DISPATCH_LOCK_KEY) == self.token:
+            cache.delete(DISPATCH_LOCK_KEY)
+
+
+def assign_positions(limit=10000):
+    """
+    Number committed events without a position, in id order. Only committed
+    rows are visible here and one dispatcher runs at a time, so a feed
+    consumer never sees a later position before an earlier one.
+    """
+    with transaction.atomic():
+        start = OutboxEvent.objects.aggregate(last=Max('position'))['last'] or 0
+        events = list(OutboxEvent.objects.filter(position__isnull=True).order_by('id').only('id')[:limit])
+        for offset, event in enumerate(events, start=1):
+            event.position = start + offset
+        OutboxEvent.objects.bulk_update(events, ['position'], batch_size=1000)
+    return len(events)
+
+
+def sign(secret, body):
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def deliver(endpoint, event):
+    """
+    POST an event to a webhook endpoint; raises on network errors and non-2xx responses
+    """
+    body = json.dumps(event.as_message(), cls=DjangoJSONEncoder).encode()
+    headers = {
+        'Content-Type': 'application/json',
+        'X-AMRS-Event': event.event_type,
+        'X-AMRS-Delivery': str(event.id),
+    }
+    if endpoint.secret:
+        headers['X-AMRS-Signature'] = sign(endpoint.secret, body)
+    request = urllib.request.Request(endpoint.url, data=body, headers=headers, method='POST')
+    with urllib.request.urlopen(request, timeout=settings.OUTBOX_WEBHOOK_TIMEOUT):
+        pass
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff after a failed delivery
+    """
+    return timedelta(seconds=min(settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), settings.OUTBOX_MAX_RETRY_DELAY))
+
+
+def deliver_pending(batch_size=None, lock=None):
+    """
+    Deliver a batch of pending events to the webhooks subscribed to them, in
+    id order. An event that fails, or waits for a retry, holds back the
+    later events of its aggregate; events that exhaust their attempts are
+    marked failed and keep holding them back until they are retried from
+    the admin. Delivery is at least once: X-AMRS-Delivery identifies repeats.
+
+    The batch stops early once it has run for half of OUTBOX_LOCK_TIMEOUT,
+    or when the dispatcher lock can no longer be renewed; the remaining
+    events are left for the next run.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    deadline = time.monotonic() + settings.OUTBOX_LOCK_TIMEOUT / 2
+    endpoints = list(WebhookEndpoint.objects.filter(is_active=True))
+
+    # Held events are left out before the batch is sliced, so that a backlog
+    # of them at the head of the queue cannot keep later events from a batch
+    waiting = Q(status='failed') | Q(status='pending', next_attempt_at__gt=now)
+    held_back = OutboxEvent.objects.filter(
+        waiting,
+        aggregate_type=OuterRef('aggregate_type'),
+        aggregate_id=OuterRef('aggregate_id'),
+        id__lt=OuterRef('id'),
+    )
+    ready = (
+        OutboxEvent.objects.filter(status='pending')
+        .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+        .exclude(Exists(held_back))
+        .order_by('id')
+    )
+
+    # Aggregates with an event that failed during this batch
+    blocked = set()
+    counts = {'dispatched': 0, 'failed': 0, 'held': 0}
+    changed = []
+    for event in ready[:batch_size]:
+        if time.monotonic() > deadline or (lock is not None and not lock.extend()):
+            break
+        aggregate = (event.aggregate_type, event.aggregate_id)
+        if aggregate in blocked:
+            counts['held'] += 1
+            continue
+
+        event.attempts += 1
+        try:
+            for endpoint in endpoints:
+                if endpoint.accepts(event.event_type):
+                    try:
+                        deliver(endpoint, event)
+                    except (urllib.error.URLError, OSError, ValueError) as e:
+                        raise RuntimeError(f"{endpoint.name}: {e}")
+        except RuntimeError as e:
+            event.last_error = str(e)
+            if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                event.status = 'failed'
+            else:
+                event.next_attempt_at = now + retry_delay(event.attempts)
+            blocked.add(aggregate)
+            counts['failed'] += 1
+        else:
+            event.status = 'dispatched'
+            event.dispatched_at = timezone.now()
+            event.last_error = ''
+            counts['dispatched'] += 1
+        changed.append(event)
+
+    OutboxEvent.objects.bulk_update(
+        changed, ['status', 'attempts', 'next_attempt_at', 'dispatched_at', 'last_error'], batch_size=1000
+    )
+    return counts
+
+
+def dispatch_outbox(batch_size=None):
+    """
+    Number new events and deliver a batch. Returns None if another dispatcher is running.
+    """
+    lock = DispatchLock()
+    if not lock.acquire():
+        return None
+    try:
+        positioned = assign_positions()
+        return {'positioned': positioned, **deliver_pending(batch_size, lock)}
+    finally:
+        lock.release()
+
+
+def refresh_positions():
+    """
+    Number new events unless a dispatcher is already doing it
+    """
+    lock = DispatchLock()
+    if not lock.acquire():
+        return None
+    try:
+        return assign_positions()
+    finally:
+        lock.release()
+
+
+def retry_failed(events):
+    """
+    Return failed events to the queue with a fresh set of attempts
+    """
+    return events.filter(status='failed').update(status='pending', attempts=0, next_attempt_at=None)
@@ -0,0 +1,80 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class WebhookEndpoint(models.Model):
+    """
+    A downstream system that receives outbox events by HTTP POST. An empty
+    event_types list subscribes to everything; an entry such as
+    "journal_entry" matches every event of that aggregate type.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=200, blank=True, help_text="Signs deliveries with HMAC-SHA256")
+    event_types = models.JSONField(default=list, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def accepts(self, event_type):
+        return not self.event_types or any(
+            event_type == subscribed or event_type.startswith(f"{subscribed}.")
+            for subscribed in self.event_types
+        )
+
+
+class OutboxEvent(models.Model):
+    """
+    A change to a journal entry, invoice or payment, written in the same
+    transaction as the change. The dispatcher numbers committed events with
+    position, which orders the change feed, and delivers them to webhooks in
+    order per aggregate.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('dispatched', 'Dispatched'),
+        ('failed', 'Failed'),
+    )
+
+    aggregate_type = models.CharField(max_length=50)
+    aggregate_id = models.CharField(max_length=50)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Feed order, assigned once the event is committed
+    position = models.BigIntegerField(null=True, blank=True, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # The dispatcher scans pending events in id order
+            models.Index(fields=['status', 'id'], name='outbox_status_id'),
+            models.Index(fields=['aggregate_type', 'aggregate_id'], name='outbox_aggregate'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.aggregate_id}"
+
+    def as_message(self):
+        """
+        The event as delivered to webhooks and served by the change feed
+        """
+        return {
+            'id': self.id,
+            'position': self.position,
+            'event_type': self.event_type,
+            'aggregate_type': self.aggregate_type,
+            'aggregate_id': self.aggregate_id,
+            'created_at': self.created_at,
+            'payload': self.payload,
+        }
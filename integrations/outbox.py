@@ -0,0 +1,73 @@
+from collections import defaultdict
+
+from journal.models import JournalEntry, JournalLine
+
+from .models import OutboxEvent
+
+
+def record_events(aggregate_type, change, payloads):
+    """
+    Write one outbox event per payload in the caller's transaction.
+    payloads maps aggregate ids to their JSON-serializable state.
+    """
+    OutboxEvent.objects.bulk_create(
+        [
+            OutboxEvent(
+                aggregate_type=aggregate_type,
+                aggregate_id=str(aggregate_id),
+                event_type=f"{aggregate_type}.{change}",
+                payload=payload,
+            )
+            for aggregate_id, payload in payloads.items()
+        ],
+        batch_size=1000
+    )
+
+
+def journal_entry_payloads(entry_ids):
+    """
+    Returns {entry id: entry with its lines} for a batch of entries in two queries
+    """
+    lines = defaultdict(list)
+    for line in (
+        JournalLine.objects.filter(entry_id__in=entry_ids)
+        .order_by('entry_id', 'id')
+        .values('entry_id', 'id', 'account__code', 'debit', 'credit', 'reference')
+    ):
+        lines[line['entry_id']].append({
+            'id': line['id'],
+            'account_code': line['account__code'],
+            'debit': line['debit'],
+            'credit': line['credit'],
+            'reference': line['reference'],
+        })
+
+    return {
+        entry['id']: {**entry, 'lines': lines[entry['id']]}
+        for entry in JournalEntry.objects.filter(id__in=entry_ids).order_by('id').values(
+            'id', 'entry_number', 'date', 'description', 'status', 'reversal_of_id', 'is_closing'
+        )
+    }
+
+
+def invoice_payload(invoice):
+    return {
+        'id': invoice.id,
+        'invoice_number': invoice.invoice_number,
+        'customer': invoice.customer,
+        'vendor': invoice.vendor,
+        'due_date': invoice.due_date,
+        'status': invoice.status,
+        'total': invoice.total,
+    }
+
+
+def payment_payload(payment):
+    return {
+        'id': payment.id,
+        'payment_reference': payment.payment_reference,
+        'invoice_id': payment.invoice_id,
+        'amount': payment.amount,
+        'payment_method': payment.payment_method,
+        'payment_date': payment.payment_date,
+    }
@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from invoices.models import Invoice, Payment
+from journal.models import JournalEntry
+from journal.signals import entries_changed
+
+from .outbox import invoice_payload, journal_entry_payloads, payment_payload, record_events
+
+
+@receiver(entries_changed, sender=JournalEntry)
+def record_journal_changes(sender, entry_ids, change, **kwargs):
+    record_events('journal_entry', change, journal_entry_payloads(entry_ids))
+
+
+@receiver(post_save, sender=Invoice)
+def record_invoice_saved(sender, instance, created, **kwargs):
+    record_events('invoice', 'created' if created else 'updated', {instance.id: invoice_payload(instance)})
+
+
+@receiver(post_delete, sender=Invoice)
+def record_invoice_deleted(sender, instance, **kwargs):
+    record_events('invoice', 'deleted', {instance.id: invoice_payload(instance)})
+
+
+@receiver(post_save, sender=Payment)
+def record_payment_saved(sender, instance, created, **kwargs):
+    record_events('payment', 'created' if created else 'updated', {instance.id: payment_payload(instance)})
+
+
+@receiver(post_delete, sender=Payment)
+def record_payment_deleted(sender, instance, **kwargs):
+    record_events('payment', 'deleted', {instance.id: payment_payload(instance)})
@@ -0,0 +1,22 @@
+from rest_framework import serializers
+
+from .models import OutboxEvent, WebhookEndpoint
+
+
+class WebhookEndpointSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WebhookEndpoint
+        fields = ['id', 'name', 'url', 'secret', 'event_types', 'is_active', 'created_at']
+        read_only_fields = ['created_at']
+        extra_kwargs = {'secret': {'write_only': True}}
+
+    def validate_event_types(self, value):
+        if not isinstance(value, list) or not all(isinstance(item, str) and item for item in value):
+            raise serializers.ValidationError("event_types must be a list of event type names")
+        return value
+
+
+class OutboxEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OutboxEvent
+        fields = ['id', 'position', 'event_type', 'aggregate_type', 'aggregate_id', 'created_at', 'payload']
@@ -0,0 +1,11 @@
+from celery import shared_task
+
+from .dispatch import dispatch_outbox
+
+
+@shared_task
+def dispatch_outbox_events(batch_size=None):
+    """
+    Drain a batch of the outbox; run periodically by celery beat
+    """
+    return dispatch_outbox(batch_size)
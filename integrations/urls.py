@@ -0,0 +1,12 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from .views import ChangeFeedView, WebhookEndpointViewSet
+
+router = DefaultRouter()
+router.register(r'webhooks', WebhookEndpointViewSet)
+
+urlpatterns = [
+    path('changes/', ChangeFeedView.as_view(), name='change-feed'),
+    path('', include(router.urls)),
+]
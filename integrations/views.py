@@ -0,0 +1,79 @@
+import base64
+import binascii
+
+from django.conf import settings
+from rest_framework import permissions, status, viewsets
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from accounts.permissions import IsAdmin
+
+from .dispatch import refresh_positions
+from .models import OutboxEvent, WebhookEndpoint
+from .serializers import OutboxEventSerializer, WebhookEndpointSerializer
+
+
+def encode_position(position):
+    return base64.urlsafe_b64encode(f"p{position}".encode()).decode().rstrip('=')
+
+
+def decode_position(cursor):
+    """
+    Returns the feed position of a cursor, raising ValueError if it is not one of ours
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError(cursor)
+    if not value.startswith('p'):
+        raise ValueError(cursor)
+    return int(value[1:])
+
+
+class WebhookEndpointViewSet(viewsets.ModelViewSet):
+    """
+    API endpoint for the webhooks that receive outbox events
+    """
+    queryset = WebhookEndpoint.objects.all()
+    serializer_class = WebhookEndpointSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+
+class ChangeFeedView(APIView):
+    """
+    Tails journal entry, invoice and payment changes in commit order.
+    Pass the cursor of the previous response to resume; without one the
+    feed starts at the oldest event. Accepts aggregate_type, event_type
+    and limit.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+    
+    def get(self, request):
+        cursor = request.query_params.get('cursor')
+        try:
+            after = decode_position(cursor) if cursor else 0
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 100)), settings.OUTBOX_FEED_MAX_LIMIT)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Number events committed since the dispatcher last ran
+        refresh_positions()
+        
+        events = OutboxEvent.objects.filter(position__gt=after).order_by('position')
+        for field in ('aggregate_type', 'event_type'):
+            if request.query_params.get(field):
+                events = events.filter(**{field: request.query_params[field]})
+        events = list(events[:limit + 1])
+        has_more = len(events) > limit
+        events = events[:limit]
+        
+        return Response({
+            'results': OutboxEventSerializer(events, many=True).data,
+            'cursor': encode_position(events[-1].position if events else after),
+            'has_more': has_more,
+        })
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class InvoicesConfig(AppConfig):
+    name = 'invoices'
+
+    def ready(self):
+        # Connect the receivers that invalidate cached invoice reports
+        from . import signals  # noqa: F401
@@ -20,6 +20,12 @@ class Invoice(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the invoice listing
+            models.Index(fields=['created_at', 'id']),
+        ]
+
     def __str__(self):
         return self.invoice_number
 
@@ -49,5 +55,11 @@ class Payment(models.Model):
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Payments of an invoice up to a date, summed by the aging reports
+            models.Index(fields=['invoice', 'payment_date']),
+        ]
+
     def __str__(self):
         return self.payment_reference
\ No newline at end of file
@@ -1,7 +1,13 @@
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 
+from journal.sequences import next_number
+
 from .models import Invoice, InvoiceLineItem, Payment
 
+INVOICE_NUMBER_SERIES = 'invoice'
+
 
 class InvoiceLineItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -17,14 +23,20 @@ class InvoiceSerializer(serializers.ModelSerializer):
             'total', 'created_at', 'updated_at', 'created_by', 'line_items'
         ]
         read_only_fields = ['created_at', 'updated_at', 'created_by']
+        # Allocated from the invoice number series when left out
+        extra_kwargs = {'invoice_number': {'required': False}}
 
+    @transaction.atomic
     def create(self, validated_data):
         line_items_data = validated_data.pop('line_items')
+        if not validated_data.get('invoice_number'):
+            validated_data['invoice_number'] = next_number(INVOICE_NUMBER_SERIES, timezone.localdate().year)
         invoice = Invoice.objects.create(**validated_data)
         for item_data in line_items_data:
             InvoiceLineItem.objects.create(invoice=invoice, **item_data)
         return invoice
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         line_items_data = validated_data.pop('line_items', None)
         for attr, value in validated_data.items():
@@ -43,4 +55,13 @@ class PaymentSerializer(serializers.ModelSerializer):
             'id', 'payment_reference', 'invoice', 'amount', 'payment_method',
             'payment_date', 'created_by', 'created_at'
         ]
-        read_only_fields = ['created_by', 'created_at']
\ No newline at end of file
+        read_only_fields = ['created_by', 'created_at']
+
+    # Atomic so the outbox event commits with the payment
+    @transaction.atomic
+    def create(self, validated_data):
+        return super().create(validated_data)
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        return super().update(instance, validated_data)
\ No newline at end of file
@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from amrs.cache_versions import bump_version, get_version
+
+from .models import Invoice, Payment
+
+INVOICES_VERSION = 'invoices'
+
+
+def invoices_version():
+    """
+    Returns the invoices version, which increases every time an invoice or payment changes
+    """
+    return get_version(INVOICES_VERSION)
+
+
+def bump_invoices_version():
+    """
+    Marks every result computed from invoices as stale once the current transaction commits
+    """
+    transaction.on_commit(lambda: bump_version(INVOICES_VERSION))
+
+
+@receiver([post_save, post_delete], sender=Invoice)
+@receiver([post_save, post_delete], sender=Payment)
+def invalidate_invoices(sender, **kwargs):
+    bump_invoices_version()
@@ -1,5 +1,7 @@
 from rest_framework import permissions, viewsets
 
+from amrs.pagination import KeysetPagination
+
 from .models import Invoice, Payment
 from .serializers import InvoiceSerializer, PaymentSerializer
 
@@ -8,9 +10,11 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     queryset = Invoice.objects.all().order_by('-created_at')
     serializer_class = InvoiceSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     filterset_fields = ['status', 'customer', 'vendor', 'due_date']
     search_fields = ['invoice_number', 'customer', 'vendor']
     ordering_fields = ['due_date', 'created_at', 'total']
+    ordering = ['-created_at', '-id']
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
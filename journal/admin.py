@@ -1,27 +1,114 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.db import transaction
 
-from .models import JournalEntry, JournalLine
+from .models import (
+    AccountPeriodBalance,
+    FiscalPeriod,
+    IntegrityRun,
+    JournalEntry,
+    JournalLine,
+    NumberSequence,
+    OpeningBalance,
+)
+from .periods import closed_period_message, closed_periods
+from .posting import PostingError, post_entries, unpost_entries
+from .signals import entries_changed
+
+
+def is_draft(entry):
+    """
+    Only draft entries may be edited in the admin: posted lines and dates
+    feed the period balances, which change only through the posting code
+    """
+    return entry is None or entry.status == 'draft'
 
 
 class JournalLineInline(admin.TabularInline):
     model = JournalLine
     extra = 1
     autocomplete_fields = ['account']
+    
+    def has_add_permission(self, request, obj=None):
+        return is_draft(obj) and super().has_add_permission(request, obj)
+    
+    def has_change_permission(self, request, obj=None):
+        return is_draft(obj) and super().has_change_permission(request, obj)
+    
+    def has_delete_permission(self, request, obj=None):
+        return is_draft(obj) and super().has_delete_permission(request, obj)
+
+
+class JournalEntryAdminForm(forms.ModelForm):
+    class Meta:
+        model = JournalEntry
+        fields = '__all__'
+    
+    def clean_date(self):
+        value = self.cleaned_data['date']
+        closed = closed_periods([value, self.instance.date if self.instance.pk else None])
+        if closed:
+            raise forms.ValidationError(closed_period_message(closed))
+        return value
 
 
 @admin.register(JournalEntry)
 class JournalEntryAdmin(admin.ModelAdmin):
-    list_display = ('entry_number', 'date', 'description', 'status', 'created_by')
+    list_display = ('entry_number', 'date', 'description', 'status', 'created_by', 'posted_at')
     list_filter = ('status', 'date')
     search_fields = ('entry_number', 'description')
-    readonly_fields = ('created_by',)
+    form = JournalEntryAdminForm
+    readonly_fields = ('created_by', 'status', 'posted_at', 'posted_by', 'reversal_of', 'is_closing')
     inlines = [JournalLineInline]
     date_hierarchy = 'date'
+    actions = ['post_selected', 'unpost_selected']
+    
+    def get_readonly_fields(self, request, obj=None):
+        if is_draft(obj):
+            return self.readonly_fields
+        return [field.name for field in JournalEntry._meta.fields]
+    
+    def has_delete_permission(self, request, obj=None):
+        return is_draft(obj) and super().has_delete_permission(request, obj)
+    
+    def get_actions(self, request):
+        # The bulk delete action cannot tell drafts from posted entries
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
     
     def save_model(self, request, obj, form, change):
         if not obj.created_by:
             obj.created_by = request.user
         obj.save()
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        entries_changed.send(
+            sender=JournalEntry, entry_ids=[form.instance.id], change='updated' if change else 'created',
+            user=request.user
+        )
+    
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            entries_changed.send(sender=JournalEntry, entry_ids=[obj.id], change='deleted', user=request.user)
+            obj.delete()
+    
+    def run_posting(self, request, queryset, posting, verb):
+        try:
+            count = posting(list(queryset.values_list('id', flat=True)), request.user)
+        except PostingError as e:
+            self.message_user(request, f"{e}: {e.errors}", messages.ERROR)
+        else:
+            self.message_user(request, f"{count} journal entries {verb}")
+    
+    @admin.action(description="Post selected draft entries")
+    def post_selected(self, request, queryset):
+        self.run_posting(request, queryset, post_entries, 'posted')
+    
+    @admin.action(description="Unpost selected posted entries")
+    def unpost_selected(self, request, queryset):
+        self.run_posting(request, queryset, unpost_entries, 'unposted')
 
 
 @admin.register(JournalLine)
@@ -29,4 +116,81 @@ class JournalLineAdmin(admin.ModelAdmin):
     list_display = ('entry', 'account', 'debit', 'credit', 'reference')
     list_filter = ('entry__status', 'account')
     search_fields = ('entry__entry_number', 'entry__description', 'account__name', 'reference')
-    autocomplete_fields = ['entry', 'account']
\ No newline at end of file
+    autocomplete_fields = ['entry', 'account']
+    
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None or is_draft(obj.entry):
+            return self.readonly_fields
+        return [field.name for field in JournalLine._meta.fields]
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'entry':
+            # Lines are only added to drafts; posting applies them to the balances
+            kwargs['queryset'] = JournalEntry.objects.filter(status='draft')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
+    def has_delete_permission(self, request, obj=None):
+        return (obj is None or is_draft(obj.entry)) and super().has_delete_permission(request, obj)
+    
+    def save_model(self, request, obj, form, change):
+        obj.save()
+        entries_changed.send(sender=JournalEntry, entry_ids=[obj.entry_id], change='updated', user=request.user)
+    
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            obj.delete()
+            entries_changed.send(sender=JournalEntry, entry_ids=[obj.entry_id], change='updated', user=request.user)
+    
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+
+@admin.register(AccountPeriodBalance)
+class AccountPeriodBalanceAdmin(admin.ModelAdmin):
+    list_display = ('account', 'period', 'debit', 'credit')
+    list_filter = ('period',)
+    search_fields = ('account__code', 'account__name')
+    readonly_fields = ('account', 'period', 'debit', 'credit')
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(NumberSequence)
+class NumberSequenceAdmin(admin.ModelAdmin):
+    list_display = ('series', 'fiscal_year', 'prefix', 'next_value', 'gapless', 'block_size')
+    list_filter = ('series', 'gapless')
+
+
+@admin.register(FiscalPeriod)
+class FiscalPeriodAdmin(admin.ModelAdmin):
+    list_display = ('period', 'status', 'closed_at', 'closed_by')
+    list_filter = ('status',)
+    readonly_fields = ('closed_at', 'closed_by')
+
+
+@admin.register(OpeningBalance)
+class OpeningBalanceAdmin(admin.ModelAdmin):
+    list_display = ('account', 'as_of', 'debit', 'credit')
+    list_filter = ('as_of',)
+    search_fields = ('account__code', 'account__name')
+    readonly_fields = ('account', 'as_of', 'debit', 'credit')
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(IntegrityRun)
+class IntegrityRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'started_at', 'finished_at', 'discrepancy_count', 'created_by')
+    list_filter = ('status',)
+    exclude = ('report',)
+    readonly_fields = (
+        'status', 'chunk_size', 'started_at', 'finished_at', 'ledger_version',
+        'discrepancy_count', 'error', 'created_by',
+    )
+    
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class JournalConfig(AppConfig):
+    name = 'journal'
+
+    def ready(self):
+        # Connect the receivers that log changed entries
+        from . import receivers  # noqa: F401
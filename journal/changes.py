@@ -0,0 +1,112 @@
+from collections import defaultdict
+
+from .ledger import ZERO, period_start
+from .models import POSTED_STATUSES, JournalLine
+
+# Line fields a client can change
+LINE_FIELDS = ('account_id', 'debit', 'credit', 'reference')
+
+
+class LineChangeSet:
+    """
+    The lines an update created, changed and deleted, with their values
+    before and after. Consumers such as the period balances and the audit
+    log use it to apply only what changed.
+    """
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.deleted = []
+        self.unchanged = []
+
+    def __bool__(self):
+        return bool(self.created or self.updated or self.deleted)
+
+    def balance_deltas(self, before, after):
+        """
+        Returns the {(account_id, period): [debit, credit]} change in the
+        period balances. before and after are the entry's (status, date);
+        when either differs every line moves, otherwise only changed lines do.
+        """
+        deltas = defaultdict(lambda: [ZERO, ZERO])
+
+        def add(lines, state, sign):
+            status, entry_date = state
+            if status not in POSTED_STATUSES:
+                return
+            period = period_start(entry_date)
+            for line in lines:
+                totals = deltas[(line['account_id'], period)]
+                totals[0] += sign * line['debit']
+                totals[1] += sign * line['credit']
+
+        if before == after:
+            add([old for old, _ in self.updated] + self.deleted, before, -1)
+            add([new for _, new in self.updated] + self.created, after, 1)
+        else:
+            add([old for old, _ in self.updated] + self.deleted + self.unchanged, before, -1)
+            add([new for _, new in self.updated] + self.created + self.unchanged, after, 1)
+        return deltas
+
+    def as_dict(self):
+        """
+        Returns the change set in a JSON-serializable form
+        """
+        def serialize(line):
+            return {**line, 'debit': str(line['debit']), 'credit': str(line['credit'])}
+
+        return {
+            'created': [serialize(line) for line in self.created],
+            'updated': [
+                {'id': new['id'], 'before': serialize(old), 'after': serialize(new)}
+                for old, new in self.updated
+            ],
+            'deleted': [serialize(line) for line in self.deleted],
+        }
+
+
+def apply_line_changes(entry, lines_data):
+    """
+    Brings an entry's lines in line with lines_data by id: changed lines are
+    bulk-updated, lines without an id bulk-inserted and lines left out
+    deleted. Unchanged lines are not written. Returns a LineChangeSet.
+    """
+    changes = LineChangeSet()
+    existing = {line.id: line for line in JournalLine.objects.filter(entry=entry)}
+
+    def snapshot(line):
+        return {'id': line.id, **{field: getattr(line, field) for field in LINE_FIELDS}}
+
+    to_update = []
+    to_create = []
+    for data in lines_data:
+        values = {
+            'account_id': data['account'].pk,
+            'debit': data.get('debit', ZERO),
+            'credit': data.get('credit', ZERO),
+            'reference': data.get('reference'),
+        }
+        line = existing.pop(data['id'], None) if data.get('id') else None
+        if line is None:
+            to_create.append(JournalLine(entry=entry, **values))
+            continue
+
+        before = snapshot(line)
+        if all(before[field] == value for field, value in values.items()):
+            changes.unchanged.append(before)
+            continue
+        for field, value in values.items():
+            setattr(line, field, value)
+        to_update.append(line)
+        changes.updated.append((before, snapshot(line)))
+
+    if existing:
+        changes.deleted = [snapshot(line) for line in existing.values()]
+        JournalLine.objects.filter(id__in=list(existing)).delete()
+    if to_update:
+        JournalLine.objects.bulk_update(to_update, LINE_FIELDS)
+    if to_create:
+        JournalLine.objects.bulk_create(to_create)
+        changes.created = [snapshot(line) for line in to_create]
+
+    return changes
@@ -0,0 +1,36 @@
+import django_filters
+
+from coa.tree import subtree_filter
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    pass
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class TransactionFilter(django_filters.FilterSet):
+    """
+    Filters for the transactions API. Field names refer to the columns the
+    view projects, so date and amount ranges hit the entry date and line
+    amount indexes.
+    """
+    date_from = django_filters.DateFilter(field_name='date', lookup_expr='gte')
+    date_to = django_filters.DateFilter(field_name='date', lookup_expr='lte')
+    amount_min = django_filters.NumberFilter(field_name='amount', lookup_expr='gte')
+    amount_max = django_filters.NumberFilter(field_name='amount', lookup_expr='lte')
+    side = django_filters.ChoiceFilter(choices=(('debit', 'Debit'), ('credit', 'Credit')), method='filter_side')
+    account = NumberInFilter(field_name='account_id')
+    account_code = CharInFilter(field_name='account_code')
+    under = django_filters.NumberFilter(method='filter_under', label="Account id whose subtree to include")
+    entry = django_filters.NumberFilter(field_name='entry_id')
+    status = CharInFilter(field_name='status')
+    reference = django_filters.CharFilter(field_name='reference')
+
+    def filter_side(self, queryset, name, value):
+        return queryset.filter(**{f'{value}__gt': 0})
+
+    def filter_under(self, queryset, name, value):
+        return queryset.filter(subtree_filter(int(value), 'account__path'))
@@ -0,0 +1,315 @@
+import csv
+import json
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import groupby, islice
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from coa.registry import registry
+
+from .ledger import ZERO, apply_balance_deltas, period_start
+from .models import JournalEntry, JournalLine
+from .periods import closed_period_message, closed_periods
+from .posting import ENTRY_NUMBER_SERIES
+from .sequences import series_pattern
+from .signals import entries_changed
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+
+IMPORT_STATUSES = ('draft', 'posted')
+
+# Entries validated and inserted per transaction
+IMPORT_BATCH_SIZE = 1000
+
+# Row errors returned in full; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+# Entry fields of a flat line row; the remaining fields describe the line
+ENTRY_FIELDS = ('entry_number', 'date', 'description', 'status')
+
+
+class ImportResult:
+    """
+    Counts and per-row errors of a journal import
+    """
+    def __init__(self):
+        self.rows = 0
+        self.entries_created = 0
+        self.lines_created = 0
+        self.entries_rejected = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, rows, entry_number, messages):
+        self.entries_rejected += 1
+        self.error_count += len(messages)
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'rows': rows, 'entry_number': entry_number, 'errors': messages})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'entries_created': self.entries_created,
+            'lines_created': self.lines_created,
+            'entries_rejected': self.entries_rejected,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def read_ndjson(stream):
+    """
+    Yields (row number, row) from newline-delimited JSON. A row is either one
+    line with its entry's fields, or a whole entry with a list of lines.
+    """
+    for number, text in enumerate(stream, start=1):
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as e:
+            row = {'_error': f"Invalid JSON: {e}"}
+        if not isinstance(row, dict):
+            row = {'_error': "Each line must be a JSON object"}
+        yield number, row
+
+
+def read_csv(stream):
+    """
+    Yields (row number, row) from CSV with a header line, one journal line per row
+    """
+    for number, row in enumerate(csv.DictReader(stream), start=2):
+        yield number, row
+
+
+def read_entries(rows):
+    """
+    Groups rows into entries. Lines of the same entry must be consecutive,
+    which keeps memory bounded however large the file is.
+    """
+    for entry_number, group in groupby(rows, key=lambda item: item[1].get('entry_number')):
+        group = list(group)
+        first = group[0][1]
+        entry = {field: first.get(field) for field in ENTRY_FIELDS}
+        entry['rows'] = [number for number, _ in group]
+        entry['errors'] = [row['_error'] for _, row in group if '_error' in row]
+        entry['lines'] = []
+        for _, row in group:
+            if isinstance(row.get('lines'), list):
+                entry['lines'].extend(line for line in row['lines'] if isinstance(line, dict))
+            elif '_error' not in row:
+                entry['lines'].append(row)
+        yield entry
+
+
+def parse_entry_date(value):
+    """
+    Parses an ISO date, returning None if it is missing or invalid
+    """
+    try:
+        return parse_date(str(value or ''))
+    except ValueError:
+        return None
+
+
+def parse_amount(value, field, errors):
+    """
+    Parses a non-negative amount with at most two decimal places
+    """
+    if value in (None, ''):
+        return ZERO
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        errors.append(f"{field} '{value}' is not a number")
+        return ZERO
+    if not amount.is_finite() or amount < 0 or amount != amount.quantize(Decimal('0.01')):
+        errors.append(f"{field} '{value}' must be a non-negative amount with at most 2 decimals")
+        return ZERO
+    return amount
+
+
+class JournalImporter:
+    """
+    Imports journal entries in batches: each batch is validated with a few
+    set-based queries and inserted with bulk_create in its own transaction,
+    so an invalid entry is reported without aborting the rest of the file
+    """
+    def __init__(self, user, default_status='draft', batch_size=IMPORT_BATCH_SIZE):
+        self.user = user
+        self.default_status = default_status
+        self.batch_size = batch_size
+        self.result = ImportResult()
+        self.seen_numbers = set()
+        self.started_at = timezone.now()
+        # Numbers the journal series assigns on posting; importing one would
+        # make a later posting collide with it
+        self.series_numbers = series_pattern(ENTRY_NUMBER_SERIES)
+
+    def run(self, stream, import_format='ndjson'):
+        """
+        Import every entry read from a text stream and return the ImportResult
+        """
+        rows = read_csv(stream) if import_format == 'csv' else read_ndjson(stream)
+        entries = read_entries(self.count_rows(rows))
+        while True:
+            batch = list(islice(entries, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+        return self.result
+
+    def count_rows(self, rows):
+        for item in rows:
+            self.result.rows += 1
+            yield item
+
+    def import_batch(self, batch):
+        """
+        Validate a batch of entries and insert the valid ones
+        """
+        existing = set(
+            JournalEntry.objects.filter(
+                entry_number__in=[str(entry['entry_number']).strip() for entry in batch if entry['entry_number']]
+            ).values_list('entry_number', flat=True)
+        )
+
+        closed = set(closed_periods(parse_entry_date(entry['date']) for entry in batch))
+
+        valid = []
+        for entry in batch:
+            cleaned = self.clean_entry(entry, existing, closed)
+            if cleaned is not None:
+                valid.append((entry, cleaned))
+
+        while valid:
+            try:
+                self.write_batch([cleaned for _, cleaned in valid])
+                return
+            except IntegrityError:
+                # Another writer may have taken entry numbers since they were checked
+                taken = set(
+                    JournalEntry.objects.filter(
+                        entry_number__in=[instance.entry_number for _, (instance, _) in valid]
+                    ).values_list('entry_number', flat=True)
+                )
+                if not taken:
+                    raise
+                remaining = []
+                for entry, (instance, lines) in valid:
+                    if instance.entry_number in taken:
+                        self.result.add_error(
+                            entry['rows'], instance.entry_number,
+                            [f"Journal entry '{instance.entry_number}' already exists"],
+                        )
+                        continue
+                    # Ids assigned by the rolled back inserts are not valid
+                    for obj in [instance, *lines]:
+                        obj.pk = None
+                        obj._state.adding = True
+                    remaining.append((entry, (instance, lines)))
+                valid = remaining
+
+    def write_batch(self, valid):
+        """
+        Insert validated (entry, lines) pairs in one transaction
+        """
+        with transaction.atomic():
+            entries = JournalEntry.objects.bulk_create([entry for entry, _ in valid])
+            lines = []
+            deltas = defaultdict(lambda: [ZERO, ZERO])
+            for entry, (_, entry_lines) in zip(entries, valid):
+                for line in entry_lines:
+                    line.entry = entry
+                    lines.append(line)
+                    if entry.status == 'posted':
+                        totals = deltas[(line.account_id, period_start(entry.date))]
+                        totals[0] += line.debit
+                        totals[1] += line.credit
+            JournalLine.objects.bulk_create(lines, batch_size=self.batch_size)
+
+            # One update per account and period for the whole batch
+            apply_balance_deltas(deltas)
+            entries_changed.send(
+                sender=JournalEntry, entry_ids=[entry.id for entry in entries], change='imported', user=self.user
+            )
+
+        self.result.entries_created += len(entries)
+        self.result.lines_created += len(lines)
+
+    def clean_entry(self, entry, existing, closed):
+        """
+        Returns an unsaved (entry, lines) pair, or records the entry's errors
+        and returns None
+        """
+        entry_number = str(entry['entry_number'] or '').strip()
+        if entry['errors']:
+            # Unreadable rows cannot be validated any further
+            self.result.add_error(entry['rows'], entry_number, entry['errors'])
+            return None
+
+        errors = []
+
+        if not entry_number:
+            errors.append("entry_number is required")
+        elif len(entry_number) > JournalEntry._meta.get_field('entry_number').max_length:
+            errors.append("entry_number is too long")
+        elif self.series_numbers.fullmatch(entry_number):
+            errors.append(f"entry_number '{entry_number}' has the format of the numbers assigned on posting")
+        elif entry_number in existing:
+            errors.append(f"Journal entry '{entry_number}' already exists")
+        elif entry_number in self.seen_numbers:
+            errors.append(f"Journal entry '{entry_number}' appears more than once in the file")
+        self.seen_numbers.add(entry_number)
+
+        entry_date = parse_entry_date(entry['date'])
+        if entry_date is None:
+            errors.append(f"date '{entry['date']}' must be a valid date in YYYY-MM-DD format")
+        elif period_start(entry_date) in closed:
+            errors.append(closed_period_message([period_start(entry_date)]))
+
+        status = entry['status'] or self.default_status
+        if status not in IMPORT_STATUSES:
+            errors.append(f"status must be one of: {', '.join(IMPORT_STATUSES)}")
+
+        lines = []
+        total_debit = total_credit = ZERO
+        for line in entry['lines']:
+            account = registry.get_by_code(str(line.get('account_code') or '').strip())
+            account_id = account.id if account is not None and account.is_active else None
+            if account_id is None:
+                errors.append(f"Unknown or inactive account code '{line.get('account_code')}'")
+            debit = parse_amount(line.get('debit'), 'debit', errors)
+            credit = parse_amount(line.get('credit'), 'credit', errors)
+            total_debit += debit
+            total_credit += credit
+            lines.append(JournalLine(
+                account_id=account_id,
+                debit=debit,
+                credit=credit,
+                reference=line.get('reference') or None,
+            ))
+
+        if not lines:
+            errors.append("Journal entry must have at least one line")
+        elif total_debit != total_credit:
+            errors.append("Journal entry must balance: total debits must equal total credits")
+
+        if errors:
+            self.result.add_error(entry['rows'], entry_number, errors)
+            return None
+
+        posted = status == 'posted'
+        return JournalEntry(
+            entry_number=entry_number,
+            date=entry_date,
+            description=entry['description'] or '',
+            status=status,
+            created_by=self.user,
+            posted_at=self.started_at if posted else None,
+            posted_by=self.user if posted else None,
+        ), lines
@@ -0,0 +1,215 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Count, Exists, Max, Min, OuterRef, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from coa.models import Account
+
+from .ledger import ZERO, compare_period_balances, ledger_version, stored_period_balances
+from .models import (
+    POSTED_STATUSES,
+    IntegrityChunk,
+    IntegrityRun,
+    JournalEntry,
+    JournalLine,
+    OpeningBalance,
+)
+
+# Entry ids per chunk
+INTEGRITY_CHUNK_SIZE = 10000
+
+
+def plan_run(chunk_size=INTEGRITY_CHUNK_SIZE, user=None):
+    """
+    Create an integrity run with one chunk per entry id range. The ranges
+    also cover the entry ids of lines whose entry no longer exists.
+    """
+    entries = JournalEntry.objects.aggregate(low=Min('id'), high=Max('id'))
+    lines = JournalLine.objects.aggregate(low=Min('entry_id'), high=Max('entry_id'))
+    lows = [value for value in (entries['low'], lines['low']) if value is not None]
+    highs = [value for value in (entries['high'], lines['high']) if value is not None]
+
+    run = IntegrityRun.objects.create(chunk_size=chunk_size, ledger_version=ledger_version(), created_by=user)
+    if lows:
+        IntegrityChunk.objects.bulk_create(
+            [
+                IntegrityChunk(run=run, start_id=start, end_id=start + chunk_size)
+                for start in range(min(lows), max(highs) + 1, chunk_size)
+            ],
+            batch_size=1000
+        )
+    return run
+
+
+def pending_chunk_ids(run):
+    """
+    Chunks a run still has to check, which is all of them unless it is resumed
+    """
+    return list(run.chunks.filter(done=False).order_by('start_id').values_list('id', flat=True))
+
+
+def check_range(start, end):
+    """
+    Check the entries with ids in [start, end) and their lines. Returns the
+    number of entries, the discrepancies found and the posted line totals
+    per account and period, keyed "account_id|YYYY-MM-DD".
+    """
+    discrepancies = []
+
+    entries = (
+        JournalEntry.objects.filter(id__gte=start, id__lt=end)
+        .order_by('id')
+        .values('id', 'entry_number', 'status')
+        .annotate(line_count=Count('lines'), debit=Sum('lines__debit'), credit=Sum('lines__credit'))
+    )
+    entry_count = 0
+    for entry in entries:
+        entry_count += 1
+        found = {'entry_id': entry['id'], 'entry_number': entry['entry_number'], 'status': entry['status']}
+        if not entry['line_count']:
+            discrepancies.append({'type': 'entry_without_lines', **found})
+        elif entry['debit'] != entry['credit']:
+            discrepancies.append({
+                'type': 'unbalanced_entry', **found, 'debit': entry['debit'], 'credit': entry['credit']
+            })
+        if entry['status'] in POSTED_STATUSES and not entry['entry_number']:
+            discrepancies.append({'type': 'unnumbered_entry', **found})
+
+    lines = JournalLine.objects.filter(entry_id__gte=start, entry_id__lt=end).order_by('id')
+    for line in lines.filter(~Exists(JournalEntry.objects.filter(id=OuterRef('entry_id')))).values('id', 'entry_id'):
+        discrepancies.append({'type': 'orphaned_line', 'line_id': line['id'], 'entry_id': line['entry_id']})
+    for line in lines.filter(~Exists(Account.objects.filter(id=OuterRef('account_id')))).values(
+        'id', 'entry_id', 'account_id'
+    ):
+        discrepancies.append({
+            'type': 'line_without_account',
+            'line_id': line['id'],
+            'entry_id': line['entry_id'],
+            'account_id': line['account_id'],
+        })
+    for line in lines.filter(Q(debit__lt=0) | Q(credit__lt=0) | Q(debit__gt=0, credit__gt=0)).values(
+        'id', 'entry_id', 'debit', 'credit'
+    ):
+        discrepancies.append({
+            'type': 'invalid_line_amounts',
+            'line_id': line['id'],
+            'entry_id': line['entry_id'],
+            'debit': line['debit'],
+            'credit': line['credit'],
+        })
+
+    totals = {
+        f"{row['account_id']}|{row['period']:%Y-%m-%d}": [str(row['debit'] or ZERO), str(row['credit'] or ZERO)]
+        for row in lines.filter(entry__status__in=POSTED_STATUSES)
+        .annotate(period=TruncMonth('entry__date'))
+        .order_by()
+        .values('account_id', 'period')
+        .annotate(debit=Sum('debit'), credit=Sum('credit'))
+    }
+    return entry_count, discrepancies, totals
+
+
+def run_chunk(chunk_id):
+    """
+    Check one chunk and store its results; a chunk already done is skipped
+    """
+    chunk = IntegrityChunk.objects.get(id=chunk_id)
+    if chunk.done:
+        return 0
+    chunk.entries_checked, chunk.discrepancies, chunk.totals = check_range(chunk.start_id, chunk.end_id)
+    chunk.done = True
+    chunk.save(update_fields=['entries_checked', 'discrepancies', 'totals', 'done'])
+    return len(chunk.discrepancies)
+
+
+def merge_totals(chunks):
+    """
+    Sum the chunks' totals into {(account_id, period): (debit, credit)}
+    """
+    totals = defaultdict(lambda: [ZERO, ZERO])
+    for chunk_totals in chunks:
+        for key, (debit, credit) in chunk_totals.items():
+            account_id, period = key.split('|')
+            row = totals[(int(account_id), date.fromisoformat(period))]
+            row[0] += Decimal(debit)
+            row[1] += Decimal(credit)
+    return {key: tuple(value) for key, value in totals.items()}
+
+
+def compare_opening_balances(expected):
+    """
+    Check every stored set of opening balances against the cumulative
+    totals of all periods before its date
+    """
+    stored = defaultdict(dict)
+    for row in OpeningBalance.objects.values('account_id', 'as_of', 'debit', 'credit'):
+        stored[row['as_of']][row['account_id']] = (row['debit'], row['credit'])
+
+    discrepancies = []
+    for as_of in sorted(stored):
+        cumulative = defaultdict(lambda: [ZERO, ZERO])
+        for (account_id, period), (debit, credit) in expected.items():
+            if period < as_of:
+                cumulative[account_id][0] += debit
+                cumulative[account_id][1] += credit
+        for account_id in sorted(set(cumulative) | set(stored[as_of])):
+            expected_totals = tuple(cumulative.get(account_id, (ZERO, ZERO)))
+            stored_totals = stored[as_of].get(account_id, (ZERO, ZERO))
+            if expected_totals != stored_totals:
+                discrepancies.append({
+                    'type': 'opening_balance',
+                    'account_id': account_id,
+                    'as_of': as_of,
+                    'expected_debit': expected_totals[0],
+                    'expected_credit': expected_totals[1],
+                    'stored_debit': stored_totals[0],
+                    'stored_credit': stored_totals[1],
+                })
+    return discrepancies
+
+
+def finish_run(run):
+    """
+    Merge the chunks of a run, compare the stored period and opening
+    balances against the recomputed totals and store the report
+    """
+    chunks = list(run.chunks.order_by('start_id').values('done', 'entries_checked', 'discrepancies', 'totals'))
+    if not all(chunk['done'] for chunk in chunks):
+        raise ValueError(f"Integrity run {run.pk} has unfinished chunks")
+
+    expected = merge_totals(chunk['totals'] for chunk in chunks)
+    discrepancies = [item for chunk in chunks for item in chunk['discrepancies']]
+    discrepancies += [
+        {'type': 'period_balance', **item}
+        for item in compare_period_balances(expected, stored_period_balances())
+    ]
+    discrepancies += compare_opening_balances(expected)
+
+    counts = defaultdict(int)
+    for item in discrepancies:
+        counts[item['type']] += 1
+
+    run.finished_at = timezone.now()
+    run.status = 'completed'
+    run.discrepancy_count = len(discrepancies)
+    run.report = {
+        'run_id': run.pk,
+        'started_at': run.started_at,
+        'finished_at': run.finished_at,
+        'chunks': len(chunks),
+        'entries_checked': sum(chunk['entries_checked'] for chunk in chunks),
+        # Postings during the scan can show up as period or opening balance discrepancies
+        'ledger_changed': ledger_version() != run.ledger_version,
+        'discrepancy_count': len(discrepancies),
+        'counts': dict(counts),
+        'discrepancies': discrepancies,
+    }
+    run.save(update_fields=['finished_at', 'status', 'discrepancy_count', 'report'])
+    return run.report
+
+
+def fail_run(run_id, error):
+    IntegrityRun.objects.filter(id=run_id).update(status='failed', error=error, finished_at=timezone.now())
@@ -0,0 +1,199 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+
+from amrs.cache_versions import bump_version, get_version
+
+from .models import POSTED_STATUSES, AccountPeriodBalance, JournalLine
+
+ZERO = Decimal('0.00')
+
+LEDGER_VERSION = 'ledger'
+
+
+def ledger_version():
+    """
+    Returns the ledger version, which increases every time posted lines change
+    """
+    return get_version(LEDGER_VERSION)
+
+
+def bump_ledger_version():
+    """
+    Marks every cached ledger result as stale once the current transaction commits
+    """
+    transaction.on_commit(lambda: bump_version(LEDGER_VERSION))
+
+
+def period_start(value):
+    """
+    Returns the first day of the fiscal period containing the given date
+    """
+    return value.replace(day=1)
+
+
+def next_period_start(value):
+    """
+    Returns the first day of the fiscal period following the given date
+    """
+    return (value.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def is_period_end(value):
+    """
+    Returns True if the given date is the last day of its fiscal period
+    """
+    return (value + timedelta(days=1)).day == 1
+
+
+def entry_balance_deltas(entry):
+    """
+    Returns the {(account_id, period): [debit, credit]} totals an entry
+    contributes to the period balances. Only posted entries contribute.
+    """
+    deltas = defaultdict(lambda: [ZERO, ZERO])
+    if entry.status not in POSTED_STATUSES:
+        return deltas
+
+    period = period_start(entry.date)
+    for line in JournalLine.objects.filter(entry=entry):
+        totals = deltas[(line.account_id, period)]
+        totals[0] += line.debit
+        totals[1] += line.credit
+    return deltas
+
+
+def lines_balance_deltas(lines, sign=1):
+    """
+    Returns the balance deltas of a queryset of journal lines, summed per
+    account and period in one query. Use sign=-1 to take them off the balances.
+    """
+    rows = (
+        lines.annotate(period=TruncMonth('entry__date'))
+        .order_by()
+        .values('account_id', 'period')
+        .annotate(debit=Sum('debit'), credit=Sum('credit'))
+    )
+    deltas = defaultdict(lambda: [ZERO, ZERO])
+    for row in rows:
+        deltas[(row['account_id'], row['period'])] = [sign * (row['debit'] or ZERO), sign * (row['credit'] or ZERO)]
+    return deltas
+
+
+def subtract_deltas(after, before):
+    """
+    Returns the change between two sets of balance deltas
+    """
+    changes = defaultdict(lambda: [ZERO, ZERO])
+    for key, (debit, credit) in after.items():
+        changes[key][0] += debit
+        changes[key][1] += credit
+    for key, (debit, credit) in before.items():
+        changes[key][0] -= debit
+        changes[key][1] -= credit
+    return changes
+
+
+def apply_balance_deltas(deltas):
+    """
+    Adds balance deltas to the stored period balances. Must run inside the
+    transaction that writes the journal lines.
+    """
+    changed = False
+    for (account_id, period), (debit, credit) in sorted(deltas.items()):
+        if not debit and not credit:
+            continue
+        changed = True
+
+        balance, created = AccountPeriodBalance.objects.get_or_create(
+            account_id=account_id,
+            period=period,
+            defaults={'debit': debit, 'credit': credit}
+        )
+        if not created:
+            AccountPeriodBalance.objects.filter(pk=balance.pk).update(
+                debit=F('debit') + debit,
+                credit=F('credit') + credit
+            )
+
+    if changed:
+        bump_ledger_version()
+
+
+def compute_period_balances():
+    """
+    Recomputes the period balances from all posted journal lines
+    """
+    rows = (
+        JournalLine.objects.filter(entry__status__in=POSTED_STATUSES)
+        .annotate(period=TruncMonth('entry__date'))
+        .order_by()
+        .values('account_id', 'period')
+        .annotate(debit=Sum('debit'), credit=Sum('credit'))
+    )
+    return {
+        (row['account_id'], row['period']): (row['debit'] or ZERO, row['credit'] or ZERO)
+        for row in rows
+    }
+
+
+def stored_period_balances():
+    """
+    Returns the stored period balances keyed like compute_period_balances
+    """
+    return {
+        (row['account_id'], row['period']): (row['debit'], row['credit'])
+        for row in AccountPeriodBalance.objects.values('account_id', 'period', 'debit', 'credit')
+    }
+
+
+def rebuild_period_balances():
+    """
+    Replaces all stored period balances with freshly computed ones
+    """
+    with transaction.atomic():
+        balances = compute_period_balances()
+        AccountPeriodBalance.objects.all().delete()
+        AccountPeriodBalance.objects.bulk_create(
+            [
+                AccountPeriodBalance(account_id=account_id, period=period, debit=debit, credit=credit)
+                for (account_id, period), (debit, credit) in balances.items()
+            ],
+            batch_size=1000
+        )
+        bump_ledger_version()
+    return len(balances)
+
+
+def verify_period_balances():
+    """
+    Compares stored period balances against the journal lines and returns
+    a list of discrepancies
+    """
+    return compare_period_balances(compute_period_balances(), stored_period_balances())
+
+
+def compare_period_balances(expected, stored):
+    """
+    Returns the discrepancies between expected and stored period balances,
+    both keyed by (account_id, period)
+    """
+    discrepancies = []
+    for key in sorted(set(expected) | set(stored)):
+        expected_totals = expected.get(key, (ZERO, ZERO))
+        stored_totals = stored.get(key, (ZERO, ZERO))
+        if expected_totals != stored_totals:
+            account_id, period = key
+            discrepancies.append({
+                'account_id': account_id,
+                'period': period.strftime('%Y-%m-%d') if isinstance(period, date) else period,
+                'expected_debit': expected_totals[0],
+                'expected_credit': expected_totals[1],
+                'stored_debit': stored_totals[0],
+                'stored_credit': stored_totals[1],
+            })
+    return discrepancies
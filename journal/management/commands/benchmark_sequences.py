@@ -0,0 +1,77 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, transaction
+
+from journal.models import NumberSequence
+from journal.sequences import SequenceAllocator
+
+
+class Command(BaseCommand):
+    help = "Measure number allocation throughput with concurrent writers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=32)
+        parser.add_argument('--numbers', type=int, default=1000, help="Numbers allocated by each writer")
+        parser.add_argument('--gapless', action='store_true')
+        parser.add_argument('--block-size', type=int, default=50)
+        parser.add_argument('--series', default='benchmark')
+
+    def handle(self, *args, **options):
+        if not connection.features.has_select_for_update:
+            raise CommandError("Concurrent writers need a database with row-level locking, such as PostgreSQL")
+
+        fiscal_year = 1900
+        NumberSequence.objects.filter(series=options['series'], fiscal_year=fiscal_year).delete()
+        NumberSequence.objects.create(
+            series=options['series'],
+            fiscal_year=fiscal_year,
+            gapless=options['gapless'],
+            block_size=options['block_size'],
+        )
+
+        results = []
+        errors = []
+        start = threading.Barrier(options['writers'])
+
+        def writer():
+            # Each writer stands in for a separate worker process with its own blocks
+            allocator = SequenceAllocator()
+            numbers = []
+            try:
+                start.wait()
+                for _ in range(options['numbers']):
+                    with transaction.atomic():
+                        numbers.extend(allocator.allocate(options['series'], fiscal_year))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                results.append(numbers)
+                allocator.close()
+                connection.close()
+
+        threads = [threading.Thread(target=writer) for _ in range(options['writers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        close_old_connections()
+
+        if errors:
+            raise CommandError(f"{len(errors)} writers failed, first error: {errors[0]}")
+
+        numbers = [number for batch in results for number in batch]
+        if len(set(numbers)) != len(numbers):
+            raise CommandError("Duplicate numbers were allocated")
+
+        values = sorted(int(number.rsplit('-', 1)[1]) for number in numbers)
+        gaps = values[-1] - values[0] + 1 - len(values) if values else 0
+        mode = 'gapless' if options['gapless'] else f"blocks of {options['block_size']}"
+        self.stdout.write(
+            f"{len(numbers)} numbers from {options['writers']} writers ({mode}) in {elapsed:.2f}s: "
+            f"{len(numbers) / elapsed:,.0f} numbers/s, {gaps} gaps"
+        )
+        NumberSequence.objects.filter(series=options['series'], fiscal_year=fiscal_year).delete()
@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from journal.periods import PeriodError, close_year, reopen_year
+
+
+class Command(BaseCommand):
+    help = "Close a fiscal year (closing entry, locked periods, carried-forward opening balances) or reopen it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('year', type=int)
+        parser.add_argument('--username', help="User recorded on the closing entry")
+        parser.add_argument('--reopen', action='store_true', help="Undo the close instead")
+
+    def handle(self, *args, **options):
+        year = options['year']
+        try:
+            if options['reopen']:
+                reopen_year(year)
+                self.stdout.write(self.style.SUCCESS(f"Fiscal year {year} reopened"))
+                return
+
+            if not options['username']:
+                raise CommandError("--username is required to close a year")
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['username']}' does not exist")
+
+            entry = close_year(year, user)
+        except PeriodError as e:
+            raise CommandError(str(e))
+
+        closing = f"closing entry {entry.entry_number}" if entry else "no closing entry needed"
+        self.stdout.write(self.style.SUCCESS(f"Fiscal year {year} closed, {closing}"))
@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from journal.importers import IMPORT_BATCH_SIZE, IMPORT_FORMATS, IMPORT_STATUSES, JournalImporter
+
+
+class Command(BaseCommand):
+    help = "Import journal entries from an NDJSON or CSV file in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import")
+        parser.add_argument('--username', required=True, help="User recorded as the creator of the entries")
+        parser.add_argument('--format', dest='import_format', choices=IMPORT_FORMATS)
+        parser.add_argument('--default-status', choices=IMPORT_STATUSES, default='draft')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist")
+
+        import_format = options['import_format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        importer = JournalImporter(user, options['default_status'], options['batch_size'])
+        with open(options['path'], newline='', encoding='utf-8') as stream:
+            result = importer.run(stream, import_format)
+
+        for error in result.errors:
+            self.stderr.write(f"Rows {error['rows'][0]}-{error['rows'][-1]} ({error['entry_number']}): {'; '.join(error['errors'])}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.entries_created} entries ({result.lines_created} lines) from {result.rows} rows; "
+            f"{result.entries_rejected} entries rejected"
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from journal.ledger import rebuild_period_balances, verify_period_balances
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-account, per-period balance snapshots from posted journal lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help="Only compare the stored snapshots against the journal lines"
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            discrepancies = verify_period_balances()
+            for item in discrepancies:
+                self.stdout.write(
+                    f"account {item['account_id']} period {item['period']}: "
+                    f"expected {item['expected_debit']}/{item['expected_credit']}, "
+                    f"stored {item['stored_debit']}/{item['stored_credit']}"
+                )
+            if discrepancies:
+                raise CommandError(f"{len(discrepancies)} period balances do not match the journal")
+            self.stdout.write(self.style.SUCCESS("Period balances match the journal"))
+            return
+
+        count = rebuild_period_balances()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} period balances"))
@@ -1,25 +1,225 @@
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 from coa.models import Account
 
 
+# A reversed entry stays on the books next to the reversal that cancels it,
+# so the lines of both posted and reversed entries make up the ledger
+POSTED_STATUSES = ('posted', 'reversed')
+
+
 class JournalEntry(models.Model):
-    entry_number = models.CharField(max_length=20, unique=True)
+    STATUS_CHOICES = (
+        ('draft', 'Draft'),
+        ('posted', 'Posted'),
+        ('reversed', 'Reversed'),
+    )
+
+    # Drafts are numbered when they are posted
+    entry_number = models.CharField(max_length=20, unique=True, null=True, blank=True)
     date = models.DateField()
     description = models.TextField(blank=True)
-    status = models.CharField(max_length=20)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    posted_at = models.DateTimeField(null=True, blank=True)
+    posted_by = models.ForeignKey(
+        User, null=True, blank=True, on_delete=models.SET_NULL, related_name='posted_journal_entries'
+    )
+    reversal_of = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.PROTECT, related_name='reversals'
+    )
+    # Year-end entry moving revenue and expense balances to retained earnings
+    is_closing = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Ledger queries select posted entries up to or within a date range
+            models.Index(fields=['status', 'date'], name='journal_entry_status_date'),
+            # Keyset pagination of the entry listing
+            models.Index(fields=['date', 'id'], name='journal_entry_date_id'),
+        ]
 
     def __str__(self):
-        return self.entry_number
+        return self.entry_number or f"Draft #{self.pk}"
+
 
 class JournalLine(models.Model):
-    entry = models.ForeignKey(JournalEntry, related_name='lines', on_delete=models.CASCADE)
-    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    # The covering indexes below start with these columns and replace the plain foreign key indexes
+    entry = models.ForeignKey(JournalEntry, related_name='lines', on_delete=models.CASCADE, db_index=False)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, db_index=False)
     debit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     credit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     reference = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        # On PostgreSQL the amounts are stored in the index, so balance sums by
+        # account or by entry are answered by index-only scans. Other databases
+        # create the same indexes without the included columns.
+        indexes = [
+            models.Index(
+                fields=['account', 'entry'], include=['debit', 'credit'], name='journal_line_account_cover'
+            ),
+            models.Index(
+                fields=['entry'], include=['account', 'debit', 'credit'], name='journal_line_entry_cover'
+            ),
+            # Amount range filters of the transactions API; a line has either a debit or a credit
+            models.Index(models.F('debit') + models.F('credit'), name='journal_line_amount'),
+        ]
+
+    def __str__(self):
+        return f"{self.entry.entry_number}: {self.account.code}"
+
+class AccountPeriodBalance(models.Model):
+    """
+    Posted debit and credit totals per account and fiscal period (calendar month),
+    maintained incrementally whenever entries are posted, unposted or edited
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='period_balances')
+    period = models.DateField(help_text="First day of the fiscal period")
+    debit = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['account', 'period']
+        unique_together = ('account', 'period')
+        indexes = [
+            models.Index(fields=['period']),
+        ]
+
+    def __str__(self):
+        return f"{self.account.code} {self.period:%Y-%m}"
+
+
+class LedgerChange(models.Model):
+    """
+    Log of the entries whose lines may have changed, written in the
+    transaction that changes them. Copies of the posted lines, such as the
+    columnar ledger, re-read only the entries logged since their last refresh.
+    """
+    # Not a foreign key: deleted entries are logged too
+    entry_id = models.IntegerField()
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Entry {self.entry_id} changed"
+
+
+class FiscalPeriod(models.Model):
+    """
+    A fiscal period (calendar month). Entries dated in a closed period can
+    no longer be created, edited, posted, unposted or reversed.
+    """
+    STATUS_CHOICES = (
+        ('open', 'Open'),
+        ('closed', 'Closed'),
+    )
+
+    period = models.DateField(unique=True, help_text="First day of the fiscal period")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    closed_at = models.DateTimeField(null=True, blank=True)
+    closed_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        ordering = ['period']
+
+    def __str__(self):
+        return f"{self.period:%Y-%m} ({self.status})"
+
+
+class OpeningBalance(models.Model):
+    """
+    Cumulative posted debit and credit totals of an account carried forward
+    by a year-end close, as of the first day of the following fiscal year.
+    Balances from that date on start here instead of summing older periods.
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='opening_balances')
+    as_of = models.DateField(help_text="First day of the fiscal year the balance opens")
+    debit = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['as_of', 'account']
+        unique_together = ('account', 'as_of')
+        indexes = [
+            models.Index(fields=['as_of']),
+        ]
+
+    def __str__(self):
+        return f"{self.account.code} opening {self.as_of}"
+
+
+class NumberSequence(models.Model):
+    """
+    Document number series per fiscal year, such as journal entries or invoices.
+    Gapless series hand out numbers under a row lock inside the caller's
+    transaction; other series hand out blocks of numbers to each process.
+    """
+    series = models.CharField(max_length=50)
+    fiscal_year = models.IntegerField()
+    prefix = models.CharField(max_length=10, blank=True)
+    padding = models.PositiveSmallIntegerField(default=6)
+    next_value = models.BigIntegerField(default=1)
+    gapless = models.BooleanField(default=False)
+    block_size = models.PositiveIntegerField(default=50)
+
+    class Meta:
+        ordering = ['series', 'fiscal_year']
+        unique_together = ('series', 'fiscal_year')
+
+    def __str__(self):
+        return f"{self.series} {self.fiscal_year}"
+
+    def format(self, value):
+        return f"{self.prefix}{self.fiscal_year}-{value:0{self.padding}d}"
+
+
+class IntegrityRun(models.Model):
+    """
+    A ledger integrity check. The ledger is scanned in entry id ranges, one
+    IntegrityChunk each; finished chunks are checkpoints a resumed run skips.
+    """
+    STATUS_CHOICES = (
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    chunk_size = models.PositiveIntegerField()
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Ledger version when the run started; a change means aggregates may have moved mid-scan
+    ledger_version = models.BigIntegerField(null=True, blank=True)
+    discrepancy_count = models.PositiveIntegerField(default=0)
+    report = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Integrity run {self.pk} ({self.status})"
+
+
+class IntegrityChunk(models.Model):
+    """
+    One entry id range of an integrity run, with what its check found and
+    its posted line totals per account and period for the final comparison
+    """
+    run = models.ForeignKey(IntegrityRun, on_delete=models.CASCADE, related_name='chunks')
+    start_id = models.BigIntegerField()
+    end_id = models.BigIntegerField(help_text="Exclusive")
+    done = models.BooleanField(default=False)
+    entries_checked = models.PositiveIntegerField(default=0)
+    discrepancies = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    totals = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        ordering = ['run', 'start_id']
+        unique_together = ('run', 'start_id')
+
     def __str__(self):
-        return f"{self.entry.entry_number}: {self.account.code}"
\ No newline at end of file
+        return f"{self.run_id}: {self.start_id}-{self.end_id}"
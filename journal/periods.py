@@ -0,0 +1,274 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from coa.models import Account
+
+from .ledger import (
+    ZERO,
+    apply_balance_deltas,
+    bump_ledger_version,
+    lines_balance_deltas,
+    next_period_start,
+    period_start,
+)
+from .models import (
+    POSTED_STATUSES,
+    AccountPeriodBalance,
+    FiscalPeriod,
+    JournalEntry,
+    JournalLine,
+    OpeningBalance,
+)
+from .sequences import allocate_numbers
+from .signals import entries_changed
+
+# Account types closed to retained earnings at year end
+INCOME_STATEMENT_TYPES = ('RE', 'EX')
+
+
+class PeriodError(Exception):
+    """
+    Raised when a period or fiscal year cannot be closed or reopened
+    """
+
+
+def closed_through():
+    """
+    Returns the last day of the latest closed fiscal year, or None. Every
+    date up to it is closed, including years before the first closed one
+    that never had FiscalPeriod rows: their balances are already carried
+    forward in the opening balances.
+    """
+    opening = OpeningBalance.objects.aggregate(as_of=Max('as_of'))['as_of']
+    closing = JournalEntry.objects.filter(is_closing=True).aggregate(date=Max('date'))['date']
+    ends = [value for value in (opening and opening - timedelta(days=1), closing) if value is not None]
+    return max(ends) if ends else None
+
+
+def closed_periods(dates):
+    """
+    Returns the closed fiscal periods (first days) containing any of the given dates
+    """
+    periods = {period_start(value) for value in dates if value is not None}
+    if not periods:
+        return []
+    closed = set(
+        FiscalPeriod.objects.filter(period__in=periods, status='closed').values_list('period', flat=True)
+    )
+    end = closed_through()
+    if end is not None:
+        closed.update(period for period in periods if period <= end)
+    return sorted(closed)
+
+
+def closed_period_message(periods):
+    """
+    Error message for changes that touch closed periods
+    """
+    return f"Fiscal period {', '.join(f'{period:%Y-%m}' for period in periods)} is closed"
+
+
+def year_periods(year):
+    """
+    First days of the twelve fiscal periods of a year
+    """
+    return [date(year, month, 1) for month in range(1, 13)]
+
+
+def is_year_closed(year):
+    """
+    A fiscal year is closed once its balances have been carried forward
+    """
+    return OpeningBalance.objects.filter(as_of=date(year + 1, 1, 1)).exists() or \
+        JournalEntry.objects.filter(is_closing=True, date=date(year, 12, 31)).exists()
+
+
+def set_period_status(periods, status, user=None):
+    """
+    Mark fiscal periods open or closed, creating their rows as needed
+    """
+    closed = status == 'closed'
+    for period in periods:
+        FiscalPeriod.objects.update_or_create(
+            period=period,
+            defaults={
+                'status': status,
+                'closed_at': timezone.now() if closed else None,
+                'closed_by': user if closed else None,
+            }
+        )
+
+
+def close_period(period, user):
+    """
+    Lock a fiscal period against changes to its entries
+    """
+    period = period_start(period)
+    if JournalEntry.objects.filter(status='draft', date__gte=period, date__lt=next_period_start(period)).exists():
+        raise PeriodError(f"Post or delete the draft entries of {period:%Y-%m} before closing it")
+    set_period_status([period], 'closed', user)
+
+
+def reopen_period(period):
+    """
+    Unlock a fiscal period of a fiscal year that is still open
+    """
+    period = period_start(period)
+    through = closed_through()
+    if is_year_closed(period.year) or (through is not None and period <= through):
+        raise PeriodError(f"Fiscal year {period.year} is closed; reopen the year instead")
+    set_period_status([period], 'open')
+
+
+def close_year(year, user, retained_earnings=None):
+    """
+    Close a fiscal year: post a closing entry that moves the year's revenue
+    and expense balances to retained earnings, close its twelve periods and
+    carry every account's cumulative balance forward as opening balances of
+    the next year. Returns the closing entry, or None if there was nothing to close.
+    """
+    start, end = date(year, 1, 1), date(year, 12, 31)
+
+    with transaction.atomic():
+        through = closed_through()
+        if is_year_closed(year) or (through is not None and through >= start):
+            raise PeriodError(f"Fiscal year {year} is already closed")
+        # Every earlier year from the first posted entry on must be closed first, even without entries
+        first = JournalEntry.objects.filter(status__in=POSTED_STATUSES, date__lt=start).aggregate(
+            date=Min('date')
+        )['date']
+        if first is not None:
+            first_open = max(first.year, through.year + 1) if through is not None else first.year
+            if first_open < year:
+                raise PeriodError(f"Close fiscal year {first_open} first")
+        if JournalEntry.objects.filter(status='draft', date__gte=start, date__lte=end).exists():
+            raise PeriodError(f"Post or delete the draft entries of {year} before closing it")
+
+        if retained_earnings is None:
+            try:
+                retained_earnings = Account.objects.get(code=settings.RETAINED_EARNINGS_ACCOUNT_CODE)
+            except Account.DoesNotExist:
+                raise PeriodError(f"Retained earnings account {settings.RETAINED_EARNINGS_ACCOUNT_CODE} does not exist")
+
+        closing_entry = post_closing_entry(year, user, retained_earnings)
+        set_period_status(year_periods(year), 'closed', user)
+        carry_forward(year)
+        bump_ledger_version()
+    return closing_entry
+
+
+def post_closing_entry(year, user, retained_earnings):
+    """
+    Post the entry that brings every revenue and expense account of the year to zero
+    """
+    start, end = date(year, 1, 1), date(year, 12, 31)
+    totals = (
+        JournalLine.objects.filter(
+            entry__status__in=POSTED_STATUSES,
+            entry__date__gte=start,
+            entry__date__lte=end,
+            account__account_type__code__in=INCOME_STATEMENT_TYPES,
+        )
+        .order_by('account__code')
+        .values('account_id')
+        .annotate(debit=Sum('debit'), credit=Sum('credit'))
+    )
+
+    lines = []
+    net_income = ZERO
+    for row in totals:
+        net = (row['debit'] or ZERO) - (row['credit'] or ZERO)
+        if net:
+            lines.append(JournalLine(
+                account_id=row['account_id'],
+                debit=-net if net < 0 else ZERO,
+                credit=net if net > 0 else ZERO,
+            ))
+            net_income -= net
+    if not lines:
+        return None
+
+    lines.append(JournalLine(
+        account=retained_earnings,
+        debit=-net_income if net_income < 0 else ZERO,
+        credit=net_income if net_income > 0 else ZERO,
+    ))
+
+    entry = JournalEntry.objects.create(
+        entry_number=allocate_numbers('journal', year)[0],
+        date=end,
+        description=f"Year-end close {year}",
+        status='posted',
+        created_by=user,
+        posted_at=timezone.now(),
+        posted_by=user,
+        is_closing=True,
+    )
+    for line in lines:
+        line.entry = entry
+    JournalLine.objects.bulk_create(lines)
+    apply_balance_deltas(lines_balance_deltas(JournalLine.objects.filter(entry=entry)))
+    entries_changed.send(sender=JournalEntry, entry_ids=[entry.id], change='posted', user=user)
+    return entry
+
+
+def carry_forward(year):
+    """
+    Store each account's cumulative totals at the end of the year as opening
+    balances of the next year: the year's own opening balances (if any)
+    plus its period balances
+    """
+    start = date(year, 1, 1)
+    totals = defaultdict(lambda: [ZERO, ZERO])
+
+    periods = AccountPeriodBalance.objects.filter(period__lte=date(year, 12, 1))
+    if OpeningBalance.objects.filter(as_of=start).exists():
+        periods = periods.filter(period__gte=start)
+        for row in OpeningBalance.objects.filter(as_of=start).values('account_id', 'debit', 'credit'):
+            totals[row['account_id']][0] += row['debit']
+            totals[row['account_id']][1] += row['credit']
+
+    for row in periods.order_by().values('account_id').annotate(debit=Sum('debit'), credit=Sum('credit')):
+        totals[row['account_id']][0] += row['debit'] or ZERO
+        totals[row['account_id']][1] += row['credit'] or ZERO
+
+    OpeningBalance.objects.bulk_create(
+        [
+            OpeningBalance(account_id=account_id, as_of=date(year + 1, 1, 1), debit=debit, credit=credit)
+            for account_id, (debit, credit) in totals.items()
+            if debit or credit
+        ],
+        batch_size=1000
+    )
+
+
+def reopen_year(year, user=None):
+    """
+    Undo a year-end close: remove the carried-forward opening balances and
+    the closing entry, and reopen the year's periods. Later years must be
+    reopened first.
+    """
+    with transaction.atomic():
+        if not is_year_closed(year):
+            raise PeriodError(f"Fiscal year {year} is not closed")
+        if is_year_closed(year + 1):
+            raise PeriodError(f"Reopen fiscal year {year + 1} first")
+
+        OpeningBalance.objects.filter(as_of=date(year + 1, 1, 1)).delete()
+        closing_entries = JournalEntry.objects.filter(is_closing=True, date=date(year, 12, 31))
+        apply_balance_deltas(lines_balance_deltas(JournalLine.objects.filter(entry__in=closing_entries), sign=-1))
+        entries_changed.send(
+            sender=JournalEntry,
+            entry_ids=list(closing_entries.values_list('id', flat=True)),
+            change='deleted',
+            user=user,
+        )
+        closing_entries.delete()
+
+        set_period_status(year_periods(year), 'open')
+        bump_ledger_version()
@@ -0,0 +1,213 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .ledger import ZERO, apply_balance_deltas, lines_balance_deltas, period_start
+from .models import JournalEntry, JournalLine
+from .periods import closed_period_message, closed_periods
+from .sequences import allocate_numbers
+from .signals import entries_changed, entries_posted, entries_reversed, entries_unposted
+
+ENTRY_NUMBER_SERIES = 'journal'
+
+# Status an entry must be in for each posting action
+ALLOWED_STATUSES = {
+    'post': ('draft',),
+    'unpost': ('posted',),
+    'reverse': ('posted',),
+}
+
+
+class PostingError(Exception):
+    """
+    Raised when a posting batch cannot run; errors maps entry ids to reasons
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} journal entries cannot be processed")
+
+
+def lock_entries(entry_ids, action, reversal_date=None):
+    """
+    Lock the entries of a batch and check that they can take the action
+    """
+    entry_ids = sorted(set(entry_ids))
+    entries = list(
+        JournalEntry.objects.select_for_update().filter(id__in=entry_ids).order_by('id')
+    )
+    found = {entry.id: entry for entry in entries}
+
+    errors = {}
+    for entry_id in entry_ids:
+        entry = found.get(entry_id)
+        if entry is None:
+            errors[entry_id] = "Journal entry does not exist"
+        elif entry.status not in ALLOWED_STATUSES[action]:
+            errors[entry_id] = f"Cannot {action} a journal entry that is {entry.status}"
+        elif action == 'unpost' and entry.reversal_of_id:
+            errors[entry_id] = "A reversal cannot be unposted"
+        elif entry.is_closing:
+            errors[entry_id] = "Closing entries change only when their fiscal year is reopened"
+
+    # Entries change in their own period; reversals are added in the period of their date
+    dates = {entry.id: (reversal_date or entry.date) if action == 'reverse' else entry.date for entry in entries}
+    closed = set(closed_periods(dates.values()))
+    for entry_id, entry_date in dates.items():
+        if entry_id not in errors and period_start(entry_date) in closed:
+            errors[entry_id] = closed_period_message([period_start(entry_date)])
+
+    if errors:
+        raise PostingError(errors)
+    return entries
+
+
+def check_balanced(entry_ids):
+    """
+    Check in one query that every entry has lines, balances and only uses active accounts
+    """
+    totals = {
+        row['entry_id']: row
+        for row in JournalLine.objects.filter(entry_id__in=entry_ids)
+        .order_by()
+        .values('entry_id')
+        .annotate(
+            lines=Count('id'),
+            debit=Sum('debit'),
+            credit=Sum('credit'),
+            inactive=Count('id', filter=Q(account__is_active=False)),
+        )
+    }
+
+    errors = {}
+    for entry_id in entry_ids:
+        row = totals.get(entry_id)
+        if row is None:
+            errors[entry_id] = "Journal entry must have at least one line"
+        elif (row['debit'] or ZERO) != (row['credit'] or ZERO):
+            errors[entry_id] = "Journal entry must balance: total debits must equal total credits"
+        elif row['inactive']:
+            errors[entry_id] = "Journal entry uses inactive accounts"
+    if errors:
+        raise PostingError(errors)
+
+
+def number_entries(entries):
+    """
+    Give every unnumbered entry of the queryset the next number of the
+    journal series for its fiscal year, in date order
+    """
+    unnumbered = list(entries.filter(entry_number__isnull=True).order_by('date', 'id').only('id', 'date'))
+    by_year = defaultdict(list)
+    for entry in unnumbered:
+        by_year[entry.date.year].append(entry)
+
+    for fiscal_year, year_entries in by_year.items():
+        numbers = allocate_numbers(ENTRY_NUMBER_SERIES, fiscal_year, len(year_entries))
+        for entry, number in zip(year_entries, numbers):
+            entry.entry_number = number
+    JournalEntry.objects.bulk_update(unnumbered, ['entry_number'], batch_size=1000)
+
+
+def send_on_commit(signal, **kwargs):
+    """
+    Send a posting signal once the batch has committed
+    """
+    transaction.on_commit(lambda: signal.send(sender=JournalEntry, **kwargs))
+
+
+def post_entries(entry_ids, user):
+    """
+    Post draft entries as one atomic batch: lock them, validate them,
+    number and post them with single statements, and apply their balance
+    deltas once. Returns the number of entries posted.
+    """
+    with transaction.atomic():
+        entries = lock_entries(entry_ids, 'post')
+        ids = [entry.id for entry in entries]
+        check_balanced(ids)
+
+        batch = JournalEntry.objects.filter(id__in=ids)
+        number_entries(batch)
+        batch.update(status='posted', posted_at=timezone.now(), posted_by=user)
+
+        apply_balance_deltas(lines_balance_deltas(JournalLine.objects.filter(entry_id__in=ids)))
+        entries_changed.send(sender=JournalEntry, entry_ids=ids, change='posted', user=user)
+        send_on_commit(entries_posted, entry_ids=ids, user=user)
+    return len(ids)
+
+
+def unpost_entries(entry_ids, user):
+    """
+    Return posted entries to draft as one atomic batch, taking their lines
+    off the period balances. Reversed entries and reversals cannot be unposted.
+    """
+    with transaction.atomic():
+        entries = lock_entries(entry_ids, 'unpost')
+        ids = [entry.id for entry in entries]
+
+        apply_balance_deltas(lines_balance_deltas(JournalLine.objects.filter(entry_id__in=ids), sign=-1))
+        JournalEntry.objects.filter(id__in=ids).update(status='draft', posted_at=None, posted_by=None)
+        entries_changed.send(sender=JournalEntry, entry_ids=ids, change='unposted', user=user)
+        send_on_commit(entries_unposted, entry_ids=ids, user=user)
+    return len(ids)
+
+
+def reverse_entries(entry_ids, user, reversal_date=None):
+    """
+    Reverse posted entries as one atomic batch. Each gets a posted reversal
+    entry with debits and credits swapped, dated reversal_date (default the
+    original's date); the originals become reversed. Returns the reversals.
+    """
+    with transaction.atomic():
+        entries = lock_entries(entry_ids, 'reverse', reversal_date)
+        now = timezone.now()
+
+        reversals = JournalEntry.objects.bulk_create([
+            JournalEntry(
+                date=reversal_date or entry.date,
+                description=f"Reversal of {entry.entry_number}",
+                status='posted',
+                created_by=user,
+                posted_at=now,
+                posted_by=user,
+                reversal_of=entry,
+            )
+            for entry in entries
+        ])
+        reversal_for = {reversal.reversal_of_id: reversal for reversal in reversals}
+
+        JournalLine.objects.bulk_create(
+            [
+                JournalLine(
+                    entry=reversal_for[line['entry_id']],
+                    account_id=line['account_id'],
+                    debit=line['credit'],
+                    credit=line['debit'],
+                    reference=line['reference'],
+                )
+                for line in JournalLine.objects.filter(entry__in=entries)
+                .order_by('entry_id', 'id')
+                .values('entry_id', 'account_id', 'debit', 'credit', 'reference')
+                .iterator(chunk_size=2000)
+            ],
+            batch_size=2000
+        )
+
+        reversal_ids = [reversal.id for reversal in reversals]
+        number_entries(JournalEntry.objects.filter(id__in=reversal_ids))
+        JournalEntry.objects.filter(id__in=[entry.id for entry in entries]).update(status='reversed')
+
+        apply_balance_deltas(lines_balance_deltas(JournalLine.objects.filter(entry_id__in=reversal_ids)))
+        entries_changed.send(
+            sender=JournalEntry, entry_ids=[entry.id for entry in entries], change='reversed', user=user
+        )
+        entries_changed.send(sender=JournalEntry, entry_ids=reversal_ids, change='posted', user=user)
+        send_on_commit(
+            entries_reversed,
+            entry_ids=[entry.id for entry in entries],
+            reversal_ids=reversal_ids,
+            user=user,
+        )
+    return JournalEntry.objects.filter(id__in=reversal_ids).order_by('id')
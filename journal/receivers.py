@@ -0,0 +1,11 @@
+from django.dispatch import receiver
+
+from .models import JournalEntry, LedgerChange
+from .signals import entries_changed
+
+
+@receiver(entries_changed, sender=JournalEntry)
+def record_ledger_changes(sender, entry_ids, **kwargs):
+    LedgerChange.objects.bulk_create(
+        [LedgerChange(entry_id=entry_id) for entry_id in entry_ids], batch_size=1000
+    )
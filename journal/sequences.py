@@ -0,0 +1,203 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+
+from .models import NumberSequence
+
+
+def get_sequence(series, fiscal_year, lock=False):
+    """
+    Returns the sequence row of a series and year, creating it from the
+    NUMBER_SEQUENCES settings on first use
+    """
+    queryset = NumberSequence.objects.select_for_update() if lock else NumberSequence.objects
+    try:
+        return queryset.get(series=series, fiscal_year=fiscal_year)
+    except NumberSequence.DoesNotExist:
+        pass
+
+    defaults = settings.NUMBER_SEQUENCES.get(series, {})
+    try:
+        with transaction.atomic():
+            NumberSequence.objects.create(
+                series=series,
+                fiscal_year=fiscal_year,
+                prefix=defaults.get('prefix', ''),
+                gapless=defaults.get('gapless', False),
+                **{key: defaults[key] for key in ('padding', 'block_size') if key in defaults}
+            )
+    except IntegrityError:
+        # Another writer created it first
+        pass
+    return queryset.get(series=series, fiscal_year=fiscal_year)
+
+
+def series_pattern(series):
+    """
+    Returns a regular expression matching every number a series hands out,
+    in any fiscal year
+    """
+    prefixes = set(NumberSequence.objects.filter(series=series).values_list('prefix', flat=True))
+    prefixes.add(settings.NUMBER_SEQUENCES.get(series, {}).get('prefix', ''))
+    alternatives = '|'.join(re.escape(prefix) for prefix in sorted(prefixes))
+    return re.compile(rf'(?:{alternatives})\d{{4}}-\d+')
+
+
+class SequenceAllocator:
+    """
+    Hands out document numbers. For ordinary series each allocator reserves
+    a block of values under a row lock and serves numbers from it in
+    memory, so concurrent writers rarely touch the same row; numbers left in
+    a block when the process exits are skipped. Gapless series take each
+    number under a row lock held until the caller's transaction ends, so a
+    rollback returns it and the series has no holes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.blocks = {}
+        # Thread whose own database connection reserves blocks
+        self.executor = None
+
+    def allocate(self, series, fiscal_year, count=1):
+        """
+        Returns count consecutive-in-order numbers of a series and year
+        """
+        if count < 1:
+            return []
+
+        key = (series, fiscal_year)
+        numbers = []
+        while True:
+            with self.lock:
+                block = self.blocks.get(key)
+                if block is not None and block['gapless']:
+                    break
+                if block is not None:
+                    numbers.extend(self._take(block, count - len(numbers)))
+                if len(numbers) == count:
+                    return numbers
+
+            # Reserved without holding the lock, so other threads keep taking
+            # numbers from the current block during the database round-trip
+            reserved = self._reserve_block(series, fiscal_year, count - len(numbers))
+            with self.lock:
+                current = self.blocks.get(key)
+                if reserved['gapless']:
+                    self.blocks[key] = reserved
+                    break
+                numbers.extend(self._take(reserved, count - len(numbers)))
+                # Another thread may have put a block in use meanwhile; the
+                # rest of this one is then skipped
+                if current is None or current['gapless'] or current['next'] >= current['end']:
+                    self.blocks[key] = reserved
+                if len(numbers) == count:
+                    return numbers
+
+        return self._allocate_gapless(series, fiscal_year, count)
+
+    @staticmethod
+    def _take(block, count):
+        """
+        Take up to count numbers from a block
+        """
+        take = min(count, block['end'] - block['next'])
+        numbers = [block['format'](value) for value in range(block['next'], block['next'] + take)]
+        block['next'] += take
+        return numbers
+
+    def _reserve_block(self, series, fiscal_year, needed):
+        """
+        Move the sequence past a block of values and return it. Inside a
+        transaction the block is reserved on a separate connection and
+        committed at once, so rolling back the caller's transaction cannot
+        make the database hand the same block out again. Databases without
+        row locks (SQLite) only reserve what is needed, in the caller's transaction.
+        """
+        caller_connection = transaction.get_connection()
+        if not caller_connection.in_atomic_block:
+            return self._reserve_block_now(series, fiscal_year, needed)
+        if not caller_connection.features.has_select_for_update:
+            return self._reserve_block_now(series, fiscal_year, needed, exact=True)
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sequence-blocks')
+        return self.executor.submit(self._reserve_block_apart, series, fiscal_year, needed).result()
+
+    @staticmethod
+    def _reserve_block_apart(series, fiscal_year, needed):
+        """
+        Reserve a block on the executor thread's own connection. No request
+        cycle cleans that connection up, so it is checked here like at the
+        start of a request, and dropped after an error so that the next
+        reservation reconnects after a database restart or failover.
+        """
+        close_old_connections()
+        try:
+            return SequenceAllocator._reserve_block_now(series, fiscal_year, needed)
+        except Exception:
+            connection.close()
+            raise
+
+    def close(self):
+        """
+        Close the reservation thread's connection and stop the thread
+        """
+        if self.executor is not None:
+            # Looked up on the executor thread, whose connection it is
+            self.executor.submit(lambda: connection.close()).result()
+            self.executor.shutdown()
+            self.executor = None
+
+    @staticmethod
+    def _reserve_block_now(series, fiscal_year, needed, exact=False):
+        with transaction.atomic():
+            sequence = get_sequence(series, fiscal_year, lock=True)
+            if sequence.gapless:
+                return {'gapless': True}
+            start = sequence.next_value
+            sequence.next_value = start + (needed if exact else max(sequence.block_size, needed))
+            sequence.save(update_fields=['next_value'])
+        return {
+            'gapless': False,
+            'next': start,
+            'end': sequence.next_value,
+            'format': sequence.format,
+        }
+
+    def _allocate_gapless(self, series, fiscal_year, count):
+        """
+        Take numbers straight from the locked sequence row. The lock is held,
+        and a rollback returns the numbers, until the caller's transaction ends.
+        """
+        if not transaction.get_connection().in_atomic_block:
+            raise RuntimeError("Gapless numbers must be allocated inside the transaction that uses them")
+
+        with transaction.atomic():
+            sequence = get_sequence(series, fiscal_year, lock=True)
+            start = sequence.next_value
+            sequence.next_value = start + count
+            sequence.save(update_fields=['next_value'])
+
+        self.blocks[(series, fiscal_year)] = {'gapless': sequence.gapless}
+        return [sequence.format(value) for value in range(start, start + count)]
+
+
+# Shared by every thread of this process
+allocator = SequenceAllocator()
+
+
+def allocate_numbers(series, fiscal_year, count=1):
+    """
+    Returns count new numbers of a series and fiscal year
+    """
+    return allocator.allocate(series, fiscal_year, count)
+
+
+def next_number(series, fiscal_year):
+    """
+    Returns one new number of a series and fiscal year
+    """
+    return allocator.allocate(series, fiscal_year)[0]
@@ -1,9 +1,38 @@
+from django.db import transaction
 from rest_framework import serializers
 
-from .models import JournalEntry, JournalLine
+from accounts.models import AuditLog
+from coa.models import Account
+from coa.registry import registry
+
+from .changes import apply_line_changes
+from .ledger import apply_balance_deltas, entry_balance_deltas, subtract_deltas
+from .models import FiscalPeriod, JournalEntry, JournalLine
+from .periods import closed_period_message, closed_periods
+from .signals import entries_changed
+
+
+class RegistryAccountField(serializers.PrimaryKeyRelatedField):
+    """
+    Account reference resolved from the account registry rather than with
+    one query per line
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            account = registry.instance(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if account is None:
+            self.fail('does_not_exist', pk_value=data)
+        return account
 
 
 class JournalLineSerializer(serializers.ModelSerializer):
+    # Writable so that updates can refer to existing lines
+    id = serializers.IntegerField(required=False)
+    account = RegistryAccountField(queryset=Account.objects.all())
     account_display = serializers.StringRelatedField(source='account', read_only=True)
     
     class Meta:
@@ -11,6 +40,26 @@ class JournalLineSerializer(serializers.ModelSerializer):
         fields = ['id', 'account', 'account_display', 'debit', 'credit', 'reference']
 
 
+class TransactionSerializer(serializers.Serializer):
+    """
+    A posted journal line with its entry and account columns, read from
+    the values() rows of the transactions API
+    """
+    id = serializers.IntegerField(read_only=True)
+    entry_id = serializers.IntegerField(read_only=True)
+    entry_number = serializers.CharField(read_only=True)
+    date = serializers.DateField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    description = serializers.CharField(read_only=True)
+    account_id = serializers.IntegerField(read_only=True)
+    account_code = serializers.CharField(read_only=True)
+    account_name = serializers.CharField(read_only=True)
+    debit = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    credit = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    reference = serializers.CharField(read_only=True)
+
+
 class JournalEntrySerializer(serializers.ModelSerializer):
     lines = JournalLineSerializer(many=True)
     created_by_display = serializers.StringRelatedField(source='created_by', read_only=True)
@@ -21,9 +70,11 @@ class JournalEntrySerializer(serializers.ModelSerializer):
         model = JournalEntry
         fields = [
             'id', 'entry_number', 'date', 'description', 'status', 
-            'created_by', 'created_by_display', 'lines', 'total_debit', 'total_credit'
+            'created_by', 'created_by_display', 'lines', 'total_debit', 'total_credit',
+            'posted_at', 'posted_by', 'reversal_of', 'is_closing'
         ]
-        read_only_fields = ['created_by']
+        # Status changes go through the posting actions
+        read_only_fields = ['created_by', 'status', 'posted_at', 'posted_by', 'reversal_of', 'is_closing']
     
     def get_total_debit(self, obj):
         return sum(line.debit for line in obj.lines.all())
@@ -35,6 +86,15 @@ class JournalEntrySerializer(serializers.ModelSerializer):
         """
         Check that the total debits equal total credits (balanced entry)
         """
+        if self.instance is not None and (self.instance.status == 'reversed' or self.instance.reversal_of_id):
+            raise serializers.ValidationError("Reversed entries and reversals cannot be edited")
+        if self.instance is not None and self.instance.is_closing:
+            raise serializers.ValidationError("Closing entries change only when their fiscal year is reopened")
+        
+        closed = closed_periods([data.get('date'), self.instance.date if self.instance else None])
+        if closed:
+            raise serializers.ValidationError(closed_period_message(closed))
+        
         lines = data.get('lines', [])
         if not lines:
             raise serializers.ValidationError("Journal entry must have at least one line")
@@ -44,9 +104,21 @@ class JournalEntrySerializer(serializers.ModelSerializer):
         
         if total_debit != total_credit:
             raise serializers.ValidationError("Journal entry must balance: total debits must equal total credits")
+        
+        line_ids = [line['id'] for line in lines if line.get('id')]
+        if len(line_ids) != len(set(line_ids)):
+            raise serializers.ValidationError("Each existing line may appear only once")
+        if line_ids:
+            own_ids = set(self.instance.lines.values_list('id', flat=True)) if self.instance else set()
+            unknown = sorted(set(line_ids) - own_ids)
+            if unknown:
+                raise serializers.ValidationError(
+                    f"Lines {', '.join(map(str, unknown))} do not belong to this journal entry"
+                )
             
         return data
     
+    @transaction.atomic
     def create(self, validated_data):
         lines_data = validated_data.pop('lines')
         
@@ -59,23 +131,91 @@ class JournalEntrySerializer(serializers.ModelSerializer):
         # Create the journal lines
         for line_data in lines_data:
             JournalLine.objects.create(entry=journal_entry, **line_data)
+        
+        # Add posted lines to the period balances
+        apply_balance_deltas(entry_balance_deltas(journal_entry))
+        entries_changed.send(
+            sender=JournalEntry, entry_ids=[journal_entry.id], change='created', user=validated_data['created_by']
+        )
             
         return journal_entry
     
+    @transaction.atomic
     def update(self, instance, validated_data):
         lines_data = validated_data.pop('lines', None)
+        state_before = (instance.status, instance.date)
+        
+        if lines_data is None:
+            # Remember what the entry contributed to the period balances
+            balances_before = entry_balance_deltas(instance)
         
         # Update the journal entry fields
+        changed_fields = {
+            attr: str(value) for attr, value in validated_data.items()
+            if getattr(instance, attr) != value
+        }
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
         
-        if lines_data is not None:
-            # Delete existing lines
-            instance.lines.all().delete()
-            
-            # Create new lines
-            for line_data in lines_data:
-                JournalLine.objects.create(entry=instance, **line_data)
+        if lines_data is None:
+            # Apply the difference to the period balances
+            apply_balance_deltas(subtract_deltas(entry_balance_deltas(instance), balances_before))
+            self.line_changes = None
+        else:
+            # Write only the lines that changed and apply only their delta
+            self.line_changes = apply_line_changes(instance, lines_data)
+            apply_balance_deltas(self.line_changes.balance_deltas(state_before, (instance.status, instance.date)))
+        
+        if changed_fields or self.line_changes:
+            self.log_update(instance, changed_fields, self.line_changes)
+            request = self.context.get('request')
+            entries_changed.send(
+                sender=JournalEntry, entry_ids=[instance.id], change='updated', user=request and request.user
+            )
                 
-        return instance
\ No newline at end of file
+        return instance
+    
+    def log_update(self, instance, changed_fields, line_changes):
+        """
+        Record the changed entry fields and the line change set in the audit log
+        """
+        request = self.context.get('request')
+        AuditLog.objects.create(
+            user=request.user if request and request.user.is_authenticated else None,
+            action='update',
+            model_name='JournalEntry',
+            object_id=str(instance.pk),
+            object_repr=str(instance)[:200],
+            ip_address=request.META.get('REMOTE_ADDR') if request else None,
+            user_agent=request.META.get('HTTP_USER_AGENT', '') if request else '',
+            details={
+                'fields': changed_fields,
+                'lines': line_changes.as_dict() if line_changes else None,
+            },
+        )
+
+
+class PostingBatchSerializer(serializers.Serializer):
+    """
+    Input of the batch posting actions
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    date = serializers.DateField(required=False, help_text="Date of the reversal entries")
+
+
+class FiscalPeriodSerializer(serializers.ModelSerializer):
+    closed_by_display = serializers.StringRelatedField(source='closed_by', read_only=True)
+    
+    class Meta:
+        model = FiscalPeriod
+        fields = ['id', 'period', 'status', 'closed_at', 'closed_by', 'closed_by_display']
+        read_only_fields = fields
+
+
+class PeriodCloseSerializer(serializers.Serializer):
+    """
+    Input of the period actions: a date within the period, or a fiscal year
+    """
+    period = serializers.DateField(required=False)
+    year = serializers.IntegerField(required=False, min_value=1900, max_value=9999)
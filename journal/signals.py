@@ -0,0 +1,13 @@
+from django.dispatch import Signal
+
+# Sent once per posting batch after its transaction commits, with entry_ids
+# (and reversal_ids for entries_reversed) and the user who ran the batch
+entries_posted = Signal()
+entries_unposted = Signal()
+entries_reversed = Signal()
+
+# Sent inside the transaction that changes entries, with entry_ids, the
+# change (created, updated, deleted, imported, posted, unposted or reversed)
+# and the user. Receivers write in the same transaction, so their rows commit
+# or roll back with the change; deletions are sent before the rows go.
+entries_changed = Signal()
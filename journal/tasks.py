@@ -0,0 +1,52 @@
+from celery import chord, group, shared_task
+
+from .integrity import fail_run, finish_run, pending_chunk_ids, plan_run, run_chunk
+from .models import IntegrityRun
+
+
+@shared_task
+def verify_ledger_integrity(chunk_size=None, run_id=None):
+    """
+    Check the ledger in parallel: one subtask per entry id range, then a
+    final comparison of the stored aggregates. Pass run_id to resume a run
+    from its finished chunks.
+    """
+    if run_id is None:
+        run = plan_run(chunk_size) if chunk_size else plan_run()
+    else:
+        run = IntegrityRun.objects.get(id=run_id)
+        IntegrityRun.objects.filter(id=run.id).update(status='running', error='')
+
+    chunk_ids = pending_chunk_ids(run)
+    if not chunk_ids:
+        finish_integrity_run.delay(run.id)
+        return run.id
+
+    callback = finish_integrity_run.si(run.id).on_error(mark_integrity_run_failed.s(run.id))
+    chord(group(verify_integrity_chunk.s(chunk_id) for chunk_id in chunk_ids))(callback)
+    return run.id
+
+
+@shared_task
+def verify_integrity_chunk(chunk_id):
+    """
+    Celery task checking one entry id range of an integrity run
+    """
+    return run_chunk(chunk_id)
+
+
+@shared_task
+def finish_integrity_run(run_id):
+    """
+    Celery task merging the chunks of an integrity run into its report
+    """
+    report = finish_run(IntegrityRun.objects.get(id=run_id))
+    return {'run_id': run_id, 'discrepancy_count': report['discrepancy_count']}
+
+
+@shared_task
+def mark_integrity_run_failed(request, exc, traceback, run_id):
+    """
+    Error callback marking an integrity run as failed; it can be resumed
+    """
+    fail_run(run_id, str(exc))
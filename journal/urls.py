@@ -1,12 +1,14 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import JournalEntryViewSet, JournalLineViewSet
+from .views import FiscalPeriodViewSet, JournalEntryViewSet, JournalLineViewSet, TransactionViewSet
 
 # Create a router and register our viewsets with it
 router = DefaultRouter()
 router.register(r'entries', JournalEntryViewSet)
 router.register(r'lines', JournalLineViewSet)
+router.register(r'periods', FiscalPeriodViewSet)
+router.register(r'transactions', TransactionViewSet, basename='transaction')
 
 # The API URLs are determined automatically by the router
 urlpatterns = [
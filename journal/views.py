@@ -1,10 +1,32 @@
+import codecs
+
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, permissions, viewsets
+from rest_framework import filters, mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 
 from accounts.permissions import IsAccountant
+from amrs.pagination import KeysetPagination
+from reports.exports import EXPORT_CONTENT_TYPES, iter_export
 
-from .models import JournalEntry, JournalLine
-from .serializers import JournalEntrySerializer, JournalLineSerializer
+from .filters import TransactionFilter
+from .importers import IMPORT_FORMATS, IMPORT_STATUSES, JournalImporter
+from .models import POSTED_STATUSES, FiscalPeriod, JournalEntry, JournalLine
+from .periods import PeriodError, close_period, close_year, reopen_period, reopen_year
+from .posting import PostingError, post_entries, reverse_entries, unpost_entries
+from .serializers import (
+    FiscalPeriodSerializer,
+    JournalEntrySerializer,
+    JournalLineSerializer,
+    PeriodCloseSerializer,
+    PostingBatchSerializer,
+    TransactionSerializer,
+)
+from .signals import entries_changed
 
 
 class JournalEntryViewSet(viewsets.ModelViewSet):
@@ -14,19 +36,243 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
     queryset = JournalEntry.objects.all().order_by('-date', '-id')
     serializer_class = JournalEntrySerializer
     permission_classes = [permissions.IsAuthenticated, IsAccountant]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['status', 'date', 'created_by']
     search_fields = ['entry_number', 'description']
     ordering_fields = ['entry_number', 'date', 'status']
+    ordering = ['-date', '-id']
+    
+    def perform_destroy(self, instance):
+        if instance.status != 'draft':
+            raise ValidationError("Only draft journal entries can be deleted; unpost or reverse posted entries")
+        with transaction.atomic():
+            entries_changed.send(
+                sender=JournalEntry, entry_ids=[instance.id], change='deleted', user=self.request.user
+            )
+            instance.delete()
+    
+    def run_posting(self, request, action_name):
+        """
+        Validate a batch request and run a posting action on it
+        """
+        serializer = PostingBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        
+        try:
+            if action_name == 'post':
+                return Response({'posted': post_entries(ids, request.user)})
+            if action_name == 'unpost':
+                return Response({'unposted': unpost_entries(ids, request.user)})
+            reversals = reverse_entries(ids, request.user, serializer.validated_data.get('date'))
+            return Response({'reversed': len(ids), 'reversals': [
+                {'id': reversal.id, 'entry_number': reversal.entry_number, 'reversal_of': reversal.reversal_of_id}
+                for reversal in reversals
+            ]})
+        except PostingError as e:
+            return Response(
+                {'error': str(e), 'entries': {str(entry_id): message for entry_id, message in e.errors.items()}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    @action(detail=False, methods=['post'], url_path='post')
+    def post_batch(self, request):
+        """
+        Post a batch of draft entries atomically. Body: {"ids": [...]}
+        """
+        return self.run_posting(request, 'post')
+    
+    @action(detail=False, methods=['post'], url_path='unpost')
+    def unpost_batch(self, request):
+        """
+        Return a batch of posted entries to draft atomically. Body: {"ids": [...]}
+        """
+        return self.run_posting(request, 'unpost')
+    
+    @action(detail=False, methods=['post'], url_path='reverse')
+    def reverse_batch(self, request):
+        """
+        Reverse a batch of posted entries atomically. Body: {"ids": [...], "date": optional reversal date}
+        """
+        return self.run_posting(request, 'reverse')
+    
+    @action(detail=False, methods=['post'], url_path='bulk-import')
+    def bulk_import(self, request):
+        """
+        Import entries from NDJSON or CSV, sent as the request body or as a
+        multipart upload named file. Accepts input (ndjson or csv) and
+        default_status. Invalid entries are reported per row; the rest are imported.
+        """
+        import_format = request.query_params.get('input')
+        if import_format is None:
+            import_format = 'csv' if 'csv' in (request.content_type or '') else 'ndjson'
+        if import_format not in IMPORT_FORMATS:
+            return Response(
+                {'error': f"Unsupported input format '{import_format}'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        default_status = request.query_params.get('default_status', 'draft')
+        if default_status not in IMPORT_STATUSES:
+            return Response(
+                {'error': f"default_status must be one of: {', '.join(IMPORT_STATUSES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if (request.content_type or '').startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+            source = upload.file
+        else:
+            source = request.stream
+            if source is None:
+                return Response({'error': 'Request body is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        stream = codecs.iterdecode(source, 'utf-8')
+        result = JournalImporter(request.user, default_status).run(stream, import_format)
+        return Response(result.as_dict())
 
 
 class JournalLineViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for journal lines (read-only)
     """
-    queryset = JournalLine.objects.all()
+    queryset = JournalLine.objects.select_related('account')
     serializer_class = JournalLineSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['entry', 'account']
-    ordering_fields = ['entry__date', 'entry__entry_number', 'account__code']
\ No newline at end of file
+    ordering_fields = ['entry__date', 'entry__entry_number', 'account__code']
+    ordering = ['-entry__date', '-id']
+
+
+# Columns of the transactions API, joined from the entry and account
+TRANSACTION_COLUMNS = {
+    'entry_number': F('entry__entry_number'),
+    'date': F('entry__date'),
+    'status': F('entry__status'),
+    'description': F('entry__description'),
+    'account_code': F('account__code'),
+    'account_name': F('account__name'),
+    'amount': F('debit') + F('credit'),
+}
+
+TRANSACTION_FIELDS = [
+    'id', 'entry_id', 'entry_number', 'date', 'status', 'description',
+    'account_id', 'account_code', 'account_name', 'debit', 'credit', 'amount', 'reference',
+]
+
+
+class TransactionViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    API endpoint for ledger transactions: journal lines of posted entries
+    (or of the statuses in status) filtered by date and amount ranges,
+    accounts or an account subtree (under), read as projected rows in one
+    joined query
+    """
+    serializer_class = TransactionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_class = TransactionFilter
+    ordering_fields = ['date', 'amount', 'account_code']
+    ordering = ['-date', '-id']
+    
+    def get_queryset(self):
+        queryset = JournalLine.objects.annotate(**TRANSACTION_COLUMNS)
+        if not self.request.query_params.get('status'):
+            queryset = queryset.filter(status__in=POSTED_STATUSES)
+        return queryset.values(*TRANSACTION_FIELDS)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream every filtered transaction as NDJSON or CSV (output), without pagination
+        """
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_CONTENT_TYPES:
+            return Response(
+                {'error': f"Unsupported output format '{export_format}'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rows = self.filter_queryset(self.get_queryset()).iterator(chunk_size=2000)
+        response = StreamingHttpResponse(
+            iter_export(rows, export_format, TRANSACTION_FIELDS),
+            content_type=EXPORT_CONTENT_TYPES[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="transactions.{export_format}"'
+        return response
+
+
+class FiscalPeriodViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for fiscal periods and the period and year-end close
+    """
+    queryset = FiscalPeriod.objects.all()
+    serializer_class = FiscalPeriodSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAccountant]
+    filterset_fields = ['status']
+    
+    def run_close(self, request, field, operation):
+        """
+        Validate the period or year of a request and run a close operation on it
+        """
+        serializer = PeriodCloseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        value = serializer.validated_data.get(field)
+        if value is None:
+            return Response({field: ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            result = operation(value)
+        except PeriodError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+    
+    @action(detail=False, methods=['post'])
+    def close(self, request):
+        """
+        Close the fiscal period containing a date. Body: {"period": "YYYY-MM-DD"}
+        """
+        def operation(period):
+            close_period(period, request.user)
+            return {'status': f"Fiscal period {period:%Y-%m} closed"}
+        return self.run_close(request, 'period', operation)
+    
+    @action(detail=False, methods=['post'])
+    def reopen(self, request):
+        """
+        Reopen the fiscal period containing a date. Body: {"period": "YYYY-MM-DD"}
+        """
+        def operation(period):
+            reopen_period(period)
+            return {'status': f"Fiscal period {period:%Y-%m} reopened"}
+        return self.run_close(request, 'period', operation)
+    
+    @action(detail=False, methods=['post'], url_path='close-year')
+    def close_fiscal_year(self, request):
+        """
+        Close a fiscal year: post its closing entry, lock its periods and
+        carry balances forward. Body: {"year": 2024}
+        """
+        def operation(year):
+            entry = close_year(year, request.user)
+            return {
+                'status': f"Fiscal year {year} closed",
+                'closing_entry': entry.id if entry else None,
+            }
+        return self.run_close(request, 'year', operation)
+    
+    @action(detail=False, methods=['post'], url_path='reopen-year')
+    def reopen_fiscal_year(self, request):
+        """
+        Undo the close of a fiscal year. Body: {"year": 2024}
+        """
+        def operation(year):
+            reopen_year(year, request.user)
+            return {'status': f"Fiscal year {year} reopened"}
+        return self.run_close(request, 'year', operation)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import ReportTemplate, SavedReport
+from .models import ReportTemplate, SavedReport, SavedReportChunk
 
 
 @admin.register(ReportTemplate)
@@ -16,12 +16,21 @@ class ReportTemplateAdmin(admin.ModelAdmin):
         obj.save()
 
 
+class SavedReportChunkInline(admin.TabularInline):
+    model = SavedReportChunk
+    fields = ('section', 'page', 'row_count')
+    readonly_fields = ('section', 'page', 'row_count')
+    extra = 0
+    can_delete = False
+
+
 @admin.register(SavedReport)
 class SavedReportAdmin(admin.ModelAdmin):
     list_display = ('name', 'template', 'status', 'created_by', 'created_at')
     list_filter = ('status', 'template__report_type', 'created_at')
     search_fields = ('name',)
     readonly_fields = ('created_by', 'created_at', 'status', 'error_message', 'result_data')
+    inlines = [SavedReportChunkInline]
     
     def save_model(self, request, obj, form, change):
         if not obj.created_by:
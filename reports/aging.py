@@ -0,0 +1,162 @@
+from datetime import timedelta
+
+from django.db.models import Case, CharField, Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from invoices.models import Invoice, Payment
+
+from .balances import ZERO, to_date
+
+RECEIVABLE = 'receivable'
+PAYABLE = 'payable'
+
+# Aging report types and the side of the invoices they cover
+AGING_REPORT_TYPES = {
+    'ar_aging': RECEIVABLE,
+    'ap_aging': PAYABLE,
+}
+
+# Invoices that are not (or no longer) owed
+AGING_EXCLUDED_STATUSES = ('draft', 'cancelled')
+
+# (bucket, first day past due, last day past due); the open ends are current and over 120 days
+AGING_BUCKETS = (
+    ('current', None, 0),
+    ('days_1_30', 1, 30),
+    ('days_31_60', 31, 60),
+    ('days_61_90', 61, 90),
+    ('days_91_120', 91, 120),
+    ('over_120', 121, None),
+)
+
+BUCKET_NAMES = [name for name, _, _ in AGING_BUCKETS]
+
+
+def bucket_filters(as_of_date, field='due_date'):
+    """
+    Returns [(bucket, filter)] on the due date, with the day boundaries
+    turned into dates so the database only compares dates
+    """
+    filters = []
+    for name, first, last in AGING_BUCKETS:
+        bucket_filter = Q()
+        if first is not None:
+            bucket_filter &= Q(**{f'{field}__lte': as_of_date - timedelta(days=first)})
+        if last is not None:
+            bucket_filter &= Q(**{f'{field}__gte': as_of_date - timedelta(days=last)})
+        filters.append((name, bucket_filter))
+    return filters
+
+
+def open_invoices(side, as_of_date, party=None):
+    """
+    Invoices of one side with their outstanding amount as of a date: the
+    total less the payments made up to that date, summed in a correlated
+    subquery. Invoices have no issue date, so those created after the date
+    are left out by their creation date. AP invoices are those with a vendor and are grouped by it;
+    AR invoices by customer.
+    """
+    paid = (
+        Payment.objects.filter(invoice=OuterRef('pk'), payment_date__lte=as_of_date)
+        .order_by()
+        .values('invoice')
+        .annotate(amount=Sum('amount'))
+        .values('amount')
+    )
+    invoices = Invoice.objects.filter(created_at__date__lte=as_of_date).exclude(status__in=AGING_EXCLUDED_STATUSES)
+    if side == PAYABLE:
+        invoices = invoices.exclude(vendor__isnull=True).exclude(vendor='').annotate(party=F('vendor'))
+    else:
+        invoices = invoices.filter(Q(vendor__isnull=True) | Q(vendor='')).annotate(party=F('customer'))
+    if party:
+        invoices = invoices.filter(party=party)
+
+    amount = DecimalField(max_digits=12, decimal_places=2)
+    return invoices.annotate(
+        paid=Coalesce(Subquery(paid, output_field=amount), Value(ZERO), output_field=amount),
+        outstanding=F('total') - F('paid'),
+    ).exclude(outstanding=0)
+
+
+def empty_totals():
+    return {'invoice_count': 0, **dict.fromkeys(BUCKET_NAMES, ZERO), 'total': ZERO}
+
+
+def add_totals(totals, row):
+    totals['invoice_count'] += row['invoice_count']
+    for name in BUCKET_NAMES + ['total']:
+        totals[name] += row[name]
+
+
+def aging_summary(invoices, as_of_date):
+    """
+    Outstanding amounts per party and bucket, in one grouped query
+    """
+    aggregates = {
+        name: Coalesce(Sum('outstanding', filter=bucket_filter), Value(ZERO))
+        for name, bucket_filter in bucket_filters(as_of_date)
+    }
+    rows = (
+        invoices.order_by()
+        .values('party')
+        .annotate(invoice_count=Count('id'), **aggregates, total=Sum('outstanding'))
+        .order_by('party')
+    )
+    parties = []
+    totals = empty_totals()
+    for row in rows:
+        parties.append(row)
+        add_totals(totals, row)
+    return parties, totals
+
+
+def aging_detail(invoices, as_of_date):
+    """
+    Outstanding invoices with their bucket, grouped per party with subtotals,
+    read in one query ordered by party and due date
+    """
+    bucket = Case(
+        *[When(bucket_filter, then=Value(name)) for name, bucket_filter in bucket_filters(as_of_date)],
+        output_field=CharField(),
+    )
+    rows = (
+        invoices.annotate(bucket=bucket)
+        .order_by('party', 'due_date', 'id')
+        .values('id', 'invoice_number', 'party', 'due_date', 'status', 'total', 'paid', 'outstanding', 'bucket')
+    )
+    parties = []
+    totals = empty_totals()
+    for row in rows.iterator(chunk_size=2000):
+        if not parties or parties[-1]['party'] != row['party']:
+            parties.append({'party': row['party'], **empty_totals(), 'invoices': []})
+        group = parties[-1]
+        row['days_overdue'] = max((as_of_date - row['due_date']).days, 0)
+        group['invoices'].append(row)
+        group['invoice_count'] += 1
+        group[row['bucket']] += row['outstanding']
+        group['total'] += row['outstanding']
+    for group in parties:
+        add_totals(totals, group)
+    return parties, totals
+
+
+def compute_aging(side, as_of_date=None, detail=False, party=None):
+    """
+    Returns the AR or AP aging as of a date: outstanding invoice amounts by
+    customer or vendor in current, 1-30, 31-60, 61-90, 91-120 and over 120
+    days past due. The summary mode has one row per party; the detail mode
+    adds each party's invoices.
+    """
+    as_of_date = to_date(as_of_date) or timezone.localdate()
+    invoices = open_invoices(side, as_of_date, party)
+    parties, totals = (aging_detail if detail else aging_summary)(invoices, as_of_date)
+    return {
+        'as_of_date': as_of_date,
+        'side': side,
+        'party_field': 'vendor' if side == PAYABLE else 'customer',
+        'mode': 'detail' if detail else 'summary',
+        'buckets': BUCKET_NAMES,
+        'parties': parties,
+        'totals': totals,
+    }
@@ -0,0 +1,322 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Max, Q, Sum
+from django.utils.dateparse import parse_date
+
+from coa.models import Account
+from coa.registry import registry
+from journal.ledger import is_period_end, next_period_start, period_start
+from journal.models import POSTED_STATUSES, AccountPeriodBalance, JournalLine, OpeningBalance
+
+# Debit increases the balance of asset and expense accounts,
+# credit increases the balance of liability, equity and revenue accounts
+DEBIT_NORMAL_TYPES = ('AS', 'EX')
+
+ZERO = Decimal('0.00')
+
+TOTAL_FIELDS = ('opening_debit', 'opening_credit', 'period_debit', 'period_credit')
+
+
+def natural_balance(account_type_code, debit, credit):
+    """
+    Returns a balance signed by the normal side of the account type
+    """
+    if account_type_code in DEBIT_NORMAL_TYPES:
+        return debit - credit
+    return credit - debit
+
+
+def to_date(value):
+    """
+    Accepts report parameters given either as dates or ISO strings
+    """
+    if value is None or isinstance(value, date):
+        return value
+    return parse_date(value)
+
+
+def split_date_range(start, end):
+    """
+    Splits an inclusive date range into the whole fiscal periods that can be
+    read from the period balances and the partial periods at its edges that
+    still have to be read from journal lines.
+
+    Returns (period_filter, line_filter); either may be None when that part
+    of the range is empty.
+    """
+    first = start if start is None or start.day == 1 else next_period_start(start)
+    if end is None:
+        stop = None
+    else:
+        stop = next_period_start(end) if is_period_end(end) else period_start(end)
+
+    if first is not None and stop is not None and first >= stop:
+        # The range lies within a single fiscal period
+        return None, Q(entry__date__gte=start, entry__date__lte=end)
+
+    period_filter = Q()
+    line_filter = None
+
+    if first is not None:
+        period_filter &= Q(period__gte=first)
+        if start < first:
+            line_filter = Q(entry__date__gte=start, entry__date__lt=first)
+
+    if stop is not None:
+        period_filter &= Q(period__lt=stop)
+        if stop <= end:
+            edge = Q(entry__date__gte=stop, entry__date__lte=end)
+            line_filter = edge if line_filter is None else line_filter | edge
+
+    return period_filter, line_filter
+
+
+def _sum_buckets(queryset, buckets, debit_field, credit_field):
+    """
+    Sums debit and credit per account for each (name, filter) bucket with
+    conditional aggregation, in one grouped query
+    """
+    buckets = [(name, bucket_filter) for name, bucket_filter in buckets if bucket_filter is not None]
+    if not buckets:
+        return []
+
+    where = None
+    aggregates = {}
+    for name, bucket_filter in buckets:
+        aggregates[f'{name}_debit'] = Sum(debit_field, filter=bucket_filter)
+        aggregates[f'{name}_credit'] = Sum(credit_field, filter=bucket_filter)
+
+    # An empty filter matches every row, so the query is left unfiltered
+    if all(bucket_filter for _, bucket_filter in buckets):
+        for _, bucket_filter in buckets:
+            where = bucket_filter if where is None else where | bucket_filter
+        queryset = queryset.filter(where)
+
+    return queryset.order_by().values('account_id').annotate(**aggregates)
+
+
+def opening_balance_date(end):
+    """
+    Returns the latest date with carried-forward opening balances that a
+    cumulative range ending on end can start from, or None
+    """
+    openings = OpeningBalance.objects.all()
+    if end is not None:
+        openings = openings.filter(as_of__lte=end + timedelta(days=1))
+    return openings.aggregate(latest=Max('as_of'))['latest']
+
+
+def closing_entry_totals(accounts, ranges):
+    """
+    Returns the sums of year-end closing lines per account for each
+    (name, start, end) range, keyed like account_totals
+    """
+    buckets = []
+    for name, start, end in ranges:
+        bucket_filter = Q()
+        if start is not None:
+            bucket_filter &= Q(entry__date__gte=start)
+        if end is not None:
+            bucket_filter &= Q(entry__date__lte=end)
+        buckets.append((name, bucket_filter))
+
+    lines = JournalLine.objects.filter(entry__status__in=POSTED_STATUSES, entry__is_closing=True)
+    if accounts is not None:
+        lines = lines.filter(account__in=accounts)
+    return _sum_buckets(lines, buckets, 'debit', 'credit')
+
+
+def account_totals(accounts=None, as_of_date=None, from_date=None, backend=None, exclude_closing=False):
+    """
+    Returns posted debit and credit sums for all requested accounts,
+    grouped by account.
+
+    Lines dated before from_date are reported as opening sums, lines from
+    from_date up to as_of_date as period sums. Without from_date every line
+    falls into the period. Cumulative sums start from the opening balances
+    of the latest closed fiscal year, whole fiscal periods are read from
+    the period balances, and only the lines of partial periods at the edges
+    of each range are scanned. Accounts without posted lines are omitted.
+
+    With backend='columnar' the sums come from the in-memory columnar
+    ledger instead of the database. With exclude_closing, year-end closing
+    entries are left out, as income statements require.
+    """
+    as_of_date = to_date(as_of_date)
+    from_date = to_date(from_date)
+
+    if from_date:
+        ranges = [
+            ('opening', None, from_date - timedelta(days=1)),
+            ('period', from_date, as_of_date),
+        ]
+    else:
+        ranges = [('period', None, as_of_date)]
+
+    if backend == 'columnar':
+        from .columnar import get_columnar_ledger
+
+        ledger = get_columnar_ledger()
+        account_ids = ledger.account_ids.tolist() if accounts is None else accounts.values_list('id', flat=True)
+        totals = ledger.account_totals(account_ids, as_of_date, from_date)
+    else:
+        # Opening balances already include the closing entries they carry forward
+        totals = _database_totals(accounts, ranges, use_openings=not exclude_closing)
+
+    if exclude_closing:
+        for row in closing_entry_totals(accounts, ranges):
+            sums = totals.setdefault(row['account_id'], dict.fromkeys(TOTAL_FIELDS, ZERO))
+            for field in TOTAL_FIELDS:
+                sums[field] -= row.get(field) or ZERO
+    return totals
+
+
+def _database_totals(accounts, ranges, use_openings=True):
+    """
+    Sums each (name, start, end) range from opening balances, period
+    balances and edge-period lines
+    """
+    opening_buckets = []
+    period_buckets = []
+    line_buckets = []
+    for name, start, end in ranges:
+        if start is None and use_openings:
+            opening_date = opening_balance_date(end)
+            if opening_date is not None:
+                opening_buckets.append((name, Q(as_of=opening_date)))
+                start = opening_date
+        period_filter, line_filter = split_date_range(start, end)
+        period_buckets.append((name, period_filter))
+        line_buckets.append((name, line_filter))
+
+    openings = OpeningBalance.objects.all()
+    balances = AccountPeriodBalance.objects.all()
+    lines = JournalLine.objects.filter(entry__status__in=POSTED_STATUSES)
+    if accounts is not None:
+        openings = openings.filter(account__in=accounts)
+        balances = balances.filter(account__in=accounts)
+        lines = lines.filter(account__in=accounts)
+
+    totals = {}
+    for rows in (
+        _sum_buckets(openings, opening_buckets, 'debit', 'credit'),
+        _sum_buckets(balances, period_buckets, 'debit', 'credit'),
+        _sum_buckets(lines, line_buckets, 'debit', 'credit'),
+    ):
+        for row in rows:
+            sums = totals.setdefault(row['account_id'], dict.fromkeys(TOTAL_FIELDS, ZERO))
+            for field in TOTAL_FIELDS:
+                sums[field] += row.get(field) or ZERO
+    return totals
+
+
+def compute_balances(accounts, as_of_date=None, from_date=None, backend=None, exclude_closing=False):
+    """
+    Returns one row per account (in queryset order) with its opening, period
+    and closing sums. `account` is the account's AccountInfo from the
+    registry.
+
+    `balance` is the period movement signed by the account type, which is the
+    cumulative balance when no from_date is given. `opening_balance` and
+    `closing_balance` are plain debit minus credit.
+    """
+    totals = account_totals(accounts, as_of_date, from_date, backend, exclude_closing)
+    # Only the ids are read; names and types come from the registry
+    account_ids = list(accounts.values_list('id', flat=True))
+    infos = registry.get_many(account_ids)
+
+    results = []
+    for account in (infos[account_id] for account_id in account_ids if account_id in infos):
+        sums = totals.get(account.id) or dict.fromkeys(TOTAL_FIELDS, ZERO)
+        opening_balance = sums['opening_debit'] - sums['opening_credit']
+        period_net = sums['period_debit'] - sums['period_credit']
+
+        results.append({
+            'account': account,
+            **sums,
+            'opening_balance': opening_balance,
+            'closing_balance': opening_balance + period_net,
+            'balance': natural_balance(
+                account.type_code, sums['period_debit'], sums['period_credit']
+            ),
+        })
+    return results
+
+
+def rollup_balances(
+    account_type_codes, as_of_date=None, from_date=None, depth=None, backend=None, exclude_closing=False
+):
+    """
+    Returns the chart of accounts for the given account types as nested
+    trees with balances and subtotals at every level, keyed by type code.
+
+    The tree is loaded in one query and leaf balances in another; subtotals
+    are aggregated bottom-up in a single pass. Balances are signed by the
+    type of the statement section. With depth, nodes below that level are
+    left out of the output but still counted in their ancestors' subtotals.
+    """
+    depth = int(depth) if depth else None
+    accounts = Account.objects.filter(account_type__code__in=account_type_codes)
+    totals = account_totals(accounts, as_of_date, from_date, backend, exclude_closing)
+
+    nodes = {}
+    for account in accounts.values('id', 'code', 'name', 'parent_account_id', 'account_type__code'):
+        sums = totals.get(account['id'])
+        net = sums['period_debit'] - sums['period_credit'] if sums else ZERO
+        nodes[account['id']] = {
+            'id': account['id'],
+            'code': account['code'],
+            'name': account['name'],
+            'type': account['account_type__code'],
+            'parent': account['parent_account_id'],
+            'net': net,
+            'subtotal_net': net,
+            'children': [],
+        }
+
+    # Accounts whose parent belongs to another section start a tree of their own
+    roots = {code: [] for code in account_type_codes}
+    for node in nodes.values():
+        parent = nodes.get(node['parent'])
+        if parent is not None and parent['type'] == node['type']:
+            parent['children'].append(node)
+        else:
+            node['parent'] = None
+            roots[node['type']].append(node)
+
+    # Pre-order visits parents before children, so walking it backwards
+    # adds each subtree to its parent exactly once
+    order = []
+    for code, section in roots.items():
+        stack = [(node, 1, code) for node in section]
+        while stack:
+            node, level, section_code = stack.pop()
+            node['level'] = level
+            node['section'] = section_code
+            order.append(node)
+            stack.extend((child, level + 1, section_code) for child in node['children'])
+
+    for node in reversed(order):
+        if node['parent'] is not None:
+            nodes[node['parent']]['subtotal_net'] += node['subtotal_net']
+
+    def render(node):
+        debit_normal = node['section'] in DEBIT_NORMAL_TYPES
+        output = {
+            'id': node['id'],
+            'code': node['code'],
+            'name': node['name'],
+            'level': node['level'],
+            'balance': node['net'] if debit_normal else ZERO - node['net'],
+            'subtotal': node['subtotal_net'] if debit_normal else ZERO - node['subtotal_net'],
+        }
+        if depth is None or node['level'] < depth:
+            children = sorted(node['children'], key=lambda child: child['code'])
+            output['children'] = [render(child) for child in children]
+        return output
+
+    return {
+        code: [render(node) for node in sorted(section, key=lambda node: node['code'])]
+        for code, section in roots.items()
+    }
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.db.models import Case, CharField, Exists, OuterRef, Q, Sum, Value, When
+
+from coa.models import Account
+from journal.models import POSTED_STATUSES, JournalLine
+
+from .balances import ZERO, compute_balances, to_date
+
+OPERATING = 'operating'
+INVESTING = 'investing'
+FINANCING = 'financing'
+ACTIVITIES = (OPERATING, INVESTING, FINANCING)
+
+
+def code_ranges_filter(ranges, field='code'):
+    """
+    Returns a filter matching account codes within any of the inclusive (first, last) ranges.
+
+    Range ends are code prefixes, so subaccounts sort into their parent's
+    range: ('1010', '1019') matches 1019-01 and ('1500', '1999') matches
+    19995, while 2000 stays outside. Comparing whole strings would leave
+    both subaccounts out, as they sort after '1019' and '1999'.
+    """
+    code_filter = Q(pk__in=[])
+    for first, last in ranges:
+        code_filter |= Q(**{f'{field}__gte': first}) & (
+            Q(**{f'{field}__lte': last}) | Q(**{f'{field}__startswith': last})
+        )
+    return code_filter
+
+
+def cash_accounts():
+    """
+    Accounts treated as cash by the cash flow statement
+    """
+    return Account.objects.filter(code_ranges_filter(settings.CASH_FLOW_CASH_ACCOUNTS))
+
+
+def activity_case():
+    """
+    Classifies a journal line's account into a cash flow activity by code range
+    """
+    whens = [
+        When(code_ranges_filter(ranges, 'account__code'), then=Value(activity))
+        for activity, ranges in settings.CASH_FLOW_ACTIVITIES.items()
+    ]
+    return Case(*whens, default=Value(OPERATING), output_field=CharField())
+
+
+def cash_flow_lines(from_date=None, to_date=None):
+    """
+    Cash effect of every counter-account, grouped by activity and account.
+
+    A posted entry that touches a cash account moves cash by the net of its
+    cash lines, which equals the net of its other lines with the sign
+    reversed. So each non-cash line of such an entry contributes
+    credit - debit to the cash flow of its account's activity. Cash-to-cash
+    transfers have no other lines and drop out. Everything is computed in
+    one grouped query.
+    """
+    cash_filter = code_ranges_filter(settings.CASH_FLOW_CASH_ACCOUNTS, 'account__code')
+    lines = JournalLine.objects.filter(entry__status__in=POSTED_STATUSES)
+    if from_date:
+        lines = lines.filter(entry__date__gte=from_date)
+    if to_date:
+        lines = lines.filter(entry__date__lte=to_date)
+
+    touches_cash = JournalLine.objects.filter(cash_filter, entry=OuterRef('entry'))
+    return (
+        lines.filter(Exists(touches_cash))
+        .exclude(cash_filter)
+        .annotate(activity=activity_case())
+        .order_by()
+        .values('activity', 'account_id', 'account__code', 'account__name')
+        .annotate(inflow=Sum('credit'), outflow=Sum('debit'))
+        .order_by('activity', 'account__code')
+    )
+
+
+def compute_cash_flow(from_date=None, as_of_date=None, backend=None):
+    """
+    Returns the cash flow statement by the direct method: per-account cash
+    effects in operating, investing and financing sections, with a
+    reconciliation of their total to the change in the cash balances
+    """
+    from_date = to_date(from_date)
+    as_of_date = to_date(as_of_date)
+
+    sections = {activity: [] for activity in ACTIVITIES}
+    totals = dict.fromkeys(ACTIVITIES, ZERO)
+    for row in cash_flow_lines(from_date, as_of_date):
+        amount = (row['inflow'] or ZERO) - (row['outflow'] or ZERO)
+        if not amount:
+            continue
+        sections[row['activity']].append({
+            'account_id': row['account_id'],
+            'account_code': row['account__code'],
+            'account_name': row['account__name'],
+            'amount': amount,
+        })
+        totals[row['activity']] += amount
+
+    balances = compute_balances(cash_accounts(), as_of_date, from_date, backend)
+    beginning_cash = sum((row['opening_balance'] for row in balances), ZERO)
+    ending_cash = sum((row['closing_balance'] for row in balances), ZERO)
+    net_change = sum(totals.values(), ZERO)
+
+    return {
+        'sections': sections,
+        'totals': totals,
+        'reconciliation': {
+            'beginning_cash': beginning_cash,
+            'net_change': net_change,
+            'ending_cash': ending_cash,
+            'unreconciled': ending_cash - beginning_cash - net_change,
+        },
+    }
@@ -0,0 +1,234 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from invoices.signals import invoices_version
+from journal.ledger import ledger_version
+
+from .aging import AGING_REPORT_TYPES
+from .models import SavedReport, SavedReportChunk
+from .storage import clear_result, save_result
+
+IN_FLIGHT_KEY = 'reports:in-flight:{}'
+METRIC_KEY = 'reports:coalescing:{}'
+
+# Outcomes of a report request
+GENERATED = 'generated'
+ATTACHED = 'attached'
+REUSED = 'reused'
+OUTCOMES = (GENERATED, ATTACHED, REUSED)
+
+# Parameters the generators default to today's date when missing
+DATE_DEFAULTS = {
+    'balance_sheet': 'as_of_date',
+    'trial_balance': 'as_of_date',
+    'income_statement': 'to_date',
+    'cash_flow': 'to_date',
+    'general_ledger': 'to_date',
+    'ar_aging': 'as_of_date',
+    'ap_aging': 'as_of_date',
+}
+
+
+def normalize_parameters(report_type, parameters):
+    """
+    Returns parameters in a canonical form, so requests that produce the same
+    report compare equal
+    """
+    normalized = {
+        key: str(value)
+        for key, value in parameters.items()
+        if value not in (None, '', [], {})
+    }
+    default_date = DATE_DEFAULTS.get(report_type)
+    if default_date and default_date not in normalized:
+        normalized[default_date] = timezone.localdate().strftime('%Y-%m-%d')
+    return normalized
+
+
+def report_fingerprint(report):
+    """
+    Fingerprint of (report type, normalized parameters, ledger version).
+    Custom reports also depend on their template configuration, aging
+    reports on the invoices version.
+    """
+    report_type = report.template.report_type
+    payload = [report_type, normalize_parameters(report_type, report.parameters), ledger_version()]
+    if report_type in AGING_REPORT_TYPES:
+        payload.append(invoices_version())
+    if report_type == 'custom':
+        payload.append(report.template.configuration)
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def record_outcome(outcome):
+    """
+    Count a report request by outcome for the dedup hit-rate metrics
+    """
+    key = METRIC_KEY.format(outcome)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def coalescing_stats():
+    """
+    Returns request counts per outcome and the share served without a new generation
+    """
+    counts = {outcome: cache.get(METRIC_KEY.format(outcome), 0) for outcome in OUTCOMES}
+    total = sum(counts.values())
+    return {
+        **counts,
+        'total': total,
+        'hit_rate': (counts[ATTACHED] + counts[REUSED]) / total if total else 0.0,
+    }
+
+
+def copy_result(source, target):
+    """
+    Copy the stored result of a completed report, including its chunks
+    """
+    with transaction.atomic():
+        target.chunks.all().delete()
+        batch = []
+        for chunk in source.chunks.all().iterator(chunk_size=100):
+            batch.append(SavedReportChunk(
+                report=target,
+                section=chunk.section,
+                page=chunk.page,
+                row_count=chunk.row_count,
+                data=chunk.data,
+            ))
+            if len(batch) == 100:
+                SavedReportChunk.objects.bulk_create(batch)
+                batch = []
+        SavedReportChunk.objects.bulk_create(batch)
+
+        target.result_data = source.result_data
+        target.status = 'completed'
+        target.error_message = ''
+        target.save(update_fields=['result_data', 'status', 'error_message'])
+
+
+def dispatch_report(report):
+    """
+    Start generating a report unless an identical one can be reused: a
+    completed report with the same fingerprint is copied, and while one is
+    being generated the request waits for it instead of starting another.
+    Returns the outcome.
+    """
+    from .report_generators import generate_report
+
+    report.fingerprint = report_fingerprint(report)
+    report.generation_started_at = timezone.now()
+    report.save(update_fields=['fingerprint', 'generation_started_at'])
+    clear_result(report)
+
+    source = (
+        SavedReport.objects.filter(fingerprint=report.fingerprint, status='completed')
+        .exclude(id=report.id)
+        .order_by('-created_at')
+        .first()
+    )
+    if source is not None:
+        copy_result(source, report)
+        record_outcome(REUSED)
+        return REUSED
+
+    if not cache.add(IN_FLIGHT_KEY.format(report.fingerprint), report.id, settings.REPORT_COALESCE_TIMEOUT):
+        # The generating report completes this one when it finishes
+        record_outcome(ATTACHED)
+        return ATTACHED
+
+    # Reports left waiting by a generation whose in-flight marker expired
+    # are completed by this one too, as complete_report picks up every
+    # report still generating with the fingerprint
+    try:
+        generate_report.delay(report.id)
+    except Exception:
+        release_in_flight(report)
+        raise
+    record_outcome(GENERATED)
+    return GENERATED
+
+
+def complete_report(report, result):
+    """
+    Store a generated result and hand it to every report attached to it
+    """
+    save_result(report, result)
+
+    if report.fingerprint:
+        waiting = SavedReport.objects.filter(fingerprint=report.fingerprint, status='generating').exclude(id=report.id)
+        for follower in waiting:
+            copy_result(report, follower)
+        release_in_flight(report)
+
+
+def keep_in_flight(report_id, fingerprint):
+    """
+    Renew the in-flight marker of a generation that is still running, so
+    that it only expires once the worker generating it is lost
+    """
+    key = IN_FLIGHT_KEY.format(fingerprint)
+    if fingerprint and cache.get(key) == report_id:
+        cache.touch(key, settings.REPORT_COALESCE_TIMEOUT)
+
+
+def release_in_flight(report):
+    """
+    Drop the in-flight marker of a report's fingerprint, unless it expired
+    and a newer generation has taken it since
+    """
+    key = IN_FLIGHT_KEY.format(report.fingerprint)
+    if cache.get(key) == report.id:
+        cache.delete(key)
+
+
+def fail_report(report_id, message):
+    """
+    Mark a report and every report attached to it as failed. Once a newer
+    generation of the same fingerprint is in flight, the attached reports
+    wait for that one instead.
+    """
+    report = SavedReport.objects.filter(id=report_id).first()
+    if report is None:
+        return
+
+    reports = SavedReport.objects.filter(id=report_id)
+    if report.fingerprint and cache.get(IN_FLIGHT_KEY.format(report.fingerprint)) in (None, report.id):
+        reports = SavedReport.objects.filter(fingerprint=report.fingerprint, status='generating') | reports
+        release_in_flight(report)
+    reports.update(status='failed', error_message=message)
+
+
+def fail_stale_reports():
+    """
+    Fail reports sent to generation over REPORT_COALESCE_TIMEOUT ago with no
+    generation of their fingerprint in flight. Running generations renew
+    their marker, so it is only missing once the generation they waited
+    for was lost, e.g. with a worker that died. Returns the number failed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.REPORT_COALESCE_TIMEOUT)
+    stale = SavedReport.objects.filter(
+        Q(generation_started_at__lt=cutoff) | Q(generation_started_at__isnull=True, created_at__lt=cutoff),
+        status='generating',
+    ).exclude(fingerprint='')
+    fingerprints = [
+        fingerprint
+        for fingerprint in stale.values_list('fingerprint', flat=True).distinct()
+        if cache.get(IN_FLIGHT_KEY.format(fingerprint)) is None
+    ]
+    if not fingerprints:
+        return 0
+    return stale.filter(fingerprint__in=fingerprints).update(
+        status='failed', error_message="The report generation did not finish in time"
+    )
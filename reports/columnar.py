@@ -0,0 +1,440 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db.models import BigIntegerField, Count, F, Max, Q, Sum
+from django.db.models.functions import Cast, Round
+
+from journal.ledger import ledger_version
+from journal.models import POSTED_STATUSES, JournalLine, LedgerChange
+
+from .balances import TOTAL_FIELDS, to_date
+
+# Sort keys combine the account index (high bits) with the date ordinal (low bits)
+DAY_BITS = 32
+
+COLUMNS = ('line_ids', 'entries', 'accounts', 'days', 'debits', 'credits')
+
+LOAD_CHUNK_SIZE = 10000
+
+# Logged entry changes beyond which a refresh reloads every line instead
+MAX_REFRESH_CHANGES = 10000
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def _cents_expression(field):
+    """
+    An amount column as integer cents, rounded rather than truncated since
+    SQLite multiplies decimals as floating point
+    """
+    return Cast(Round(F(field) * 100), BigIntegerField())
+
+
+def _digest(groups):
+    """
+    Hash of (account, day, count, debit cents, credit cents) rows
+    """
+    return hashlib.sha256(np.ascontiguousarray(groups, dtype=np.int64).tobytes()).hexdigest()
+
+
+def _cents(value):
+    """
+    Convert integer cents back to a decimal amount
+    """
+    return Decimal(int(value)) / 100
+
+
+class ColumnarLedger:
+    """
+    Posted journal lines held as compact NumPy columns for analytical queries:
+    line id, account index, date ordinal and debit/credit in integer cents.
+
+    Lines are kept sorted by (account, date) with prefix sums over the
+    amounts, so the debit or credit total of any account over any date range
+    is the difference of two prefix sums found by binary search. The columns
+    are persisted as .npy files and memory-mapped when loaded.
+
+    A loaded ledger is never changed in place: refresh returns a new one,
+    so readers of the previous one always see whole columns.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.COLUMNAR_LEDGER_PATH
+        self.generation = 0
+        self.last_line_id = 0
+        self.last_change_id = 0
+        self.version = None
+        # Digest of the lines when last checked against the database; None
+        # after a refresh that was not verified
+        self.checksum = None
+        self.account_ids = np.zeros(0, dtype=np.int64)
+        self.columns = {name: np.zeros(0, dtype=np.int64) for name in COLUMNS}
+        self._index()
+
+    # Building and refreshing
+
+    @staticmethod
+    def _read_lines(queryset):
+        """
+        Read journal lines into column arrays in chunks
+        """
+        rows = (
+            queryset.order_by('id')
+            .annotate(
+                debit_cents=_cents_expression('debit'),
+                credit_cents=_cents_expression('credit'),
+            )
+            .values_list('id', 'entry_id', 'account_id', 'entry__date', 'debit_cents', 'credit_cents')
+            .iterator(chunk_size=LOAD_CHUNK_SIZE)
+        )
+
+        parts = {name: [] for name in COLUMNS}
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == LOAD_CHUNK_SIZE:
+                ColumnarLedger._append_chunk(parts, chunk)
+                chunk = []
+        ColumnarLedger._append_chunk(parts, chunk)
+
+        return {
+            name: np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+            for name, arrays in parts.items()
+        }
+
+    @staticmethod
+    def _append_chunk(parts, chunk):
+        """
+        Convert a chunk of (id, entry, account, date, debit, credit) rows to arrays
+        """
+        if not chunk:
+            return
+        line_ids, entry_ids, account_ids, dates, debits, credits = zip(*chunk)
+        parts['line_ids'].append(np.array(line_ids, dtype=np.int64))
+        parts['entries'].append(np.array(entry_ids, dtype=np.int64))
+        parts['accounts'].append(np.array(account_ids, dtype=np.int64))
+        parts['days'].append(np.array([value.toordinal() for value in dates], dtype=np.int64))
+        parts['debits'].append(np.array(debits, dtype=np.int64))
+        parts['credits'].append(np.array(credits, dtype=np.int64))
+
+    @staticmethod
+    def _database_checksum():
+        """
+        Digest of the line count and cent totals of every account and day,
+        used to verify a refreshed ledger against the whole posted ledger
+        """
+        rows = (
+            JournalLine.objects.filter(entry__status__in=POSTED_STATUSES)
+            .order_by()
+            .values('account_id', 'entry__date')
+            .annotate(
+                count=Count('id'),
+                debit=Sum(_cents_expression('debit')),
+                credit=Sum(_cents_expression('credit')),
+            )
+            .order_by('account_id', 'entry__date')
+            .values_list('account_id', 'entry__date', 'count', 'debit', 'credit')
+        )
+        groups = [
+            (account_id, day.toordinal(), count, debit or 0, credit or 0)
+            for account_id, day, count, debit, credit in rows.iterator(chunk_size=LOAD_CHUNK_SIZE)
+        ]
+        return _digest(np.array(groups, dtype=np.int64).reshape(-1, 5))
+
+    def _own_checksum(self):
+        """
+        The same digest over the loaded lines, which are sorted by account and day
+        """
+        accounts = np.asarray(self.columns['accounts'])
+        days = np.asarray(self.columns['days'])
+        if not len(accounts):
+            return _digest(np.zeros((0, 5), dtype=np.int64))
+        starts = np.flatnonzero(np.concatenate([[True], (accounts[1:] != accounts[:-1]) | (days[1:] != days[:-1])]))
+        counts = np.diff(np.concatenate([starts, [len(accounts)]]))
+        return _digest(np.stack([
+            accounts[starts],
+            days[starts],
+            counts,
+            np.add.reduceat(np.asarray(self.columns['debits']), starts),
+            np.add.reduceat(np.asarray(self.columns['credits']), starts),
+        ], axis=1))
+
+    @staticmethod
+    def _last_change_id():
+        return LedgerChange.objects.aggregate(last=Max('id'))['last'] or 0
+
+    def rebuild(self):
+        """
+        Load every posted line from the database
+        """
+        version = ledger_version()
+        last_change_id = self._last_change_id()
+        self._set_lines(self._read_lines(JournalLine.objects.filter(entry__status__in=POSTED_STATUSES)))
+        self.version = version
+        self.last_change_id = last_change_id
+        self.checksum = self._own_checksum()
+        return self
+
+    def _rebuilt(self):
+        """
+        A new ledger holding every posted line, saved as this one's next generation
+        """
+        ledger = ColumnarLedger(self.path)
+        ledger.generation = self.generation
+        return ledger.rebuild()
+
+    def refresh(self, verify=False):
+        """
+        Returns a new ledger brought up to date from this one. Lines added
+        since the last load (by line id) are read, and the entries logged in
+        LedgerChange since then have their lines read again and replace the
+        loaded ones; both are merged into the sorted columns.
+
+        With verify, the result is compared with a digest of the whole posted
+        ledger and rebuilt on a mismatch. That catches what the log cannot:
+        changes made without entries_changed, or committed out of id order.
+        It scans every posted line, so it is left to the periodic task.
+        """
+        if self.version is None:
+            return self._rebuilt()
+
+        version = ledger_version()
+        last_change_id = self._last_change_id()
+        entry_ids = list(
+            LedgerChange.objects.filter(id__gt=self.last_change_id, id__lte=last_change_id)
+            .values_list('entry_id', flat=True)[:MAX_REFRESH_CHANGES + 1]
+        )
+        if len(entry_ids) > MAX_REFRESH_CHANGES:
+            return self._rebuilt()
+
+        changed = np.unique(np.array(entry_ids, dtype=np.int64))
+        new_lines = self._read_lines(
+            JournalLine.objects.filter(entry__status__in=POSTED_STATUSES)
+            .filter(Q(id__gt=self.last_line_id) | Q(entry_id__in=changed.tolist()))
+        )
+
+        ledger = ColumnarLedger(self.path)
+        ledger.generation = self.generation
+        ledger._merge_lines(self, new_lines, changed)
+        ledger.version = version
+        ledger.last_change_id = last_change_id
+
+        if verify:
+            ledger.checksum = ledger._own_checksum()
+            if ledger.checksum != ledger._database_checksum():
+                return self._rebuilt()
+        return ledger
+
+    def _set_lines(self, columns):
+        """
+        Replace the loaded lines, sorted by account, date and line id
+        """
+        accounts = columns['accounts']
+        self.account_ids = np.unique(accounts)
+        account_index = np.searchsorted(self.account_ids, accounts)
+
+        order = np.lexsort((columns['line_ids'], columns['days'], account_index))
+        self.columns = {name: np.ascontiguousarray(values[order]) for name, values in columns.items()}
+        self.last_line_id = int(columns['line_ids'].max()) if len(columns['line_ids']) else self.last_line_id
+        self._index()
+
+    def _merge_lines(self, previous, new_lines, changed):
+        """
+        Take the lines of a previous ledger, less those of the changed
+        entries, and insert the new lines at their sorted positions. Only
+        the new lines are sorted; the rest keep their order.
+        """
+        columns = {name: np.asarray(previous.columns[name]) for name in COLUMNS}
+        if len(changed):
+            keep = ~np.isin(columns['entries'], changed)
+            columns = {name: values[keep] for name, values in columns.items()}
+
+        order = np.lexsort((new_lines['line_ids'], new_lines['days'], new_lines['accounts']))
+        new_lines = {name: values[order] for name, values in new_lines.items()}
+        positions = _merge_positions(columns, new_lines)
+
+        self.columns = {name: np.insert(columns[name], positions, new_lines[name]) for name in COLUMNS}
+        self.account_ids = np.union1d(np.asarray(previous.account_ids), new_lines['accounts'])
+        self.last_line_id = max(
+            previous.last_line_id, int(new_lines['line_ids'].max()) if len(new_lines['line_ids']) else 0
+        )
+        self._index()
+
+    def _index(self):
+        """
+        Derive the sort keys and prefix sums the queries run on
+        """
+        account_index = np.searchsorted(self.account_ids, self.columns['accounts'])
+        self.keys = (account_index.astype(np.int64) << DAY_BITS) | self.columns['days']
+        self.debit_sums = np.concatenate([[0], np.cumsum(self.columns['debits'])])
+        self.credit_sums = np.concatenate([[0], np.cumsum(self.columns['credits'])])
+
+    # Persistence
+
+    def save(self):
+        """
+        Write the columns as a new generation of .npy files, then switch the
+        metadata to it so readers never see a partial write
+        """
+        os.makedirs(self.path, exist_ok=True)
+        generation = self.generation + 1
+
+        for name, values in {'account_ids': self.account_ids, **self.columns}.items():
+            np.save(os.path.join(self.path, f'{name}-{generation}.npy'), values)
+
+        meta_path = os.path.join(self.path, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as meta:
+            json.dump({
+                'generation': generation,
+                'last_line_id': self.last_line_id,
+                'last_change_id': self.last_change_id,
+                'version': self.version,
+                'checksum': self.checksum,
+            }, meta)
+        os.replace(meta_path + '.tmp', meta_path)
+
+        # Keep the previous generation for readers that are still loading it
+        for name in ('account_ids',) + COLUMNS:
+            stale = os.path.join(self.path, f'{name}-{generation - 2}.npy')
+            if os.path.exists(stale):
+                os.remove(stale)
+
+        self.generation = generation
+        return self
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Memory-map the latest saved generation, or return an empty ledger
+        """
+        ledger = cls(path)
+        meta_path = os.path.join(ledger.path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return ledger
+
+        with open(meta_path) as meta:
+            meta = json.load(meta)
+
+        ledger.generation = meta['generation']
+        if 'last_change_id' not in meta:
+            # Saved before the entry column was kept; refresh loads every line
+            return ledger
+
+        def column(name):
+            return np.load(os.path.join(ledger.path, f"{name}-{meta['generation']}.npy"), mmap_mode='r')
+
+        ledger.last_line_id = meta['last_line_id']
+        ledger.last_change_id = meta['last_change_id']
+        ledger.version = meta['version']
+        ledger.checksum = meta['checksum']
+        ledger.account_ids = column('account_ids')
+        ledger.columns = {name: column(name) for name in COLUMNS}
+        ledger._index()
+        return ledger
+
+    # Queries
+
+    def _positions(self, account_index, day, side):
+        """
+        Position in the sorted lines of a date within each account's lines
+        """
+        return np.searchsorted(self.keys, (account_index << DAY_BITS) | day, side=side)
+
+    def range_totals(self, account_ids, start=None, end=None):
+        """
+        Debit and credit cents per account for lines dated between start and
+        end (inclusive, either may be open). Returns two arrays aligned with
+        account_ids.
+        """
+        account_ids = np.asarray(account_ids, dtype=np.int64)
+        account_index = np.searchsorted(self.account_ids, account_ids)
+        known = (account_index < len(self.account_ids))
+        known[known] = self.account_ids[account_index[known]] == account_ids[known]
+        account_index = account_index.astype(np.int64)
+
+        first_day = start.toordinal() if start else 0
+        last_day = end.toordinal() if end else date.max.toordinal()
+        lower = self._positions(account_index, first_day, 'left')
+        upper = self._positions(account_index, last_day, 'right')
+
+        debits = np.where(known, self.debit_sums[upper] - self.debit_sums[lower], 0)
+        credits = np.where(known, self.credit_sums[upper] - self.credit_sums[lower], 0)
+        return debits, credits
+
+    def compare_periods(self, account_ids, periods):
+        """
+        Debit and credit cents per account for several (start, end) periods,
+        as two arrays of shape (len(account_ids), len(periods))
+        """
+        results = [self.range_totals(account_ids, to_date(start), to_date(end)) for start, end in periods]
+        debits = np.stack([debit for debit, _ in results], axis=1) if results else np.zeros((len(account_ids), 0))
+        credits = np.stack([credit for _, credit in results], axis=1) if results else np.zeros((len(account_ids), 0))
+        return debits, credits
+
+    def account_totals(self, account_ids, as_of_date=None, from_date=None):
+        """
+        Same result as reports.balances.account_totals, answered from the columns
+        """
+        as_of_date = to_date(as_of_date)
+        from_date = to_date(from_date)
+        account_ids = list(account_ids)
+
+        if from_date:
+            opening = self.range_totals(account_ids, None, date.fromordinal(from_date.toordinal() - 1))
+            period = self.range_totals(account_ids, from_date, as_of_date)
+        else:
+            opening = (np.zeros(len(account_ids), dtype=np.int64),) * 2
+            period = self.range_totals(account_ids, None, as_of_date)
+
+        totals = {}
+        for position, account_id in enumerate(account_ids):
+            values = (opening[0][position], opening[1][position], period[0][position], period[1][position])
+            if any(values):
+                totals[account_id] = {
+                    field: _cents(value) for field, value in zip(TOTAL_FIELDS, values)
+                }
+        return totals
+
+
+def _merge_positions(columns, new_lines):
+    """
+    Positions in sorted columns at which sorted new lines are inserted to
+    keep the (account, date, line id) order
+    """
+    old_keys = (columns['accounts'] << DAY_BITS) | columns['days']
+    new_keys = (new_lines['accounts'] << DAY_BITS) | new_lines['days']
+    positions = np.searchsorted(old_keys, new_keys, side='left')
+    ends = np.searchsorted(old_keys, new_keys, side='right')
+    # Lines of the same account and date are ordered by line id
+    for index in np.flatnonzero(ends > positions):
+        run = columns['line_ids'][positions[index]:ends[index]]
+        positions[index] += np.searchsorted(run, new_lines['line_ids'][index])
+    return positions
+
+
+def get_columnar_ledger():
+    """
+    Returns this process's columnar ledger, loading it on first use and
+    refreshing it incrementally whenever the ledger version has moved on.
+    The refreshed ledger replaces the previous one under a lock, so one
+    thread refreshes while readers keep using the ledger they already have.
+    """
+    global _ledger
+
+    ledger = _ledger
+    if ledger is not None and ledger.version == ledger_version():
+        return ledger
+
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = ColumnarLedger.load()
+        if _ledger.version != ledger_version():
+            _ledger = _ledger.refresh()
+        return _ledger
@@ -0,0 +1,58 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+GENERAL_LEDGER_FIELDS = [
+    'row_type', 'account_code', 'account_name', 'account_type', 'date',
+    'entry_number', 'description', 'reference', 'debit', 'credit', 'balance'
+]
+
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it, so csv.writer
+    can produce lines for a streaming response
+    """
+    def write(self, value):
+        return value
+
+
+def iter_ndjson(rows):
+    """
+    Encode rows as newline-delimited JSON, one line at a time
+    """
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def iter_csv(rows, fields):
+    """
+    Encode rows as CSV with a header line, one line at a time
+    """
+    writer = csv.DictWriter(Echo(), fieldnames=fields, extrasaction='ignore')
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_export(rows, export_format, fields):
+    """
+    Encode rows in the requested export format
+    """
+    if export_format == 'csv':
+        return iter_csv(rows, fields)
+    return iter_ndjson(rows)
+
+
+def write_export(rows, export_format, fields, stream):
+    """
+    Write an export to a file object in chunks
+    """
+    for chunk in iter_export(rows, export_format, fields):
+        stream.write(chunk)
@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coa.models import Account
+from journal.ledger import next_period_start, period_start
+from journal.models import POSTED_STATUSES, JournalEntry
+from reports.balances import account_totals
+from reports.columnar import ColumnarLedger
+
+
+class Command(BaseCommand):
+    help = "Refresh the persisted columnar ledger and check it against the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Reload every posted line instead of appending new ones")
+        parser.add_argument('--check-parity', action='store_true', help="Compare balances with the ORM at every month end")
+
+    def handle(self, *args, **options):
+        ledger = ColumnarLedger.load()
+        ledger = ledger.rebuild() if options['rebuild'] else ledger.refresh(verify=True)
+        ledger.save()
+        self.stdout.write(
+            f"Columnar ledger generation {ledger.generation}: {len(ledger.columns['line_ids'])} lines, "
+            f"{len(ledger.account_ids)} accounts"
+        )
+
+        if options['check_parity']:
+            mismatches = self.check_parity(ledger)
+            if mismatches:
+                for mismatch in mismatches[:20]:
+                    self.stderr.write(str(mismatch))
+                raise CommandError(f"{len(mismatches)} balance(s) differ from the database")
+            self.stdout.write(self.style.SUCCESS("Columnar balances match the database"))
+
+    def check_parity(self, ledger):
+        """
+        Compare as-of and month-to-date totals from both backends at every month end
+        """
+        dates = JournalEntry.objects.filter(status__in=POSTED_STATUSES).order_by('date').values_list('date', flat=True)
+        first, last = dates.first(), dates.last()
+        if first is None:
+            return []
+
+        accounts = Account.objects.all()
+        account_ids = list(accounts.values_list('id', flat=True))
+        mismatches = []
+        month = period_start(first)
+        while month <= last:
+            month_end = next_period_start(month) - timedelta(days=1)
+            for from_date in (None, month):
+                expected = account_totals(accounts, month_end, from_date)
+                actual = ledger.account_totals(account_ids, month_end, from_date)
+                for account_id in expected.keys() | actual.keys():
+                    if expected.get(account_id) != actual.get(account_id):
+                        mismatches.append({
+                            'account_id': account_id,
+                            'as_of_date': month_end,
+                            'from_date': from_date,
+                            'database': expected.get(account_id),
+                            'columnar': actual.get(account_id),
+                        })
+            month = next_period_start(month)
+        return mismatches
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from coa.models import Account
+from journal.ledger import period_start
+from journal.models import POSTED_STATUSES, AccountPeriodBalance, JournalEntry, JournalLine
+
+
+class Command(BaseCommand):
+    help = "Print query plans and timings of the ledger queries behind the reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of-date', help="Report date (default today)")
+        parser.add_argument('--account-id', type=int, help="Account used by the per-account queries")
+        parser.add_argument('--analyze', action='store_true', help="Run EXPLAIN ANALYZE (PostgreSQL only)")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per query; the fastest is reported")
+
+    def handle(self, *args, **options):
+        as_of_date = parse_date(options['as_of_date']) if options['as_of_date'] else timezone.localdate()
+        account_id = options['account_id'] or Account.objects.values_list('id', flat=True).first()
+        posted_lines = JournalLine.objects.filter(entry__status__in=POSTED_STATUSES)
+
+        queries = {
+            'balances as of date (lines)': posted_lines.filter(entry__date__lte=as_of_date)
+                .order_by().values('account_id').annotate(debit=Sum('debit'), credit=Sum('credit')),
+            'balances as of date (period balances)': AccountPeriodBalance.objects.filter(period__lt=period_start(as_of_date))
+                .order_by().values('account_id').annotate(debit=Sum('debit'), credit=Sum('credit')),
+            'account ledger': posted_lines.filter(account_id=account_id, entry__date__lte=as_of_date)
+                .order_by('entry__date', 'entry_id', 'id')
+                .values('entry__date', 'entry__entry_number', 'debit', 'credit'),
+            'account balance': posted_lines.filter(account_id=account_id, entry__date__lte=as_of_date)
+                .order_by().values('account_id').annotate(debit=Sum('debit'), credit=Sum('credit')),
+            'posted entries in period': JournalEntry.objects.filter(
+                status__in=POSTED_STATUSES, date__gte=period_start(as_of_date), date__lte=as_of_date
+            ).order_by('date', 'id').values('id', 'date', 'entry_number'),
+        }
+
+        explain_options = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+        self.stdout.write(f"Database: {connection.vendor}, as of {as_of_date}, account {account_id}\n")
+        for name, queryset in queries.items():
+            best = None
+            for _ in range(max(options['repeat'], 1)):
+                started = time.perf_counter()
+                rows = len(list(queryset.all()))
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {rows} rows in {best * 1000:.1f} ms"))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
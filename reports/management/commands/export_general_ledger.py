@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from reports.exports import EXPORT_CONTENT_TYPES, GENERAL_LEDGER_FIELDS, write_export
+from reports.report_generators import iter_general_ledger
+
+
+class Command(BaseCommand):
+    help = "Stream the general ledger to an NDJSON or CSV file in constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the file to write")
+        parser.add_argument('--from-date', dest='from_date')
+        parser.add_argument('--to-date', dest='to_date')
+        parser.add_argument('--account-id', dest='account_id', type=int)
+        parser.add_argument('--format', dest='export_format', choices=sorted(EXPORT_CONTENT_TYPES), default='ndjson')
+
+    def handle(self, *args, **options):
+        parameters = {
+            key: options[key]
+            for key in ('from_date', 'to_date', 'account_id')
+            if options[key]
+        }
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as stream:
+            write_export(iter_general_ledger(parameters), options['export_format'], GENERAL_LEDGER_FIELDS, stream)
+
+        self.stdout.write(self.style.SUCCESS(f"General ledger written to {options['output']}"))
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 
@@ -12,6 +13,8 @@ class ReportTemplate(models.Model):
         ('cash_flow', 'Cash Flow Statement'),
         ('general_ledger', 'General Ledger'),
         ('trial_balance', 'Trial Balance'),
+        ('ar_aging', 'AR Aging'),
+        ('ap_aging', 'AP Aging'),
         ('custom', 'Custom Report'),
     )
     
@@ -41,14 +44,49 @@ class SavedReport(models.Model):
     template = models.ForeignKey(ReportTemplate, on_delete=models.CASCADE, related_name='saved_reports')
     name = models.CharField(max_length=100)
     parameters = models.JSONField(default=dict)
-    result_data = models.JSONField(default=dict)
+    result_data = models.JSONField(
+        default=dict,
+        encoder=DjangoJSONEncoder,
+        help_text="Report summary; large sections are stored as compressed chunks"
+    )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='generating')
     error_message = models.TextField(blank=True)
+    fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Hash of report type, normalized parameters and ledger version, used to coalesce identical requests"
+    )
+    generation_started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the report was last sent to generation, or attached to one in flight"
+    )
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='saved_reports')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['fingerprint', 'status']),
+        ]
+        
+    def __str__(self):
+        return f"{self.name} ({self.created_at.strftime('%Y-%m-%d')})"
+
+
+class SavedReportChunk(models.Model):
+    """
+    One page of a large report section, stored as zlib-compressed JSON
+    """
+    report = models.ForeignKey(SavedReport, on_delete=models.CASCADE, related_name='chunks')
+    section = models.CharField(max_length=255, help_text="Path of the section in the report, e.g. ledger/1010/transactions")
+    page = models.PositiveIntegerField()
+    row_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    
+    class Meta:
+        ordering = ['report', 'section', 'page']
+        unique_together = ('report', 'section', 'page')
         
     def __str__(self):
-        return f"{self.name} ({self.created_at.strftime('%Y-%m-%d')})"
\ No newline at end of file
+        return f"{self.report} {self.section} page {self.page}"
@@ -1,10 +1,24 @@
+import hashlib
+import json
 from datetime import datetime
 
-from celery import shared_task
-from django.db.models import Q, Sum
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q, Sum, Window
+from django.db.models.expressions import RowRange
 
 from coa.models import Account
-from journal.models import JournalLine
+from coa.tree import coa_version
+from journal.ledger import ledger_version
+from journal.models import POSTED_STATUSES, JournalLine
+
+from .aging import AGING_REPORT_TYPES, compute_aging
+from .balances import compute_balances, rollup_balances
+from .cash_flow import compute_cash_flow
+
+# Number of journal lines fetched per round trip when streaming the general ledger
+GENERAL_LEDGER_CHUNK_SIZE = 2000
 
 
 @shared_task
@@ -12,62 +26,222 @@ def generate_report(report_id):
     """
     Celery task for asynchronous report generation
     """
+    from .coalescing import complete_report, fail_report, keep_in_flight
     from .models import SavedReport
     
+    report = None
     try:
         report = SavedReport.objects.get(id=report_id)
+        keep_in_flight(report.id, report.fingerprint)
         
-        # Call the appropriate generator based on report type
         report_type = report.template.report_type
         parameters = report.parameters
         
-        if report_type == 'balance_sheet':
-            result = generate_balance_sheet(parameters)
-        elif report_type == 'income_statement':
-            result = generate_income_statement(parameters)
-        elif report_type == 'cash_flow':
-            result = generate_cash_flow(parameters)
-        elif report_type == 'general_ledger':
-            result = generate_general_ledger(parameters)
-        elif report_type == 'trial_balance':
-            result = generate_trial_balance(parameters)
-        else:
-            result = generate_custom_report(report.template.configuration, parameters)
+        # Large reports are split by account range across workers
+        if report_type in PARTITION_MERGERS:
+            partitions = partition_accounts(parameters, get_partition_size(report.template))
+            if len(partitions) > 1:
+                fan_out_report(report, partitions)
+                return
+        
+        result = run_generator(report_type, parameters, report.template.configuration)
+        keep_in_flight(report.id, report.fingerprint)
             
-        # Update report with results
-        report.result_data = result
-        report.status = 'completed'
-        report.save()
+        # Update report and any identical requests waiting on it with results
+        complete_report(report, result)
         
     except Exception as e:
         # Update report with error
         if report:
-            report.status = 'failed'
-            report.error_message = str(e)
-            report.save()
+            fail_report(report.id, str(e))
         raise
 
 
+def run_generator(report_type, parameters, configuration=None):
+    """
+    Call the appropriate generator based on report type
+    """
+    if report_type == 'balance_sheet':
+        return generate_balance_sheet(parameters)
+    elif report_type == 'income_statement':
+        return generate_income_statement(parameters)
+    elif report_type == 'cash_flow':
+        return generate_cash_flow(parameters)
+    elif report_type == 'general_ledger':
+        return generate_general_ledger(parameters)
+    elif report_type == 'trial_balance':
+        return generate_trial_balance(parameters)
+    elif report_type in AGING_REPORT_TYPES:
+        return generate_aging(AGING_REPORT_TYPES[report_type], parameters)
+    return generate_custom_report(configuration, parameters)
+
+
+def get_partition_size(template):
+    """
+    Number of accounts per subtask, from the template configuration or settings
+    """
+    return int(template.configuration.get('partition_size') or settings.REPORT_PARTITION_SIZE)
+
+
+def partition_accounts(parameters, partition_size):
+    """
+    Split the accounts a report covers into contiguous ranges of account codes
+    """
+    if parameters.get('account_id'):
+        return [[parameters['account_id']]]
+    
+    account_ids = list(Account.objects.filter(is_active=True).order_by('code').values_list('id', flat=True))
+    return [
+        account_ids[index:index + partition_size]
+        for index in range(0, len(account_ids), partition_size)
+    ] or [[]]
+
+
+def fan_out_report(report, partitions):
+    """
+    Run one subtask per account range in parallel and merge their results
+    into the report once all of them have finished
+    """
+    report_type = report.template.report_type
+    header = group(
+        generate_report_partition.s(report_type, report.parameters, account_ids, report.id, report.fingerprint)
+        for account_ids in partitions
+    )
+    callback = merge_report_partitions.s(report.id).on_error(mark_report_failed.s(report.id))
+    chord(header)(callback)
+
+
+@shared_task
+def generate_report_partition(report_type, parameters, account_ids, report_id=None, fingerprint=''):
+    """
+    Celery task generating a report for one range of accounts
+    """
+    from .coalescing import keep_in_flight
+    
+    keep_in_flight(report_id, fingerprint)
+    result = run_generator(report_type, {**parameters, 'account_ids': account_ids})
+    keep_in_flight(report_id, fingerprint)
+    return result
+
+
+@shared_task
+def merge_report_partitions(results, report_id):
+    """
+    Celery task merging partial results, in partition order, into the report
+    """
+    from .coalescing import complete_report, keep_in_flight
+    from .models import SavedReport
+    
+    report = SavedReport.objects.get(id=report_id)
+    keep_in_flight(report.id, report.fingerprint)
+    complete_report(report, PARTITION_MERGERS[report.template.report_type](results))
+
+
+@shared_task
+def mark_report_failed(request, exc, traceback, report_id):
+    """
+    Error callback marking a fanned-out report as failed
+    """
+    from .coalescing import fail_report
+    
+    fail_report(report_id, str(exc))
+
+
+def merge_trial_balances(results):
+    """
+    Merge trial balances generated for consecutive account ranges
+    """
+    total_debits = sum(result['total_debits'] for result in results)
+    total_credits = sum(result['total_credits'] for result in results)
+    
+    return {
+        'as_of_date': results[0]['as_of_date'],
+        'accounts': [account for result in results for account in result['accounts']],
+        'total_debits': total_debits,
+        'total_credits': total_credits,
+        'balanced': abs(total_debits - total_credits) < 0.001
+    }
+
+
+def merge_general_ledgers(results):
+    """
+    Merge general ledgers generated for consecutive account ranges
+    """
+    ledger = {}
+    for result in results:
+        ledger.update(result['ledger'])
+    
+    return {
+        'from_date': results[0]['from_date'],
+        'to_date': results[0]['to_date'],
+        'ledger': ledger
+    }
+
+
+# Report types that can be split by account range, with their merge functions
+PARTITION_MERGERS = {
+    'trial_balance': merge_trial_balances,
+    'general_ledger': merge_general_ledgers,
+}
+
+
+def get_cached_report(name, parameters, generator):
+    """
+    Return a synchronously generated report from the cache, generating it on
+    a miss. Keys include the ledger version, so any posting invalidates all
+    cached reports at once, and the chart version, so renamed, re-typed or
+    deactivated accounts do too.
+    """
+    digest = hashlib.sha256(json.dumps(parameters, sort_keys=True, default=str).encode()).hexdigest()
+    key = f'reports:{name}:{ledger_version()}:{coa_version()}:{digest}'
+    
+    result = cache.get(key)
+    if result is None:
+        result = generator(parameters)
+        cache.set(key, result, settings.REPORT_CACHE_TIMEOUT)
+    return result
+
+
+def parse_flag(value):
+    """
+    Reads a boolean report parameter, given as a JSON boolean or as a string
+    such as "true" or "0"
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
 def generate_balance_sheet(parameters):
     """
     Generate a balance sheet report
     """
     as_of_date = parameters.get('as_of_date', datetime.now().strftime('%Y-%m-%d'))
+    backend = parameters.get('backend')
     
-    # Get all asset, liability and equity accounts
-    asset_accounts = Account.objects.filter(account_type__code='AS')
-    liability_accounts = Account.objects.filter(account_type__code='LI')
-    equity_accounts = Account.objects.filter(account_type__code='EQ')
-    
-    # Calculate balances
-    assets = calculate_account_balances(asset_accounts, as_of_date)
-    liabilities = calculate_account_balances(liability_accounts, as_of_date)
-    equity = calculate_account_balances(equity_accounts, as_of_date)
+    if parse_flag(parameters.get('rollup')):
+        # Nested statement with subtotals along the chart of accounts tree
+        sections = rollup_balances(
+            ('AS', 'LI', 'EQ'), as_of_date, depth=parameters.get('depth'), backend=backend
+        )
+        assets, liabilities, equity = sections['AS'], sections['LI'], sections['EQ']
+        total_field = 'subtotal'
+    else:
+        # Get all asset, liability and equity accounts
+        asset_accounts = Account.objects.filter(account_type__code='AS')
+        liability_accounts = Account.objects.filter(account_type__code='LI')
+        equity_accounts = Account.objects.filter(account_type__code='EQ')
+        
+        # Calculate balances
+        assets = calculate_account_balances(asset_accounts, as_of_date, backend=backend)
+        liabilities = calculate_account_balances(liability_accounts, as_of_date, backend=backend)
+        equity = calculate_account_balances(equity_accounts, as_of_date, backend=backend)
+        total_field = 'balance'
     
     # Calculate totals
-    total_assets = sum(account['balance'] for account in assets)
-    total_liabilities = sum(account['balance'] for account in liabilities)
-    total_equity = sum(account['balance'] for account in equity)
+    total_assets = sum(account[total_field] for account in assets)
+    total_liabilities = sum(account[total_field] for account in liabilities)
+    total_equity = sum(account[total_field] for account in equity)
     
     return {
         'as_of_date': as_of_date,
@@ -87,18 +261,29 @@ def generate_income_statement(parameters):
     """
     from_date = parameters.get('from_date')
     to_date = parameters.get('to_date', datetime.now().strftime('%Y-%m-%d'))
+    backend = parameters.get('backend')
     
-    # Get all revenue and expense accounts
-    revenue_accounts = Account.objects.filter(account_type__code='RE')
-    expense_accounts = Account.objects.filter(account_type__code='EX')
-    
-    # Calculate revenue and expenses for the period
-    revenue = calculate_account_balances(revenue_accounts, to_date, from_date)
-    expenses = calculate_account_balances(expense_accounts, to_date, from_date)
+    if parse_flag(parameters.get('rollup')):
+        # Nested statement with subtotals along the chart of accounts tree
+        sections = rollup_balances(
+            ('RE', 'EX'), to_date, from_date, depth=parameters.get('depth'), backend=backend,
+            exclude_closing=True
+        )
+        revenue, expenses = sections['RE'], sections['EX']
+        total_field = 'subtotal'
+    else:
+        # Get all revenue and expense accounts
+        revenue_accounts = Account.objects.filter(account_type__code='RE')
+        expense_accounts = Account.objects.filter(account_type__code='EX')
+        
+        # Calculate revenue and expenses for the period
+        revenue = calculate_account_balances(revenue_accounts, to_date, from_date, backend, exclude_closing=True)
+        expenses = calculate_account_balances(expense_accounts, to_date, from_date, backend, exclude_closing=True)
+        total_field = 'balance'
     
     # Calculate totals
-    total_revenue = sum(account['balance'] for account in revenue)
-    total_expenses = sum(account['balance'] for account in expenses)
+    total_revenue = sum(account[total_field] for account in revenue)
+    total_expenses = sum(account[total_field] for account in expenses)
     net_income = total_revenue - total_expenses
     
     return {
@@ -117,38 +302,29 @@ def generate_trial_balance(parameters):
     Generate a trial balance report
     """
     as_of_date = parameters.get('as_of_date', datetime.now().strftime('%Y-%m-%d'))
+    backend = parameters.get('backend')
     
     # Get all accounts
     accounts = Account.objects.filter(is_active=True)
+    if parameters.get('account_ids') is not None:
+        # Restricted to one account range when generated in partitions
+        accounts = accounts.filter(id__in=parameters['account_ids'])
     
     # Calculate balances for each account
     account_balances = []
     total_debits = 0
     total_credits = 0
     
-    for account in accounts:
-        debit_sum = JournalLine.objects.filter(
-            account=account, 
-            entry__date__lte=as_of_date,
-            entry__status='posted'
-        ).aggregate(Sum('debit'))['debit__sum'] or 0
-        
-        credit_sum = JournalLine.objects.filter(
-            account=account, 
-            entry__date__lte=as_of_date,
-            entry__status='posted'
-        ).aggregate(Sum('credit'))['credit__sum'] or 0
+    for row in compute_balances(accounts, as_of_date, backend=backend):
+        account = row['account']
         
-        balance = debit_sum - credit_sum
-        
-        if account.account_type.code in ['LI', 'EQ', 'RE']:
-            # Reverse the sign for liability, equity and revenue accounts
-            balance = -balance
+        # Each account appears on the side of its net balance
+        balance = row['closing_balance']
         
         account_balances.append({
             'account_code': account.code,
             'account_name': account.name,
-            'account_type': account.account_type.name,
+            'account_type': account.type_name,
             'debit': max(balance, 0),
             'credit': max(-balance, 0)
         })
@@ -171,9 +347,52 @@ def generate_general_ledger(parameters):
     """
     from_date = parameters.get('from_date')
     to_date = parameters.get('to_date', datetime.now().strftime('%Y-%m-%d'))
+    
+    ledger = {}
+    for row in iter_general_ledger(parameters):
+        if row['row_type'] == 'opening':
+            account = ledger[row['account_code']] = {
+                'account_code': row['account_code'],
+                'account_name': row['account_name'],
+                'account_type': row['account_type'],
+                'opening_balance': row['balance'],
+                'transactions': [],
+            }
+        elif row['row_type'] == 'line':
+            account['transactions'].append({
+                'date': row['date'],
+                'entry_number': row['entry_number'],
+                'description': row['description'],
+                'reference': row['reference'],
+                'debit': row['debit'],
+                'credit': row['credit'],
+                'balance': row['balance']
+            })
+        else:
+            account['ending_balance'] = row['balance']
+    
+    return {
+        'from_date': from_date,
+        'to_date': to_date,
+        'ledger': ledger
+    }
+
+
+def iter_general_ledger(parameters, chunk_size=GENERAL_LEDGER_CHUNK_SIZE):
+    """
+    Stream the general ledger as flat rows: an opening row, one row per
+    posted line and a closing row for each account.
+    
+    Lines are read in chunks (through a server-side cursor on PostgreSQL)
+    together with their entry, and running balances are computed by the
+    database with a window function, so memory use does not grow with the
+    number of lines.
+    """
+    from_date = parameters.get('from_date')
+    to_date = parameters.get('to_date', datetime.now().strftime('%Y-%m-%d'))
     account_id = parameters.get('account_id')
     
-    query = Q(entry__status='posted')
+    query = Q(entry__status__in=POSTED_STATUSES)
     
     if from_date:
         query &= Q(entry__date__gte=from_date)
@@ -182,118 +401,83 @@ def generate_general_ledger(parameters):
         query &= Q(entry__date__lte=to_date)
     
     if account_id:
-        query &= Q(account_id=account_id)
         accounts = Account.objects.filter(id=account_id)
     else:
         accounts = Account.objects.filter(is_active=True)
     
-    ledger = {}
-    for account in accounts:
-        # Get opening balance
-        opening_debit = JournalLine.objects.filter(
-            account=account,
-            entry__date__lt=from_date if from_date else '1900-01-01',
-            entry__status='posted'
-        ).aggregate(Sum('debit'))['debit__sum'] or 0
-        
-        opening_credit = JournalLine.objects.filter(
-            account=account,
-            entry__date__lt=from_date if from_date else '1900-01-01',
-            entry__status='posted'
-        ).aggregate(Sum('credit'))['credit__sum'] or 0
-        
-        opening_balance = opening_debit - opening_credit
-        
-        # Get transactions for the period
-        lines = JournalLine.objects.filter(query, account=account).order_by('entry__date', 'entry__id')
-        
-        transactions = []
-        balance = opening_balance
-        
-        for line in lines:
-            balance += line.debit - line.credit
-            transactions.append({
-                'date': line.entry.date.strftime('%Y-%m-%d'),
-                'entry_number': line.entry.entry_number,
-                'description': line.entry.description,
-                'reference': line.reference,
-                'debit': line.debit,
-                'credit': line.credit,
-                'balance': balance
-            })
-        
-        ledger[account.code] = {
+    if parameters.get('account_ids') is not None:
+        # Restricted to one account range when generated in partitions
+        accounts = accounts.filter(id__in=parameters['account_ids'])
+    
+    balances = compute_balances(accounts, to_date, from_date, parameters.get('backend'))
+    
+    lines = (
+        JournalLine.objects.filter(query, account__in=accounts)
+        .annotate(running_balance=Window(
+            Sum(F('debit') - F('credit')),
+            partition_by=[F('account_id')],
+            order_by=[F('entry__date').asc(), F('entry_id').asc(), F('id').asc()],
+            frame=RowRange(start=None, end=0),
+        ))
+        .order_by('account__code', 'entry__date', 'entry_id', 'id')
+        .values(
+            'account_id', 'entry__date', 'entry__entry_number', 'entry__description',
+            'reference', 'debit', 'credit', 'running_balance'
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    line = next(lines, None)
+    
+    for row in balances:
+        account = row['account']
+        opening_balance = row['opening_balance']
+        header = {
             'account_code': account.code,
             'account_name': account.name,
-            'account_type': account.account_type.name,
-            'opening_balance': opening_balance,
-            'transactions': transactions,
-            'ending_balance': balance
+            'account_type': account.type_name,
         }
-    
-    return {
-        'from_date': from_date,
-        'to_date': to_date,
-        'ledger': ledger
-    }
+        
+        yield {'row_type': 'opening', **header, 'date': from_date, 'balance': opening_balance}
+        
+        while line is not None and line['account_id'] == account.id:
+            yield {
+                'row_type': 'line',
+                **header,
+                'date': line['entry__date'].strftime('%Y-%m-%d'),
+                'entry_number': line['entry__entry_number'],
+                'description': line['entry__description'],
+                'reference': line['reference'],
+                'debit': line['debit'],
+                'credit': line['credit'],
+                'balance': opening_balance + line['running_balance']
+            }
+            line = next(lines, None)
+        
+        yield {'row_type': 'closing', **header, 'date': to_date, 'balance': row['closing_balance']}
 
 
 def generate_cash_flow(parameters):
     """
-    Generate a cash flow statement
+    Generate a cash flow statement (direct method). Cash movements are
+    classified by the counter-accounts of each entry that touches cash.
     """
     from_date = parameters.get('from_date')
     to_date = parameters.get('to_date', datetime.now().strftime('%Y-%m-%d'))
-    
-    # This is a simplified cash flow calculation
-    # A real implementation would require more detailed categorization
-    
-    # Get cash accounts
-    cash_accounts = Account.objects.filter(code__startswith='101')  # Assuming 101 is cash
-    
-    # Calculate operating activities
-    operating_activities = []
-    operating_total = 0
-    
-    # Calculate investing activities
-    investing_activities = []
-    investing_total = 0
-    
-    # Calculate financing activities
-    financing_activities = []
-    financing_total = 0
-    
-    # Calculate beginning cash balance
-    beginning_cash = 0
-    for account in cash_accounts:
-        debit_sum = JournalLine.objects.filter(
-            account=account, 
-            entry__date__lt=from_date if from_date else '1900-01-01',
-            entry__status='posted'
-        ).aggregate(Sum('debit'))['debit__sum'] or 0
-        
-        credit_sum = JournalLine.objects.filter(
-            account=account, 
-            entry__date__lt=from_date if from_date else '1900-01-01',
-            entry__status='posted'
-        ).aggregate(Sum('credit'))['credit__sum'] or 0
-        
-        beginning_cash += debit_sum - credit_sum
-    
-    # Calculate ending cash balance
-    ending_cash = beginning_cash + operating_total + investing_total + financing_total
+    result = compute_cash_flow(from_date, to_date, parameters.get('backend'))
+    reconciliation = result['reconciliation']
     
     return {
         'from_date': from_date,
         'to_date': to_date,
-        'operating_activities': operating_activities,
-        'operating_total': operating_total,
-        'investing_activities': investing_activities,
-        'investing_total': investing_total,
-        'financing_activities': financing_activities,
-        'financing_total': financing_total,
-        'beginning_cash': beginning_cash,
-        'ending_cash': ending_cash,
+        'operating_activities': result['sections']['operating'],
+        'operating_total': result['totals']['operating'],
+        'investing_activities': result['sections']['investing'],
+        'investing_total': result['totals']['investing'],
+        'financing_activities': result['sections']['financing'],
+        'financing_total': result['totals']['financing'],
+        'beginning_cash': reconciliation['beginning_cash'],
+        'ending_cash': reconciliation['ending_cash'],
+        'reconciliation': reconciliation,
     }
 
 
@@ -313,36 +497,25 @@ def generate_custom_report(configuration, parameters):
     }
 
 
-def calculate_account_balances(accounts, as_of_date, from_date=None):
+def generate_aging(side, parameters):
+    """
+    Generate an AR or AP aging report, summarized per customer or vendor or,
+    with mode=detail, listing each open invoice
+    """
+    as_of_date = parameters.get('as_of_date', datetime.now().strftime('%Y-%m-%d'))
+    return compute_aging(side, as_of_date, parameters.get('mode') == 'detail', parameters.get('party'))
+
+
+def calculate_account_balances(accounts, as_of_date, from_date=None, backend=None, exclude_closing=False):
     """
     Helper function to calculate balances for a list of accounts
     """
-    results = []
-    
-    for account in accounts:
-        query = Q(account=account, entry__status='posted')
-        
-        if as_of_date:
-            query &= Q(entry__date__lte=as_of_date)
-            
-        if from_date:
-            query &= Q(entry__date__gte=from_date)
-            
-        debit_sum = JournalLine.objects.filter(query).aggregate(Sum('debit'))['debit__sum'] or 0
-        credit_sum = JournalLine.objects.filter(query).aggregate(Sum('credit'))['credit__sum'] or 0
-        
-        # For asset and expense accounts, debit increases the balance
-        # For liability, equity, and revenue accounts, credit increases the balance
-        if account.account_type.code in ['AS', 'EX']:
-            balance = debit_sum - credit_sum
-        else:
-            balance = credit_sum - debit_sum
-            
-        results.append({
-            'id': account.id,
-            'code': account.code,
-            'name': account.name,
-            'balance': balance
-        })
-        
-    return results
\ No newline at end of file
+    return [
+        {
+            'id': row['account'].id,
+            'code': row['account'].code,
+            'name': row['account'].name,
+            'balance': row['balance']
+        }
+        for row in compute_balances(accounts, as_of_date, from_date, backend, exclude_closing)
+    ]
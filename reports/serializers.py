@@ -36,4 +36,18 @@ class SavedReportSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         # Set created_by to current user
         validated_data['created_by'] = self.context['request'].user
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+
+class SavedReportListSerializer(serializers.ModelSerializer):
+    """Report metadata without results, for list responses"""
+    created_by_display = serializers.StringRelatedField(source='created_by', read_only=True)
+    template_name = serializers.StringRelatedField(source='template', read_only=True)
+    
+    class Meta:
+        model = SavedReport
+        fields = [
+            'id', 'template', 'template_name', 'name', 'parameters',
+            'status', 'error_message', 'created_by', 'created_by_display', 'created_at'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,184 @@
+import json
+import math
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import SavedReportChunk
+
+SECTION_SEPARATOR = '/'
+
+
+def compress_rows(rows):
+    """
+    Encode a list of rows as compressed JSON
+    """
+    return zlib.compress(json.dumps(rows, cls=DjangoJSONEncoder).encode('utf-8'))
+
+
+def decompress_rows(data):
+    """
+    Decode rows stored by compress_rows
+    """
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def row_count(value):
+    """
+    Number of rows a value holds: the items of its lists, however deeply nested
+    """
+    if isinstance(value, list):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(row_count(item) for item in value.values())
+    return 0
+
+
+def is_keyed(value, path):
+    """
+    Whether a value is a collection of records keyed by name, such as the
+    general ledger's accounts keyed by code
+    """
+    return bool(path) and isinstance(value, dict) and bool(value) and all(
+        isinstance(item, dict) for item in value.values()
+    )
+
+
+def split_result(result, size, path=()):
+    """
+    Returns (summary, sections) for a report result; sections are
+    (section, pages) with at most about size rows per page.
+
+    Every list longer than one page is moved out of the summary into a
+    section of list pages. A keyed collection of records whose remaining
+    rows still exceed one page is moved out as a whole, packed by record
+    into pages of up to size rows, so many small records cannot add up to
+    one huge summary. Each is replaced with a stub that records where to
+    find it; keyed stubs index the page of every record.
+    """
+    sections = []
+
+    if isinstance(result, dict):
+        summary = {}
+        for key, value in result.items():
+            summary[key], nested = split_result(value, size, path + (str(key),))
+            sections.extend(nested)
+        if is_keyed(summary, path) and row_count(summary) > size:
+            section = SECTION_SEPARATOR.join(path)
+            pages = [{}]
+            rows = 0
+            index = {}
+            for key, record in summary.items():
+                record_rows = max(row_count(record), 1)
+                if pages[-1] and rows + record_rows > size:
+                    pages.append({})
+                    rows = 0
+                pages[-1][key] = record
+                rows += record_rows
+                index[key] = len(pages)
+            sections.append((section, pages))
+            return {
+                'chunked': True,
+                'keyed': True,
+                'section': section,
+                'count': len(summary),
+                'pages': len(pages),
+                'index': index,
+            }, sections
+        return summary, sections
+
+    if isinstance(result, list) and len(result) > size:
+        section = SECTION_SEPARATOR.join(path)
+        sections.append((section, [result[index:index + size] for index in range(0, len(result), size)]))
+        return {
+            'chunked': True,
+            'section': section,
+            'count': len(result),
+            'pages': math.ceil(len(result) / size),
+        }, sections
+
+    return result, sections
+
+
+def save_result(report, result):
+    """
+    Store a generated result on a report: the summary in result_data and
+    large sections as compressed chunks, replacing any previous result
+    """
+    summary, sections = split_result(result, settings.REPORT_CHUNK_ROWS)
+
+    chunks = [
+        SavedReportChunk(
+            report=report,
+            section=section,
+            page=number,
+            row_count=row_count(rows),
+            data=compress_rows(rows),
+        )
+        for section, pages in sections
+        for number, rows in enumerate(pages, start=1)
+    ]
+
+    with transaction.atomic():
+        report.chunks.all().delete()
+        SavedReportChunk.objects.bulk_create(chunks, batch_size=100)
+        report.result_data = summary
+        report.status = 'completed'
+        report.error_message = ''
+        report.save(update_fields=['result_data', 'status', 'error_message'])
+
+
+def clear_result(report):
+    """
+    Reset a report before it is generated again
+    """
+    with transaction.atomic():
+        report.chunks.all().delete()
+        report.result_data = {}
+        report.status = 'generating'
+        report.error_message = ''
+        report.save(update_fields=['result_data', 'status', 'error_message'])
+
+
+def read_section(report, section, page=1):
+    """
+    Return one page of a report section, whether it is stored inline in the
+    summary or as chunks. A path through a keyed section loads only the
+    chunk holding the record. Returns None if the section does not exist.
+    """
+    value = report.result_data
+    for key in filter(None, section.split(SECTION_SEPARATOR)):
+        if isinstance(value, dict) and value.get('keyed'):
+            if key not in value['index']:
+                return None
+            chunk = report.chunks.filter(section=value['section'], page=value['index'][key]).first()
+            value = decompress_rows(chunk.data).get(key) if chunk else None
+            continue
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+
+    size = settings.REPORT_CHUNK_ROWS
+
+    if isinstance(value, dict) and value.get('chunked'):
+        chunk = report.chunks.filter(section=value['section'], page=page).first()
+        return {
+            'section': section,
+            'page': page,
+            'pages': value['pages'],
+            'count': value['count'],
+            'results': decompress_rows(chunk.data) if chunk else ({} if value.get('keyed') else []),
+        }
+
+    if isinstance(value, list):
+        return {
+            'section': section,
+            'page': page,
+            'pages': max(math.ceil(len(value) / size), 1),
+            'count': len(value),
+            'results': value[(page - 1) * size:page * size],
+        }
+
+    return {'section': section, 'results': value}
@@ -0,0 +1,32 @@
+from celery import shared_task
+
+# Registers the report generation tasks with workers that autodiscover this module
+from .report_generators import (  # noqa: F401
+    generate_report,
+    generate_report_partition,
+    mark_report_failed,
+    merge_report_partitions,
+)
+
+
+@shared_task
+def fail_stale_reports():
+    """
+    Fail reports left waiting on a lost generation; run periodically by celery beat
+    """
+    from .coalescing import fail_stale_reports
+
+    return fail_stale_reports()
+
+
+@shared_task
+def refresh_columnar_ledger(rebuild=False):
+    """
+    Bring the persisted columnar ledger up to date with the posted lines
+    """
+    from .columnar import ColumnarLedger
+
+    ledger = ColumnarLedger.load()
+    ledger = ledger.rebuild() if rebuild else ledger.refresh(verify=True)
+    ledger.save()
+    return {'generation': ledger.generation, 'lines': len(ledger.columns['line_ids'])}
@@ -0,0 +1,190 @@
+"""
+Parity of the columnar backend with the ORM path of account_totals
+"""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import User
+from django.db.models import F
+
+from coa.models import Account, AccountType
+from journal.models import JournalEntry, JournalLine
+from journal.periods import close_year
+from journal.posting import post_entries, unpost_entries
+from journal.serializers import JournalEntrySerializer
+from reports import columnar
+from reports.balances import account_totals
+from reports.columnar import ColumnarLedger
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+# as_of_date, from_date pairs that start and end inside periods, on period
+# edges, and across the opening balances of a closed year
+RANGES = [
+    ('2024-12-31', None),
+    ('2024-03-15', None),
+    ('2024-03-31', '2024-02-01'),
+    ('2024-06-17', '2024-02-11'),
+    ('2025-06-30', None),
+    ('2025-06-30', '2024-11-20'),
+    ('2025-02-14', '2025-01-01'),
+]
+
+
+@pytest.fixture(autouse=True)
+def columnar_path(settings, tmp_path):
+    settings.COLUMNAR_LEDGER_PATH = str(tmp_path)
+    columnar._ledger = None
+    yield
+    columnar._ledger = None
+
+
+@pytest.fixture
+def user():
+    return User.objects.create(username='accountant')
+
+
+@pytest.fixture
+def accounts():
+    types = {
+        code: AccountType.objects.create(code=code, name=name)
+        for code, name in [('AS', 'Asset'), ('LI', 'Liability'), ('EQ', 'Equity'), ('RE', 'Revenue'), ('EX', 'Expense')]
+    }
+    return {
+        code: Account.objects.create(code=code, name=code, account_type=types[type_code])
+        for code, type_code in [
+            ('1010', 'AS'), ('1020', 'AS'), ('2100', 'LI'), ('3200', 'EQ'), ('4100', 'RE'), ('5100', 'EX')
+        ]
+    }
+
+
+def create_entry(user, accounts, entry_date, lines, post=True):
+    entry = JournalEntry.objects.create(date=entry_date, description='test', created_by=user)
+    for code, debit, credit in lines:
+        JournalLine.objects.create(entry=entry, account=accounts[code], debit=Decimal(debit), credit=Decimal(credit))
+    if post:
+        post_entries([entry.id], user)
+        entry.refresh_from_db()
+    return entry
+
+
+def nonzero(totals):
+    return {account_id: sums for account_id, sums in totals.items() if any(sums.values())}
+
+
+def assert_parity():
+    for as_of_date, from_date in RANGES:
+        expected = nonzero(account_totals(Account.objects.all(), as_of_date, from_date))
+        actual = nonzero(account_totals(Account.objects.all(), as_of_date, from_date, backend='columnar'))
+        assert actual == expected, (as_of_date, from_date)
+
+
+def test_amounts_that_are_not_whole_cents_in_floating_point(user, accounts):
+    amounts = ['0.29', '0.57', '1.13', '2.01', '4.35', '0.07']
+    for day, amount in enumerate(amounts, start=1):
+        create_entry(user, accounts, date(2024, 3, day), [('1010', amount, '0'), ('4100', '0', amount)])
+
+    assert_parity()
+    cash = account_totals(Account.objects.all(), '2024-12-31', backend='columnar')[accounts['1010'].id]
+    assert cash['period_debit'] == Decimal('8.42')
+
+
+def test_refresh_appends_new_lines(user, accounts):
+    create_entry(user, accounts, date(2024, 1, 5), [('1010', '100.00', '0'), ('3200', '0', '100.00')])
+    assert_parity()
+
+    create_entry(user, accounts, date(2024, 2, 12), [('5100', '12.34', '0'), ('1010', '0', '12.34')])
+    assert_parity()
+
+
+def test_line_moved_to_another_account(user, accounts):
+    entry = create_entry(user, accounts, date(2024, 2, 3), [('1010', '10.00', '0'), ('4100', '0', '10.00')])
+    assert_parity()
+
+    lines = [
+        {'id': line.id, 'account': line.account_id, 'debit': line.debit, 'credit': line.credit}
+        for line in entry.lines.order_by('id')
+    ]
+    lines[0]['account'] = accounts['1020'].id
+    serializer = JournalEntrySerializer(entry, data={'date': entry.date, 'description': 'moved', 'lines': lines})
+    assert serializer.is_valid(), serializer.errors
+    serializer.save()
+
+    assert_parity()
+    totals = account_totals(Account.objects.all(), '2024-12-31', backend='columnar')
+    assert totals[accounts['1020'].id]['period_debit'] == Decimal('10.00')
+
+
+def test_entry_moved_to_another_date(user, accounts):
+    entry = create_entry(user, accounts, date(2024, 2, 3), [('1010', '25.00', '0'), ('4100', '0', '25.00')])
+    assert_parity()
+
+    lines = [
+        {'id': line.id, 'account': line.account_id, 'debit': line.debit, 'credit': line.credit}
+        for line in entry.lines.order_by('id')
+    ]
+    serializer = JournalEntrySerializer(entry, data={'date': '2024-06-20', 'description': 'moved', 'lines': lines})
+    assert serializer.is_valid(), serializer.errors
+    serializer.save()
+
+    assert_parity()
+
+
+def test_unposting(user, accounts):
+    create_entry(user, accounts, date(2024, 1, 5), [('1010', '100.00', '0'), ('3200', '0', '100.00')])
+    entry = create_entry(user, accounts, date(2024, 3, 9), [('5100', '40.00', '0'), ('1010', '0', '40.00')])
+    assert_parity()
+
+    unpost_entries([entry.id], user)
+    assert_parity()
+
+
+def test_ranges_spanning_opening_balances(user, accounts):
+    create_entry(user, accounts, date(2024, 1, 5), [('1010', '100.00', '0'), ('3200', '0', '100.00')])
+    create_entry(user, accounts, date(2024, 11, 25), [('1010', '8.42', '0'), ('4100', '0', '8.42')])
+    create_entry(user, accounts, date(2024, 12, 10), [('5100', '3.15', '0'), ('2100', '0', '3.15')])
+    close_year(2024, user, retained_earnings=accounts['3200'])
+    create_entry(user, accounts, date(2025, 2, 14), [('1010', '0.29', '0'), ('4100', '0', '0.29')])
+
+    assert_parity()
+
+
+def test_rebuild_and_persisted_generation_match(user, accounts):
+    create_entry(user, accounts, date(2024, 4, 1), [('1020', '0.57', '0'), ('4100', '0', '0.57')])
+    ledger = ColumnarLedger().rebuild().save()
+
+    loaded = ColumnarLedger.load()
+    assert loaded.checksum == ledger.checksum == ledger._database_checksum()
+    assert loaded.account_totals([accounts['1020'].id]) == ledger.account_totals([accounts['1020'].id])
+
+
+
+def test_refresh_merges_changed_entries_into_sorted_columns(user, accounts):
+    create_entry(user, accounts, date(2024, 1, 5), [('1010', '100.00', '0'), ('3200', '0', '100.00')])
+    draft = create_entry(user, accounts, date(2024, 3, 9), [('5100', '40.00', '0'), ('1010', '0', '40.00')], post=False)
+    ledger = ColumnarLedger().rebuild()
+    columns = {name: values.copy() for name, values in ledger.columns.items()}
+
+    # An older draft posted after newer lines were loaded
+    create_entry(user, accounts, date(2024, 2, 1), [('1020', '7.00', '0'), ('4100', '0', '7.00')])
+    post_entries([draft.id], user)
+    refreshed = ledger.refresh()
+
+    assert refreshed is not ledger
+    for name, values in ColumnarLedger().rebuild().columns.items():
+        assert refreshed.columns[name].tolist() == values.tolist(), name
+        assert ledger.columns[name].tolist() == columns[name].tolist(), name
+    assert refreshed.checksum is None
+
+
+def test_verified_refresh_rebuilds_after_unlogged_changes(user, accounts):
+    entry = create_entry(user, accounts, date(2024, 1, 5), [('1010', '100.00', '0'), ('3200', '0', '100.00')])
+    ledger = ColumnarLedger().rebuild()
+    JournalLine.objects.filter(entry=entry).update(debit=F('debit') * 2, credit=F('credit') * 2)
+
+    assert ledger.refresh().checksum is None
+    verified = ledger.refresh(verify=True)
+    assert verified.checksum == ledger._database_checksum()
+    cash = verified.account_totals([accounts['1010'].id])[accounts['1010'].id]
+    assert cash['period_debit'] == Decimal('200.00')
@@ -0,0 +1,70 @@
+"""
+Chunked storage of large report results
+"""
+import pytest
+
+from reports.models import ReportTemplate, SavedReport
+from reports.storage import read_section, row_count, save_result
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def report():
+    template = ReportTemplate.objects.create(name='GL', report_type='general_ledger')
+    return SavedReport.objects.create(template=template, name='GL')
+
+
+def general_ledger(sizes):
+    return {
+        'from_date': '2024-01-01',
+        'ledger': {
+            code: {
+                'account_code': code,
+                'opening_balance': '0.00',
+                'transactions': [{'entry_number': f'{code}-{number}'} for number in range(size)],
+            }
+            for code, size in sizes.items()
+        },
+    }
+
+
+def test_many_small_accounts_are_paged_by_account(settings, report):
+    settings.REPORT_CHUNK_ROWS = 10
+    sizes = {f'{1000 + number}': 4 for number in range(30)}
+    save_result(report, general_ledger(sizes))
+    report.refresh_from_db()
+
+    stub = report.result_data['ledger']
+    assert stub['keyed'] and stub['count'] == 30
+    assert row_count(report.result_data) == 0
+    assert all(chunk.row_count <= 10 for chunk in report.chunks.all())
+
+    page = read_section(report, 'ledger', 2)
+    assert page['pages'] == stub['pages'] == 15
+    assert list(page['results']) == ['1002', '1003']
+
+    transactions = read_section(report, 'ledger/1017/transactions')
+    assert [row['entry_number'] for row in transactions['results']] == [f'1017-{number}' for number in range(4)]
+
+
+def test_large_account_pages_address_stored_chunks(settings, report):
+    settings.REPORT_CHUNK_ROWS = 10
+    save_result(report, general_ledger({'1010': 25, '1020': 3, '1030': 9}))
+    report.refresh_from_db()
+
+    page = read_section(report, 'ledger/1010/transactions', 3)
+    assert page['pages'] == 3 and page['count'] == 25
+    assert [row['entry_number'] for row in page['results']] == [f'1010-{number}' for number in range(20, 25)]
+    assert read_section(report, 'ledger/1030/transactions')['count'] == 9
+    assert read_section(report, 'ledger/9999/transactions') is None
+
+
+def test_small_results_stay_inline(settings, report):
+    settings.REPORT_CHUNK_ROWS = 10
+    result = general_ledger({'1010': 3, '1020': 3})
+    save_result(report, result)
+    report.refresh_from_db()
+
+    assert not report.chunks.exists()
+    assert report.result_data == result
@@ -1,8 +1,19 @@
+from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from .views import ReportTemplateViewSet, SavedReportViewSet
+
+from .views import (
+    GeneralLedgerExportView,
+    ReportTemplateViewSet,
+    SavedReportViewSet,
+    TrialBalanceView,
+)
 
 router = DefaultRouter()
 router.register(r'templates', ReportTemplateViewSet, basename='template')
 router.register(r'saved-reports', SavedReportViewSet, basename='savedreport')
 
-urlpatterns = router.urls
\ No newline at end of file
+urlpatterns = [
+    path('trial-balance/', TrialBalanceView.as_view(), name='trial-balance'),
+    path('general-ledger/export/', GeneralLedgerExportView.as_view(), name='general-ledger-export'),
+    path('', include(router.urls)),
+]
\ No newline at end of file
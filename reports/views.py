@@ -1,13 +1,35 @@
+from django.db import models
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from accounts.permissions import IsAccountant
 
+from .coalescing import ATTACHED, GENERATED, REUSED, coalescing_stats, dispatch_report, fail_report
+from .exports import EXPORT_CONTENT_TYPES, GENERAL_LEDGER_FIELDS, iter_export
 from .models import ReportTemplate, SavedReport
-from .report_generators import generate_report
-from .serializers import ReportTemplateSerializer, SavedReportSerializer
+from .report_generators import (
+    generate_trial_balance,
+    get_cached_report,
+    iter_general_ledger,
+)
+from .serializers import (
+    ReportTemplateSerializer,
+    SavedReportListSerializer,
+    SavedReportSerializer,
+)
+from .storage import read_section
+
+COALESCING_MESSAGES = {
+    GENERATED: 'Report generation started',
+    ATTACHED: 'Attached to an identical report being generated',
+    REUSED: 'Reused an identical completed report',
+}
 
 
 class ReportTemplateViewSet(viewsets.ModelViewSet):
@@ -66,26 +88,150 @@ class SavedReportViewSet(viewsets.ModelViewSet):
             pass
         return SavedReport.objects.filter(created_by=user)
     
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list':
+            # Results can be large; list responses only carry metadata
+            queryset = queryset.defer('result_data')
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return SavedReportListSerializer
+        return SavedReportSerializer
+    
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Return a report. Use section (a path such as ledger/1010/transactions)
+        and page to fetch part of a large result; account is a shorthand for
+        an account's transactions in a general ledger.
+        """
+        section = request.query_params.get('section')
+        account = request.query_params.get('account')
+        if not section and not account:
+            return super().retrieve(request, *args, **kwargs)
+        
+        report = self.get_object()
+        if account:
+            section = f'ledger/{account}/transactions'
+        
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            page = 0
+        if page < 1:
+            return Response({'error': 'page must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = read_section(report, section, page)
+        if data is None:
+            return Response({'error': f"Section '{section}' not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+    
+    def perform_create(self, serializer):
+        report = serializer.save()
+        try:
+            dispatch_report(report)
+        except Exception as e:
+            fail_report(report.id, str(e))
+    
     @action(detail=True, methods=['post'])
     def regenerate(self, request, pk=None):
         """
         Regenerate a report with the same parameters
         """
         report = self.get_object()
-        report.status = 'generating'
-        report.result_data = {}
-        report.error_message = ''
-        report.save()
         
         try:
-            # Generate report asynchronously with Celery
-            generate_report.delay(report.id)
-            return Response({'status': 'Report generation started'})
+            # Generate report asynchronously with Celery, or reuse an identical one
+            outcome = dispatch_report(report)
+            return Response({'status': COALESCING_MESSAGES[outcome], 'outcome': outcome})
         except Exception as e:
-            report.status = 'failed'
-            report.error_message = str(e)
-            report.save()
+            fail_report(report.id, str(e))
             return Response(
                 {'error': 'Failed to start report generation'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+    
+    @action(detail=False, methods=['get'])
+    def coalescing(self, request):
+        """
+        Counts of report requests that started a generation, attached to one
+        in flight or reused a completed result
+        """
+        return Response(coalescing_stats())
+
+
+class TrialBalanceView(APIView):
+    """
+    Returns the trial balance as of a date (as_of_date, default today).
+    Results are cached until the next posting changes the ledger.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        as_of_date = request.query_params.get('as_of_date') or timezone.localdate().strftime('%Y-%m-%d')
+        try:
+            valid = parse_date(as_of_date) is not None
+        except ValueError:
+            valid = False
+        if not valid:
+            return Response(
+                {'error': 'as_of_date must be a valid date in YYYY-MM-DD format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        result = get_cached_report('trial_balance', {'as_of_date': as_of_date}, generate_trial_balance)
+        return Response(result)
+
+
+class GeneralLedgerExportView(APIView):
+    """
+    Streams the general ledger as NDJSON or CSV without building it in memory.
+    Accepts from_date, to_date, account_id and output (ndjson or csv).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_CONTENT_TYPES:
+            return Response(
+                {'error': f"Unsupported output format '{export_format}'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Rows are generated while streaming, after the response status is
+        # sent, so every parameter is checked before the response starts
+        parameters = {}
+        for key in ('from_date', 'to_date'):
+            value = request.query_params.get(key)
+            if not value:
+                continue
+            try:
+                valid = parse_date(value) is not None
+            except ValueError:
+                valid = False
+            if not valid:
+                return Response(
+                    {'error': f'{key} must be a valid date in YYYY-MM-DD format'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            parameters[key] = value
+        
+        account_id = request.query_params.get('account_id')
+        if account_id:
+            try:
+                parameters['account_id'] = int(account_id)
+            except ValueError:
+                return Response(
+                    {'error': 'account_id must be an integer'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        rows = iter_general_ledger(parameters)
+        
+        response = StreamingHttpResponse(
+            iter_export(rows, export_format, GENERAL_LEDGER_FIELDS),
+            content_type=EXPORT_CONTENT_TYPES[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="general-ledger.{export_format}"'
+        return response